@@ -1,34 +1,85 @@
 import httpx  # Use httpx for async requests
-import httpx  # Use httpx for async requests
 import json
 import logging
 import os
 import re # Import regex module
-import zipfile
-import shutil
-from typing import Dict, List, Any
+from typing import Dict, List, Any, AsyncIterator, Callable, Optional
 import asyncio
+import time
+
+from core.archive import build_zip
+from core.cache import ProjectCache, make_cache_key, normalize_text
+from core import gemini
+from core.gemini import get_client, model_url
+from core.resilience import CircuitOpenError, Resilience
+from core.json_stream import FilesArrayParser, extract_files
+from core.logs import SAMPLED
+from core.metrics import observe_stage, record_failure, timed
+from core.usage import record_usage
+from core.workspace import ProjectWorkspace
 
 logger = logging.getLogger(__name__)
 
+# Bump when the code generation prompt changes so cached projects are not reused
+PROMPT_VERSION = "1"
+
+# Progress callback: called with a stage name and stage data (e.g. parsed/total file counts)
+ProgressCallback = Callable[..., None]
+
+# Chunked generation: plan a file manifest first, then generate the files in parallel batches
+DEVBOT_CHUNKED = os.getenv('DEVBOT_CHUNKED', 'false').lower() == 'true'
+DEVBOT_CHUNK_FILES = int(os.getenv('DEVBOT_CHUNK_FILES', '4'))  # Files per batch call
+DEVBOT_CHUNK_CONCURRENCY = int(os.getenv('DEVBOT_CHUNK_CONCURRENCY', '4'))  # Batch calls in flight per project
+# Batch calls in flight across all projects of the process, so chunking cannot multiply the LLM_WORKERS bound
+DEVBOT_CHUNK_CALLS = int(os.getenv('DEVBOT_CHUNK_CALLS', os.getenv('LLM_WORKERS', '4')))
+DEVBOT_CHUNK_ATTEMPTS = int(os.getenv('DEVBOT_CHUNK_ATTEMPTS', '2'))  # Tries per batch before its files are given up
+DEVBOT_MAX_FILES = int(os.getenv('DEVBOT_MAX_FILES', '60'))  # Manifest entries beyond this are dropped
+
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+]
+
+_batch_slots: Optional[asyncio.Semaphore] = None  # Created on first use, inside the running loop
+
+def batch_slots() -> asyncio.Semaphore:
+    """Process-wide permits for chunked batch calls (DEVBOT_CHUNK_CALLS)."""
+    global _batch_slots
+    if _batch_slots is None:
+        _batch_slots = asyncio.Semaphore(max(1, DEVBOT_CHUNK_CALLS))
+    return _batch_slots
+
 class DevBot:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, project_cache: Optional[ProjectCache] = None,
+                 client: Optional[httpx.AsyncClient] = None, resilience: Optional[Resilience] = None):
         self.api_key = api_key
+        # Optional persistent cache of finished projects keyed on (tasks, project type, prompt version)
+        self.project_cache = project_cache
         # Ensure GEMINI_API_KEY is loaded correctly
         gemini_key = os.getenv('GEMINI_API_KEY')
         if not gemini_key:
             logger.error("GEMINI_API_KEY environment variable not set!")
             # Optionally raise an error or handle appropriately
-        # Use gemini-1.5-flash model and v1 API endpoint
-        self.endpoint = f"https://generativelanguage.googleapis.com/v1/models/gemini-1.5-flash:generateContent?key={gemini_key}"
-        self.client = httpx.AsyncClient(timeout=120.0) # Increased timeout
-
-    async def generate_project(self, tasks: List[str], project_type: str) -> Dict[str, Any]:
-        try:
-            logger.info(f"Generating project with type: {project_type}, tasks: {tasks}")
-
-            # Construct the improved code generation prompt asking for JSON
-            code_prompt = f"""
+        # Use gemini-1.5-flash model and v1 API endpoint (base URL overridable, e.g. for a local fake server)
+        self.endpoint = model_url("gemini-1.5-flash", "generateContent", gemini_key)
+        self.stream_endpoint = model_url("gemini-1.5-flash", "streamGenerateContent", gemini_key, alt="sse")
+        # Stream Gemini output and parse files as they arrive unless disabled per call
+        self.stream_by_default = os.getenv('DEVBOT_STREAM', 'false').lower() == 'true'
+        self.chunked_by_default = DEVBOT_CHUNKED
+        self.chunk_files = max(1, DEVBOT_CHUNK_FILES)
+        self.chunk_concurrency = max(1, DEVBOT_CHUNK_CONCURRENCY)
+        self.chunk_attempts = max(1, DEVBOT_CHUNK_ATTEMPTS)
+        # Shared pooled Gemini client (read timeout GEMINI_READ_TIMEOUT) unless one is passed in
+        self._client = client
+        # Retries with backoff and the shared Gemini circuit breaker
+        self.resilience = resilience or gemini.resilience
+
+    def _build_payload(self, tasks: List[str], project_type: str) -> Dict[str, Any]:
+        """Builds the Gemini request payload asking for the project as JSON."""
+        # Construct the improved code generation prompt asking for JSON
+        code_prompt = f"""
 Generate a complete {project_type} project based on the following tasks:
 {chr(10).join(f"- {task}" for task in tasks)}
 
@@ -59,197 +110,440 @@ Ensure the file content is properly escaped for JSON, especially newlines (\\n)
 Include necessary configuration files (like requirements.txt or package.json) if applicable for the project type.
 """
 
-            payload = {
-                "contents": [{"parts": [{"text": code_prompt}]}],
-                # Removed "responseMimeType": "application/json" as it causes errors with some models/versions
-                "generationConfig": {"temperature": 0.5, "topP": 0.9, "maxOutputTokens": 8192},
-                "safetySettings": [
-                    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-                    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-                    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-                    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-                ]
-            }
+        return self._gemini_payload(code_prompt)
+
+    @staticmethod
+    def _gemini_payload(prompt: str, max_output_tokens: int = 8192) -> Dict[str, Any]:
+        return {
+            "contents": [{"parts": [{"text": prompt}]}],
+            # Removed "responseMimeType": "application/json" as it causes errors with some models/versions
+            "generationConfig": {"temperature": 0.5, "topP": 0.9, "maxOutputTokens": max_output_tokens},
+            "safetySettings": SAFETY_SETTINGS
+        }
+
+    def _build_manifest_payload(self, tasks: List[str], project_type: str) -> Dict[str, Any]:
+        """Asks for the list of files the project needs, without their contents."""
+        manifest_prompt = f"""
+Plan the files of a complete {project_type} project based on the following tasks:
+{chr(10).join(f"- {task}" for task in tasks)}
+
+Do not write any code yet. Provide the file manifest as a JSON object containing a list named "files".
+Each item in the "files" list should be an object with two keys:
+1. "name": The full path of the file (e.g., "src/main.py", "index.html", "requirements.txt").
+2. "description": One sentence on what the file contains and which other files it uses.
 
-            headers = {"Content-Type": "application/json"}
-
-            logger.info("Sending request to Gemini API...")
-            try:
-                response = await self.client.post(self.endpoint, headers=headers, json=payload)
-                logger.info(f"Gemini API Response Status Code: {response.status_code}")
-                # Avoid logging potentially large response content directly unless debugging
-                # logger.info(f"Gemini API Response Content: {response.text}")
-
-                response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-
-            except httpx.RequestError as e:
-                error_msg = f"Error connecting to Gemini API: {str(e)}"
-                logger.error(error_msg)
-                return {"success": False, "error": error_msg}
-            except httpx.HTTPStatusError as e:
-                error_msg = f"Gemini API error: {e.response.status_code} - {e.response.text}"
-                logger.error(error_msg)
-                return {"success": False, "error": error_msg}
-
-            logger.info("Gemini API call successful")
-            try:
-                # Extract text from the nested response structure
-                result_json = response.json()
-                raw_generated_text = result_json.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '{}')
-
-                # Clean potential markdown fences before parsing
-                cleaned_json_str = self._clean_json_string(raw_generated_text)
-                logger.info(f"Cleaned JSON string for parsing: {cleaned_json_str[:500]}...") # Log beginning
-
-                generated_data = json.loads(cleaned_json_str)
-
-                if not isinstance(generated_data, dict) or "files" not in generated_data or not isinstance(generated_data["files"], list):
-                    raise ValueError("Invalid JSON structure received from AI after cleaning. Expected {'files': [...]} ")
-
-                files_to_create = generated_data["files"]
-                logger.info(f"Received {len(files_to_create)} files from Gemini API")
-
-            except (KeyError, IndexError, json.JSONDecodeError, ValueError) as e:
-                error_msg = f"Error parsing JSON response from Gemini: {str(e)}. Response text: {response.text[:500]}..." # Log beginning of response
-                logger.error(error_msg)
-                return {"success": False, "error": error_msg}
-            except Exception as e: # Catch unexpected errors during parsing
-                error_msg = f"Unexpected error processing Gemini response: {str(e)}. Response text: {response.text[:500]}..."
-                logger.error(error_msg)
-                return {"success": False, "error": error_msg}
-
-
-            # --- File and Directory Handling ---
-            base_project_dir = os.path.dirname(os.path.dirname(__file__)) # backend/
-            project_dir = os.path.join(base_project_dir, "generated_project")
-            zip_filename = "generated_project.zip"
-            zip_path = os.path.join(base_project_dir, zip_filename)
-            logger.info(f"Project directory: {project_dir}")
-            logger.info(f"Zip file path: {zip_path}")
-
-            try:
-                # Clean up old directory and zip file
-                if os.path.exists(project_dir):
-                    shutil.rmtree(project_dir)
-                    logger.info(f"Removed existing project directory: {project_dir}")
-                if os.path.exists(zip_path):
-                    os.remove(zip_path)
-                    logger.info(f"Removed existing zip file: {zip_path}")
-
-                os.makedirs(project_dir, exist_ok=True) # Create base directory
-                logger.info(f"Ensured project directory exists: {project_dir}")
-
-                files_content_dict = {} # To store path: content
-                created_file_paths_for_zip = [] # Still need this for zipping by relative path
-
-                for file_info in files_to_create:
-                    if not isinstance(file_info, dict) or "name" not in file_info or "content" not in file_info:
-                        logger.warning(f"Skipping invalid file entry in JSON: {file_info}")
-                        continue
-
-                    file_name = file_info["name"]
-                    file_content = file_info["content"]
-                    # Sanitize file path to prevent directory traversal
-                    # Normalize path separators and remove leading slashes
-                    sanitized_name = os.path.normpath(file_name.lstrip('/\\'))
-                    # Ensure the path stays within the project directory
-                    file_path = os.path.abspath(os.path.join(project_dir, sanitized_name))
-                    if not file_path.startswith(os.path.abspath(project_dir)):
-                         logger.warning(f"Skipping potentially unsafe file path: {file_name}")
-                         continue
-
-                    # Create subdirectories if they don't exist
-                    file_dir = os.path.dirname(file_path)
-                    if not os.path.exists(file_dir):
-                        os.makedirs(file_dir)
-                        logger.info(f"Created subdirectory: {file_dir}")
-
-                    # Write file content
-                    try:
-                        with open(file_path, "w", encoding="utf-8") as f:
-                            f.write(file_content)
-                        logger.info(f"Created file: {file_path}")
-                        files_content_dict[sanitized_name] = file_content # Store content for push
-                        created_file_paths_for_zip.append(sanitized_name) # Store relative path for zip
-                    except OSError as e:
-                        logger.error(f"Failed to write file {file_path}: {e}")
-                        # Decide if one file error should stop the whole process or just be skipped
-                        # For now, let's skip and log
-                        continue
-                    except Exception as e: # Catch other potential writing errors
-                        logger.error(f"Unexpected error writing file {file_path}: {e}")
-                        continue
-
-
-                # --- Zipping ---
-                if not created_file_paths_for_zip: # Check against paths for zip
-                     logger.warning("No valid files were generated by the AI to zip.")
-                     # If no files to zip, it might still be okay if files_content_dict has data for push
-                     # However, if files_content_dict is also empty, then it's a true failure.
-                     if not files_content_dict:
-                        logger.error("AI did not generate any valid files for zipping or pushing.")
-                        return {"success": False, "error": "AI did not generate any valid files."}
-                     # If there's content to push but nothing to zip (e.g. only one file at root), proceed
-                     # but log that zip will be empty or not created if that's the case.
-                     # For now, let's assume if created_file_paths_for_zip is empty, we might not want to create an empty zip.
-                     # This logic might need refinement based on desired behavior for "no files".
-                     # If we must return a zip, we might create an empty one or one with a placeholder.
-                     # For now, if no files to zip, we might skip zipping or return an error if zip is mandatory.
-                     # Let's assume for now that if created_file_paths_for_zip is empty, we still proceed if files_content_dict is not.
-
-                if created_file_paths_for_zip: # Only create zip if there are files
-                    logger.info(f"Creating ZIP file: {zip_path}")
-                    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-                        for file_rel_path in created_file_paths_for_zip:
-                             file_abs_path = os.path.join(project_dir, file_rel_path)
-                             # Add file to zip using its relative path within generated_project
-                             zipf.write(file_abs_path, file_rel_path)
-                             logger.info(f"Added to zip: {file_rel_path}")
-                    logger.info(f"Successfully created ZIP file: {zip_path}")
-                else:
-                    logger.warning("No files to zip. Zip file will not be created or will be empty.")
-                    # zip_path might not exist or be empty, handle accordingly in return if zip is always expected
-
-            except OSError as e:
-                error_msg = f"File/Directory operation failed: {str(e)}"
-                logger.error(error_msg)
-                return {"success": False, "error": error_msg}
-            except zipfile.BadZipFile as e:
-                 error_msg = f"Error creating ZIP file: {str(e)}"
-                 logger.error(error_msg)
-                 return {"success": False, "error": error_msg}
-            except Exception as e: # Catch unexpected errors during file ops/zipping
-                error_msg = f"Unexpected error during file operations or zipping: {str(e)}"
-                logger.error(error_msg, exc_info=True)
-                return {"success": False, "error": error_msg}
-
-            return {
+Include necessary configuration files (like requirements.txt or package.json) if applicable for the project type.
+List at most {DEVBOT_MAX_FILES} files.
+"""
+        return self._gemini_payload(manifest_prompt, max_output_tokens=4096)
+
+    def _build_batch_payload(self, tasks: List[str], project_type: str, manifest: List[Dict[str, str]],
+                             batch: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Asks for the contents of the files in `batch`, with the whole manifest as context."""
+        batch_prompt = f"""
+You are generating a complete {project_type} project based on the following tasks:
+{chr(10).join(f"- {task}" for task in tasks)}
+
+The project consists of these files:
+{chr(10).join(f"- {entry['name']}: {entry['description']}" for entry in manifest)}
+
+Other files are generated separately, so keep imports, names and interfaces consistent with the list above.
+Please provide the output as a JSON object containing a list named "files".
+Each item in the "files" list should be an object with two keys:
+1. "name": The full path of the file, exactly as listed.
+2. "content": The complete code/text content for that file.
+
+Ensure the file content is properly escaped for JSON, especially newlines (\\n) and quotes (\\").
+
+Generate ONLY these files:
+{chr(10).join(f"- {entry['name']}" for entry in batch)}
+"""
+        return self._gemini_payload(batch_prompt)
+
+    @staticmethod
+    def project_cache_key(tasks: List[str], project_type: str) -> str:
+        """Cache key for a project: normalized task list, project type and prompt version."""
+        # Goal numbering ("1. ...") differs between requests for the same goals
+        normalized_tasks = [normalize_text(re.sub(r"^\s*\d+[.)]\s*", "", task)) for task in tasks]
+        return make_cache_key("project", normalized_tasks, normalize_text(project_type), PROMPT_VERSION)
+
+    def generation_key(self, tasks: List[str], project_type: str, **options: Any) -> str:
+        """Single-flight key for generate_project: concurrent requests for the same project share one generation."""
+        return self.project_cache_key(tasks, project_type)
+
+    async def get_cached_project(self, tasks: List[str], project_type: str,
+                                 progress: Optional[ProgressCallback] = None) -> Optional[Dict[str, Any]]:
+        """Returns a generate_project result from the project cache, or None on a miss."""
+        if self.project_cache is None:
+            return None
+        entry = await self.project_cache.get(self.project_cache_key(tasks, project_type))
+        if entry is None:
+            return None
+
+        logger.info(f"Project cache hit for type: {project_type}")
+        workspace = ProjectWorkspace()
+        for path, content in entry["files"].items():
+            workspace.add_file(path, content)
+        self._report(progress, "cache_hit", total=len(workspace.files))
+        return {
+            "success": True,
+            "cached": True,
+            "workspace_id": workspace.id,
+            "zip_filename": workspace.zip_filename,
+            "files_created": workspace.files,
+            "archive": entry["archive"] # Archive built with the default compression level, if stored
+        }
+
+    async def generate_project(self, tasks: List[str], project_type: str, stream: Optional[bool] = None,
+                               progress: Optional[ProgressCallback] = None, use_cache: bool = True,
+                               chunked: Optional[bool] = None) -> Dict[str, Any]:
+        """Generates the project files for `tasks` into a fresh in-memory workspace.
+
+        With `stream` enabled (default: DEVBOT_STREAM), the streaming endpoint is
+        used and each file is added to the workspace as soon as it is complete.
+        With `chunked` enabled (default: DEVBOT_CHUNKED, takes precedence over
+        streaming), a file manifest is generated first and the files are then
+        generated in parallel batches; see _generate_chunked.
+        `progress`, if given, is called as progress(stage, **data) for the
+        "prompt_sent", "manifest_ready" and "file_parsed" stages. With
+        `use_cache`, a cached project skips the LLM call; complete generations
+        are always cached.
+        """
+        if stream is None:
+            stream = self.stream_by_default
+        if chunked is None:
+            chunked = self.chunked_by_default
+        missing_files: List[str] = []
+        truncated = False  # Gemini's output stopped before the files list was complete
+        try:
+            if use_cache:
+                cached = await self.get_cached_project(tasks, project_type, progress)
+                if cached is not None:
+                    return cached
+
+            logger.info(f"Generating project with type: {project_type}, {len(tasks)} tasks, streaming: {stream}, chunked: {chunked}")
+
+            # Each generation gets its own in-memory workspace so concurrent
+            # requests never overwrite each other's files or archives.
+            workspace = ProjectWorkspace()
+            logger.info(f"Using workspace: {workspace.id}")
+
+            self._report(progress, "prompt_sent", streaming=stream and not chunked)
+            if chunked:
+                result = await self._generate_chunked(tasks, project_type, workspace, progress)
+                if not result.get("success"):
+                    return result
+                missing_files = result["missing_files"]
+                truncated = result.get("truncated", False)
+            elif stream:
+                parser = FilesArrayParser()
+                try:
+                    async for file_info in self.stream_files(tasks, project_type, parser):
+                        stored_path = self._add_file(workspace, file_info)
+                        if stored_path:
+                            # Total is unknown until the stream finishes
+                            self._report(progress, "file_parsed", path=stored_path, parsed=len(workspace.files), total=None)
+                except httpx.RequestError as e:
+                    record_failure("gemini_connection")
+                    error_msg = f"Error connecting to Gemini API: {str(e)}"
+                    logger.error(error_msg)
+                    return {"success": False, "error": error_msg}
+                except httpx.HTTPStatusError as e:
+                    record_failure("gemini_http")
+                    error_msg = f"Gemini API error: {e.response.status_code} - {e.response.text}"
+                    logger.error(error_msg)
+                    return {"success": False, "error": error_msg}
+                except (json.JSONDecodeError, ValueError) as e:
+                    record_failure("json_parse")
+                    error_msg = f"Error parsing streamed response from Gemini: {str(e)}"
+                    logger.error(error_msg)
+                    return {"success": False, "error": error_msg}
+                truncated = not parser.done
+            else:
+                result = await self._request_files(tasks, project_type)
+                if not result.get("success"):
+                    return result
+                truncated = result.get("truncated", False)
+                total = len(result["files"])
+                for file_info in result["files"]:
+                    stored_path = self._add_file(workspace, file_info)
+                    if stored_path:
+                        self._report(progress, "file_parsed", path=stored_path, parsed=len(workspace.files), total=total)
+
+            if not workspace.files:
+                logger.error("AI did not generate any valid files for zipping or pushing.")
+                return {"success": False, "error": "AI did not generate any valid files."}
+
+            # Partial projects (failed chunks, truncated output) are returned but never cached
+            if self.project_cache is not None and not missing_files and not truncated:
+                await self._store_in_cache(tasks, project_type, workspace)
+
+            result = {
                 "success": True,
-                "zip_file": zip_path if os.path.exists(zip_path) else None, # Return None if zip wasn't created
-                "files_created": files_content_dict # Dict of path: content
+                "cached": False,
+                "workspace_id": workspace.id,
+                "zip_filename": workspace.zip_filename,
+                "files_created": workspace.files # Dict of path: content; archived by the caller
             }
-
+            if missing_files:
+                result["missing_files"] = missing_files
+            if truncated:
+                result["truncated"] = True
+            return result
+
+        except CircuitOpenError as e:
+            record_failure("circuit_open")
+            logger.warning(f"Skipping generation: {e}")
+            return {"success": False, "error": str(e), "retry_after": e.retry_after}
         except Exception as e:
             # Catch-all for any unexpected error at the top level
+            record_failure("internal")
             error_msg = f"Critical error in generate_project: {str(e)}"
             logger.error(error_msg, exc_info=True)
             return {"success": False, "error": error_msg}
 
-    def _clean_json_string(self, text: str) -> str:
-        """Removes markdown fences and leading/trailing whitespace from a potential JSON string."""
-        # Regex to find JSON possibly wrapped in ```json ... ``` or ``` ... ```
-        match = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", text, re.DOTALL | re.IGNORECASE)
-        if match:
-            logger.info("Found JSON wrapped in markdown fences, extracting.")
-            return match.group(1).strip()
-        # Fallback for JSON not wrapped in fences but might have surrounding whitespace
-        logger.info("No markdown fences found around JSON, returning stripped text.")
-        return text.strip()
+    async def _generate_chunked(self, tasks: List[str], project_type: str, workspace: ProjectWorkspace,
+                                progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """Generates a file manifest, then the files in parallel batches of DEVBOT_CHUNK_FILES.
+
+        No single response has to hold the whole project, so large projects
+        are not truncated, and wall-clock time follows the slowest batch
+        rather than the total size. At most DEVBOT_CHUNK_CONCURRENCY batches
+        of a project, and DEVBOT_CHUNK_CALLS batches of the whole process,
+        run at once. A failed batch is retried on its own (DEVBOT_CHUNK_ATTEMPTS);
+        if it keeps failing, its files are reported in "missing_files" and the
+        other batches are kept.
+        """
+        manifest_result = await self._request_files_payload(self._build_manifest_payload(tasks, project_type))
+        if not manifest_result.get("success"):
+            return manifest_result
+        if manifest_result.get("truncated", False):
+            logger.warning("The file manifest was truncated; files listed after the cut are not generated")
+        manifest = self._clean_manifest(manifest_result["files"])
+        if not manifest:
+            logger.error("AI did not return a usable file manifest.")
+            return {"success": False, "error": "AI did not return a usable file manifest."}
+
+        total = len(manifest)
+        batches = [manifest[i:i + self.chunk_files] for i in range(0, total, self.chunk_files)]
+        logger.info(f"Manifest has {total} files; generating them in {len(batches)} batches")
+        self._report(progress, "manifest_ready", total=total, batches=len(batches))
+        semaphore = asyncio.Semaphore(self.chunk_concurrency)
+
+        async def run_batch(index: int, batch: List[Dict[str, str]]):
+            payload = self._build_batch_payload(tasks, project_type, manifest, batch)
+            async with semaphore, batch_slots():
+                for attempt in range(1, self.chunk_attempts + 1):
+                    result = await self._request_files_payload(payload)
+                    if result.get("success"):
+                        return batch, result["files"]
+                    logger.warning(f"Batch {index + 1}/{len(batches)} failed (attempt {attempt}/{self.chunk_attempts}): {result.get('error')}")
+            return batch, None
+
+        pending = [asyncio.ensure_future(run_batch(index, batch)) for index, batch in enumerate(batches)]
+        missing_files = []
+        try:
+            for finished in asyncio.as_completed(pending):
+                batch, files = await finished  # CircuitOpenError aborts the remaining batches
+                returned = set()
+                for file_info in files or []:
+                    stored_path = self._add_file(workspace, file_info)
+                    if stored_path:
+                        returned.add(stored_path)
+                        self._report(progress, "file_parsed", path=stored_path, parsed=len(workspace.files), total=total)
+                # Also catches files lost to a truncated batch response
+                missing_files.extend(entry["name"] for entry in batch if entry["name"] not in returned)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if missing_files:
+            logger.warning(f"Chunked generation is missing {len(missing_files)} of {total} files: {missing_files}")
+        return {"success": True, "missing_files": missing_files, "truncated": manifest_result.get("truncated", False)}
+
+    @staticmethod
+    def _clean_manifest(entries: List[Any]) -> List[Dict[str, str]]:
+        """Keeps named, distinct manifest entries (at most DEVBOT_MAX_FILES), with sanitized paths.
+
+        Names are normalized like the workspace stores them (e.g. "./src/x.py"
+        becomes "src/x.py"), so returned files can be matched against them.
+        """
+        manifest = []
+        seen = set()
+        for entry in entries:
+            if not isinstance(entry, dict) or not isinstance(entry.get("name"), str) or not entry["name"].strip():
+                logger.warning(f"Skipping invalid manifest entry: {entry}")
+                continue
+            name = ProjectWorkspace.sanitize_path(entry["name"].strip())
+            if name is None:
+                logger.warning(f"Skipping unsafe manifest path: {entry['name']}")
+                continue
+            if name in seen:
+                continue
+            seen.add(name)
+            manifest.append({"name": name, "description": str(entry.get("description") or "").strip()})
+        if len(manifest) > DEVBOT_MAX_FILES:
+            logger.warning(f"Manifest lists {len(manifest)} files; keeping the first {DEVBOT_MAX_FILES}")
+        return manifest[:DEVBOT_MAX_FILES]
+
+    async def _request_files(self, tasks: List[str], project_type: str) -> Dict[str, Any]:
+        """Requests the whole project in one generateContent call and parses the files list."""
+        return await self._request_files_payload(self._build_payload(tasks, project_type))
+
+    async def _request_files_payload(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Sends one generateContent call and parses the {"files": [...]} object in its answer.
+
+        "truncated" in the result is True when the answer stopped before the
+        files list was complete.
+        """
+        headers = {"Content-Type": "application/json"}
+
+        logger.info("Sending request to Gemini API...")
+        try:
+            with timed("gemini"):
+                response = await self.resilience.call(lambda: self.client.post(self.endpoint, headers=headers, json=payload),
+                                                      deadline=gemini.GEMINI_GENERATION_DEADLINE)
+            logger.info(f"Gemini API Response Status Code: {response.status_code}")
+            # Avoid logging potentially large response content directly unless debugging
+            # logger.info(f"Gemini API Response Content: {response.text}")
+
+            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+
+        except httpx.RequestError as e:
+            record_failure("gemini_connection")
+            error_msg = f"Error connecting to Gemini API: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+        except httpx.HTTPStatusError as e:
+            record_failure("gemini_http")
+            error_msg = f"Gemini API error: {e.response.status_code} - {e.response.text}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+        logger.info("Gemini API call successful")
+        try:
+            # Extract text from the nested response structure
+            result_json = response.json()
+            record_usage(result_json.get('usageMetadata'))
+            raw_generated_text = result_json.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '{}')
+
+            gemini.capture_response("files", raw_generated_text)
+
+            # Handles fences, prose, common JSON defects and truncated output
+            with timed("json_parse"):
+                files_to_create, truncated = extract_files(raw_generated_text)
+            logger.info(f"Received {len(files_to_create)} files from Gemini API")
+
+        except (KeyError, IndexError, json.JSONDecodeError, ValueError) as e:
+            record_failure("json_parse")
+            error_msg = f"Error parsing JSON response from Gemini: {str(e)}. Response text: {response.text[:500]}..." # Log beginning of response
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+        except Exception as e: # Catch unexpected errors during parsing
+            error_msg = f"Unexpected error processing Gemini response: {str(e)}. Response text: {response.text[:500]}..."
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+        return {"success": True, "files": files_to_create, "truncated": truncated}
+
+    async def stream_files(self, tasks: List[str], project_type: str,
+                           parser: Optional[FilesArrayParser] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Streams the project from streamGenerateContent, yielding each file entry once it is complete.
+
+        Raises httpx errors for connection/status failures, after retrying
+        until the response starts. If the stream ends before the files array
+        is closed (e.g. output truncated), the entries already completed are kept
+        and `parser.done` stays False; pass a parser to check it afterwards.
+        """
+        payload = self._build_payload(tasks, project_type)
+        headers = {"Content-Type": "application/json"}
+        parser = parser if parser is not None else FilesArrayParser()
+
+        logger.info("Sending streaming request to Gemini API...")
+        started = time.perf_counter()
+        request = self.client.build_request("POST", self.stream_endpoint, headers=headers, json=payload)
+        response = await self.resilience.open_stream(self.client, request, deadline=gemini.GEMINI_GENERATION_DEADLINE)
+        usage = None
+        try:
+            logger.info(f"Gemini API Response Status Code: {response.status_code}")
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+
+            # Server-sent events: each "data:" line carries a partial GenerateContentResponse
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if not data:
+                    continue
+                chunk = json.loads(data)
+                usage = chunk.get('usageMetadata') or usage  # Cumulative; the last chunk has the totals
+                parts = chunk.get('candidates', [{}])[0].get('content', {}).get('parts', [])
+                text = "".join(part.get('text', '') for part in parts)
+                for file_info in parser.feed(text):
+                    yield file_info
+        finally:
+            await response.aclose()
+            # Includes incremental parsing, which overlaps with receiving the stream
+            observe_stage("gemini", time.perf_counter() - started)
+            record_usage(usage)
+
+        if not parser.done:
+            logger.warning(f"Gemini stream ended before the files array was closed; keeping {parser.entries_parsed} complete files")
+        logger.info(f"Streamed {parser.entries_parsed} files from Gemini API ({parser.entries_skipped} malformed entries skipped)")
+
+    async def _store_in_cache(self, tasks: List[str], project_type: str, workspace: ProjectWorkspace) -> None:
+        archive = None
+        if self.project_cache.store_archives:
+            loop = asyncio.get_running_loop()
+            archive = await loop.run_in_executor(None, build_zip, workspace.files)
+        await self.project_cache.set(self.project_cache_key(tasks, project_type), dict(workspace.files), archive)
+
+    @staticmethod
+    def _report(progress: Optional[ProgressCallback], stage: str, **data) -> None:
+        """Forwards a progress event to the caller; callback errors never fail the generation."""
+        if progress is None:
+            return
+        try:
+            progress(stage, **data)
+        except Exception as e:
+            logger.warning(f"Progress callback failed for stage {stage}: {e}")
+
+    def _add_file(self, workspace: ProjectWorkspace, file_info: Any) -> Optional[str]:
+        """Validates one generated file entry and adds it to the workspace."""
+        if not isinstance(file_info, dict) or "name" not in file_info or "content" not in file_info:
+            logger.warning(f"Skipping invalid file entry in JSON: {file_info}")
+            return None
+
+        file_name = file_info["name"]
+        file_content = file_info["content"]
+        if not isinstance(file_content, str):
+            logger.warning(f"Skipping file with non-text content: {file_name}")
+            return None
+
+        # Sanitize file path to prevent directory traversal
+        with timed("materialize"):
+            stored_path = workspace.add_file(file_name, file_content)
+        if stored_path is None:
+            logger.warning(f"Skipping potentially unsafe file path: {file_name}")
+            return None
+        logger.debug(f"Added file to workspace: {stored_path}", extra=SAMPLED)
+        return stored_path
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The client passed in, else the shared one (looked up per call, so it survives a restart)."""
+        return self._client or get_client()
+
+    @client.setter
+    def client(self, client: httpx.AsyncClient) -> None:
+        self._client = client
 
     async def close(self):
-        """Close the httpx client."""
-        if hasattr(self, 'client') and self.client:
-            await self.client.aclose()
+        """Close the httpx client if it was passed in; the shared one is closed by core.gemini."""
+        if self._client is not None:
+            await self._client.aclose()
             logger.info("DevBot client closed.")
 
 # Optional: Add cleanup for the client if the application lifecycle allows
@@ -1,30 +1,202 @@
-from github import Github, UnknownObjectException
-from typing import List, Dict
+from github import Github, GithubException, InputGitTreeElement, RateLimitExceededException, UnknownObjectException
+from collections import OrderedDict
+from typing import List, Dict, Callable, Any, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib3.util import Retry
+import asyncio
+import functools
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from core.cache import TTLCache
+from core.ratelimit import TokenBucket, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+# PyGithub is blocking, so every call runs on this dedicated pool. Its size caps
+# how many GitHub requests are in flight across all agents (and tokens).
+GITHUB_MAX_WORKERS = int(os.getenv('GITHUB_MAX_WORKERS', '8'))
+_executor = ThreadPoolExecutor(max_workers=GITHUB_MAX_WORKERS, thread_name_prefix="github")
+# Push all files as one commit through the Git Data API unless disabled per call
+GITHUB_BULK_PUSH = os.getenv('GITHUB_BULK_PUSH', 'true').lower() == 'true'
+GITHUB_BLOB_CONCURRENCY = int(os.getenv('GITHUB_BLOB_CONCURRENCY', '8'))
+GITHUB_ISSUE_CONCURRENCY = int(os.getenv('GITHUB_ISSUE_CONCURRENCY', '4'))
+# Pacing of content-creating requests (blobs, issues); replaces PyGithub's fixed 1s spacing
+GITHUB_WRITE_RATE = float(os.getenv('GITHUB_WRITE_RATE', '2'))
+GITHUB_WRITE_BURST = float(os.getenv('GITHUB_WRITE_BURST', '5'))
+# Overridable so the agent can be pointed at GitHub Enterprise or a local fake server
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', 'https://api.github.com')
+# How long the authenticated user and repository handles are reused before being looked up again
+GITHUB_METADATA_TTL = float(os.getenv('GITHUB_METADATA_TTL', '60'))
+# Pooled sessions of verified tokens kept for reuse (least recently used closed first) and how long an idle one lives
+GITHUB_MAX_SESSIONS = int(os.getenv('GITHUB_MAX_SESSIONS', '32'))
+GITHUB_SESSION_IDLE_SECONDS = float(os.getenv('GITHUB_SESSION_IDLE_SECONDS', '3600'))
+RATE_LIMIT_RESERVE = 10  # Stop writing when this few core API requests remain
+# Label put on every issue the agent creates; also narrows the duplicate check to those issues
+ISSUE_LABEL = 'synapse-generated'
+MAX_RATE_LIMIT_RETRIES = 3
+
+def git_blob_sha(content: str) -> str:
+    """SHA-1 git assigns to a blob with this (UTF-8) content."""
+    data = content.encode('utf-8')
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+class GitHubSession:
+    """Per-token PyGithub client plus cached user/repository handles.
+
+    The client keeps one pooled HTTP session, sized for the GitHub thread
+    pool, so agents created for the same token reuse its connections.
+    """
+
+    def __init__(self, access_token: str):
+        # Request pacing and rate-limit backoff are done by the agent's write bucket instead of
+        # PyGithub's global sleeps and its GithubRetry, which sleeps through 403s on a pool thread.
+        # Only server errors on idempotent requests are retried here.
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=range(500, 600), raise_on_status=False)
+        self.github = Github(access_token, base_url=GITHUB_API_URL, pool_size=GITHUB_MAX_WORKERS, retry=retry,
+                             seconds_between_requests=None, seconds_between_writes=None)
+        self.metadata = TTLCache(maxsize=64, ttl_seconds=GITHUB_METADATA_TTL)
+
+    def close(self) -> None:
+        try:
+            self.github.close()
+        except Exception as e:
+            logger.warning(f"Error closing GitHub session: {e}")
+
+# Token hash -> (last used, session); only tokens that passed verify() are shared
+_sessions: "OrderedDict[str, Tuple[float, GitHubSession]]" = OrderedDict()
+_sessions_lock = threading.Lock()
+
+def _token_key(access_token: str) -> str:
+    return hashlib.sha256(access_token.encode('utf-8')).hexdigest()
+
+def _evict_sessions(now: float) -> List[GitHubSession]:
+    """Removes idle sessions and the least recently used ones beyond the cap (call with the lock held)."""
+    evicted = []
+    while _sessions:
+        key, (last_used, session) = next(iter(_sessions.items()))
+        if len(_sessions) <= GITHUB_MAX_SESSIONS and last_used >= now - GITHUB_SESSION_IDLE_SECONDS:
+            break
+        del _sessions[key]
+        evicted.append(session)
+    return evicted
+
+def get_session(access_token: str) -> GitHubSession:
+    """Returns the shared session of a verified token, or a new unshared one."""
+    key = _token_key(access_token)
+    now = time.monotonic()
+    with _sessions_lock:
+        evicted = _evict_sessions(now)
+        entry = _sessions.get(key)
+        if entry is not None:
+            _sessions[key] = (now, entry[1])
+            _sessions.move_to_end(key)
+    for old in evicted:
+        old.close()
+    return entry[1] if entry is not None else GitHubSession(access_token)
+
+def share_session(access_token: str, session: GitHubSession) -> None:
+    """Makes a verified token's session reusable by later agents for the same token."""
+    key = _token_key(access_token)
+    now = time.monotonic()
+    with _sessions_lock:
+        if key not in _sessions:
+            _sessions[key] = (now, session)
+        _sessions.move_to_end(key)
+        evicted = _evict_sessions(now)
+    for old in evicted:
+        if old is not session:
+            old.close()
 
 class GitHubAgent:
     def __init__(self, access_token: str = None):
         if not access_token:
             raise ValueError("GitHub token is required but was not provided. Please check your .env file.")
-        self.github = Github(access_token)
+        self._token = access_token
+        self.session = get_session(access_token)
+        self.github = self.session.github
+        self.write_bucket = TokenBucket(GITHUB_WRITE_RATE, GITHUB_WRITE_BURST)
+
+    @staticmethod
+    async def _run(fn: Callable, *args, **kwargs) -> Any:
+        """Runs a blocking PyGithub call on the GitHub thread pool without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+    @staticmethod
+    def shutdown_executor() -> None:
+        """Stops the GitHub thread pool and closes pooled sessions (call once on application shutdown)."""
+        _executor.shutdown(wait=False)
+        with _sessions_lock:
+            sessions = [session for _, session in _sessions.values()]
+            _sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def _fetch_user(self):
+        user = self.github.get_user()
+        user.login  # get_user() is lazy; load it so later repo lookups need no extra request
+        return user
+
+    async def _user(self):
+        """Authenticated user, cached per token for GITHUB_METADATA_TTL seconds."""
+        user = self.session.metadata.get('user')
+        if user is None:
+            user = await self._run(self._fetch_user)
+            self.session.metadata.set('user', user)
+        return user
+
+    async def _repo(self, repo_name: str):
+        """Repository handle, cached per token for GITHUB_METADATA_TTL seconds."""
+        key = f"repo:{repo_name}"
+        repo = self.session.metadata.get(key)
+        if repo is None:
+            user = await self._user()
+            repo = await self._run(user.get_repo, repo_name)
+            self.session.metadata.set(key, repo)
+        return repo
+
+    async def verify(self) -> str:
+        """Checks the token by fetching the authenticated user. Returns the login.
+
+        Only after this succeeds is the token's session shared with later
+        agents, so invalid tokens never occupy the session cache.
+        """
+        try:
+            user = await self._run(self._fetch_user)
+        except Exception:
+            with _sessions_lock:
+                shared = _sessions.get(_token_key(self._token), (0.0, None))[1] is self.session
+            if not shared:  # Nothing else uses it
+                self.session.close()
+            raise
+        self.session.metadata.set('user', user)
+        share_session(self._token, self.session)
+        return user.login
 
     async def create_repository(self, repo_name: str, description: str = "") -> str:
         """Creates a new repository or returns the URL if it already exists"""
-        user = self.github.get_user()
         try:
             # Try to get the repository first
-            repo = user.get_repo(repo_name)
-            print(f"Repository '{repo_name}' already exists. Using existing repository.")
+            repo = await self._repo(repo_name)
+            logger.info(f"Repository '{repo_name}' already exists. Using existing repository.")
             return repo.html_url
         except UnknownObjectException:
             # Repository does not exist, so create it
-            print(f"Repository '{repo_name}' not found. Creating new repository.")
+            logger.info(f"Repository '{repo_name}' not found. Creating new repository.")
             try:
-                repo = user.create_repo(
+                user = await self._user()
+                repo = await self._run(
+                    user.create_repo,
                     name=repo_name,
                     description=description,
                     private=False,  # Default to public, can be parameterized
                     auto_init=True  # Initialize with a README
                 )
+                self.session.metadata.set(f"repo:{repo_name}", repo)
                 return repo.html_url
             except Exception as e_create:
                 # Catch specific exceptions from create_repo if necessary
@@ -33,12 +205,68 @@ class GitHubAgent:
             # Catch other potential errors during get_repo
             raise Exception(f"Failed to check or create repository '{repo_name}': {str(e_get)}")
 
-    async def push_files(self, repo_name: str, files: Dict[str, str]) -> None:
-        """Pushes files to the repository"""
+    async def push_files(self, repo_name: str, files: Dict[str, str], bulk: Optional[bool] = None) -> None:
+        """Pushes files to the repository
+
+        In bulk mode (default: GITHUB_BULK_PUSH) all changes land in a single
+        commit made through the Git Data API; otherwise each file is created or
+        updated with its own commit.
+        """
+        if bulk is None:
+            bulk = GITHUB_BULK_PUSH
+        try:
+            repo = await self._repo(repo_name)
+        except Exception as e:
+            raise Exception(f"Failed to push files: {str(e)}")
+        if bulk:
+            try:
+                await self._push_files_bulk(repo, files)
+                return
+            except GithubException as e:
+                # An empty repository (409) or missing default branch (404) has nothing to commit on top of
+                if e.status not in (404, 409):
+                    raise Exception(f"Failed to push files: {str(e)}")
+                logger.warning(f"Bulk push unavailable for '{repo_name}' ({e.status}), pushing files one by one.")
+            except Exception as e:
+                raise Exception(f"Failed to push files: {str(e)}")
+        await self._run(self._push_files, repo, files)
+
+    async def _push_files_bulk(self, repo, files: Dict[str, str]) -> None:
+        """Creates changed blobs in parallel, then one tree and one commit, and moves the branch.
+
+        Files whose local git blob SHA matches the current tree are skipped, so
+        an unchanged push makes no commit at all. N changed files cost N blob
+        requests plus six fixed ones, instead of 2N requests and N commits.
+        """
+        repo_name = repo.name
+        branch = repo.default_branch
+        ref = await self._run(repo.get_git_ref, f"heads/{branch}")
+        head_commit = await self._run(repo.get_git_commit, ref.object.sha)
+        head_tree = await self._run(repo.get_git_tree, head_commit.tree.sha, recursive=True)
+        existing = {element.path: element.sha for element in head_tree.tree if element.type == 'blob'}
+
+        changed = {path: content for path, content in files.items() if existing.get(path) != git_blob_sha(content)}
+        if not changed:
+            logger.info(f"All {len(files)} files are unchanged in '{repo_name}', nothing to push.")
+            return
+
+        semaphore = asyncio.Semaphore(GITHUB_BLOB_CONCURRENCY)
+
+        async def create_blob(path: str, content: str) -> InputGitTreeElement:
+            async with semaphore:
+                await self.write_bucket.acquire()
+                blob = await self._run(repo.create_git_blob, content, "utf-8")
+            return InputGitTreeElement(path=path, mode='100644', type='blob', sha=blob.sha)
+
+        elements = await asyncio.gather(*(create_blob(path, content) for path, content in changed.items()))
+        tree = await self._run(repo.create_git_tree, list(elements), head_tree)
+        message = f"Add {len(changed)} files from Synapse" if not existing else f"Update {len(changed)} files from Synapse"
+        commit = await self._run(repo.create_git_commit, message, tree, [head_commit])
+        await self._run(ref.edit, commit.sha)
+        logger.info(f"Pushed {len(changed)} changed files to '{repo_name}' in commit {commit.sha[:7]} ({len(files) - len(changed)} unchanged).")
+
+    def _push_files(self, repo, files: Dict[str, str]) -> None:
         try:
-            user = self.github.get_user()
-            repo = user.get_repo(repo_name)
-            
             for file_path, content in files.items():
                 try:
                     # Try to get existing file to update it
@@ -60,16 +288,77 @@ class GitHubAgent:
             raise Exception(f"Failed to push files: {str(e)}")
 
     async def create_issues(self, repo_name: str, tasks: List[str]) -> None:
-        """Creates GitHub issues from tasks"""
+        """Creates GitHub issues from tasks
+
+        Issues are created concurrently (GITHUB_ISSUE_CONCURRENCY) through the
+        write token bucket, which pauses on Retry-After and when
+        X-RateLimit-Remaining runs low. Tasks whose title already exists as an
+        issue created by the agent are skipped, so re-pushing does not duplicate them.
+        """
         try:
-            user = self.github.get_user()
-            repo = user.get_repo(repo_name)
-            
-            for task in tasks:
-                repo.create_issue(
-                    title=task,
-                    body=f"Task from Synapse:\n{task}",
-                    labels=['synapse-generated']
-                )
+            repo = await self._repo(repo_name)
+            existing_titles = await self._run(self._existing_titles, repo, tasks)
         except Exception as e:
             raise Exception(f"Failed to create issues: {str(e)}")
+
+        new_tasks = list(dict.fromkeys(task for task in tasks if task not in existing_titles))
+        if len(new_tasks) < len(tasks):
+            logger.info(f"Skipping {len(tasks) - len(new_tasks)} duplicate or existing issues in '{repo_name}'.")
+
+        semaphore = asyncio.Semaphore(GITHUB_ISSUE_CONCURRENCY)
+
+        async def create(task: str) -> None:
+            async with semaphore:
+                await self._create_issue_with_backoff(repo, task)
+
+        results = await asyncio.gather(*(create(task) for task in new_tasks), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise Exception(f"Failed to create issues: {len(errors)} of {len(new_tasks)} failed, first error: {str(errors[0])}")
+
+    @staticmethod
+    def _existing_titles(repo, titles: List[str]) -> set:
+        """Which of `titles` already exist as agent-created issues.
+
+        Only issues carrying ISSUE_LABEL are listed, and paging stops once all
+        titles are found, instead of walking the repository's whole issue and
+        pull request history.
+        """
+        wanted = set(titles)
+        found = set()
+        for issue in repo.get_issues(state='all', labels=[ISSUE_LABEL]):
+            if issue.title in wanted:
+                found.add(issue.title)
+                if found == wanted:
+                    break
+        return found
+
+    async def _create_issue_with_backoff(self, repo, task: str) -> None:
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            await self.write_bucket.acquire()
+            try:
+                remaining, reset_at = await self._run(self._create_issue, repo, task)
+            except (RateLimitExceededException, GithubException) as e:
+                wait = retry_after_seconds(getattr(e, 'headers', None))
+                if isinstance(e, RateLimitExceededException) and wait is None:
+                    wait = 60.0  # Secondary limit without a hint: GitHub asks for at least a minute
+                if e.status not in (403, 429) or wait is None or attempt == MAX_RATE_LIMIT_RETRIES:
+                    raise
+                logger.warning(f"GitHub rate limit hit creating issue, retrying in {wait:.1f}s.")
+                self.write_bucket.pause(wait)
+                continue
+            self.write_bucket.observe(remaining, reset_at, reserve=RATE_LIMIT_RESERVE)
+            return
+
+    def _create_issue(self, repo, task: str):
+        issue = repo.create_issue(
+            title=task,
+            body=f"Task from Synapse:\n{task}",
+            labels=[ISSUE_LABEL]
+        )
+        # Rate limit state as reported by the response headers (absent on some GitHub Enterprise setups)
+        headers = {key.lower(): value for key, value in (issue.raw_headers or {}).items()}
+        try:
+            return int(headers['x-ratelimit-remaining']), float(headers['x-ratelimit-reset'])
+        except (KeyError, ValueError):
+            return None, None
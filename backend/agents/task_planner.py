@@ -3,31 +3,63 @@ import json
 import logging
 import os
 import re
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 import asyncio
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from core.cache import ResponseCache, make_cache_key, normalize_text
+from core import gemini
+from core.gemini import get_client, model_url, request_timeout
+from core.json_extract import extract_json
+from core.metrics import record_failure, timed
+from core.usage import record_usage
+from core.resilience import CircuitOpenError, Resilience
+
 logger = logging.getLogger(__name__)
 
+# Bump when the planning prompts change so cached plans are not reused
+PLANNER_PROMPT_VERSION = "1"
+
+# "sequential": tech stack and goals in two Gemini calls; "combined": one structured call,
+# falling back to the sequential path if its response cannot be parsed
+PLANNING_MODES = ('sequential', 'combined')
+
+# Plans are short, so a stalled response is given up on sooner than a code generation
+PLANNER_READ_TIMEOUT = float(os.getenv('PLANNER_READ_TIMEOUT', '60'))
+# Send a second, identical request when the first has not answered after this long (0 = off)
+PLANNER_HEDGE_AFTER_MS = float(os.getenv('PLANNER_HEDGE_AFTER_MS', '0'))
+
 class TaskPlannerAgent:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, cache: Optional[ResponseCache] = None,
+                 client: Optional[httpx.AsyncClient] = None, resilience: Optional[Resilience] = None):
         self.api_key = api_key
         gemini_key = os.getenv('GEMINI_API_KEY')
         if not gemini_key:
             logger.error("GEMINI_API_KEY environment variable not set!")
         # Use gemini-1.5-flash model and v1 API endpoint
-        self.endpoint = f"https://generativelanguage.googleapis.com/v1/models/gemini-1.5-flash:generateContent?key={gemini_key}"
-        self.client = httpx.AsyncClient(timeout=60.0)
+        self.model = "gemini-1.5-flash"
+        self.endpoint = model_url(self.model, "generateContent", gemini_key)
+        self.generation_config = {
+            "temperature": 0.4, # Adjusted temperature slightly
+            "topP": 0.9,
+            "maxOutputTokens": 2048
+        }
+        # Shared pooled Gemini client unless one is passed in
+        self._client = client
+        self.timeout = request_timeout(PLANNER_READ_TIMEOUT)
+        # Retries with backoff and the shared Gemini circuit breaker; plans are small, so hedging is cheap
+        self.resilience = resilience or gemini.resilience
+        self.hedge_after = PLANNER_HEDGE_AFTER_MS / 1000 or None
+        # Optional cache of complete plans keyed on requirement/model/config
+        self.cache = cache
+        self.planning_mode = os.getenv('PLANNER_MODE', 'sequential').lower()
+        if self.planning_mode not in PLANNING_MODES:
+            logger.warning(f"Unknown PLANNER_MODE '{self.planning_mode}', using 'sequential'.")
+            self.planning_mode = 'sequential'
 
     async def _call_gemini(self, prompt: str, request_json: bool = False) -> Dict:
         payload = {
             "contents": [{"parts": [{"text": prompt}]}],
-            "generationConfig": {
-                "temperature": 0.4, # Adjusted temperature slightly
-                "topP": 0.9,
-                "maxOutputTokens": 2048
-            },
+            "generationConfig": dict(self.generation_config),
              "safetySettings": [
                 {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
                 {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
@@ -47,14 +79,25 @@ class TaskPlannerAgent:
         # logger.info(f"Sending prompt: {prompt[:200]}...")
 
         try:
-            response = await self.client.post(self.endpoint, headers=headers, json=payload)
+            with timed("gemini"):
+                response = await self.resilience.call(
+                    lambda: self.client.post(self.endpoint, headers=headers, json=payload, timeout=self.timeout),
+                    hedge_after=self.hedge_after
+                )
             logger.info(f"Gemini API Response Status Code: {response.status_code}")
             response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-            return response.json()
+            result = response.json()
+            record_usage(result.get('usageMetadata'))
+            return result
+        except CircuitOpenError:
+            record_failure("circuit_open")
+            raise
         except httpx.RequestError as e:
+            record_failure("gemini_connection")
             logger.error(f"Error connecting to Gemini API: {str(e)}")
             raise ConnectionError(f"Error connecting to Gemini API: {str(e)}") from e
         except httpx.HTTPStatusError as e:
+            record_failure("gemini_http")
             logger.error(f"Gemini API error: {e.response.status_code} - {e.response.text[:500]}...")
             raise ValueError(f"Gemini API error: {e.response.status_code}") from e # Don't expose full error text potentially
         except Exception as e:
@@ -66,35 +109,137 @@ class TaskPlannerAgent:
         try:
             # Access the nested structure
             text = result['candidates'][0]['content']['parts'][0]['text']
+            gemini.capture_response("plan", text)
             return text.strip()
         except (KeyError, IndexError, TypeError) as e:
             logger.error(f"Error extracting text from Gemini response: {e}. Response: {result}")
             raise ValueError("Could not extract text from Gemini response structure.") from e
 
-    def _clean_json_string(self, text: str) -> str:
-        """Removes markdown fences and leading/trailing whitespace from a potential JSON string."""
-        # Regex to find JSON possibly wrapped in ```json ... ``` or ``` ... ```
-        match = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", text, re.DOTALL | re.IGNORECASE)
-        if match:
-            return match.group(1).strip()
-        # Fallback for JSON not wrapped in fences but might have surrounding whitespace
-        return text.strip()
-
-    async def break_down_tasks(self, requirement: str) -> Dict:
-        tech_stack = {'language': 'Unknown', 'frameworks': [], 'app_type': 'Unknown'}
-        # Provide more generic default goals
-        goals = [
-            "1. Define project requirements and scope.",
-            "2. Set up the development environment and project structure.",
-            "3. Implement core features based on requirements.",
-            "4. Develop necessary utility functions or modules.",
-            "5. Integrate external services or APIs if needed.",
-            "6. Implement user interface (if applicable).",
-            "7. Write unit and integration tests.",
-            "8. Add comprehensive error handling and logging.",
-            "9. Create documentation (README, code comments).",
-            "10. Prepare for deployment."
-        ]
+    def cache_key(self, requirement: str) -> str:
+        """Cache key for a plan: normalized requirement, model, generation config and prompt version."""
+        return make_cache_key("plan", normalize_text(requirement), self.model, self.generation_config, PLANNER_PROMPT_VERSION)
+
+    def plan_key(self, requirement: str, use_cache: bool = True, mode: Optional[str] = None) -> str:
+        """Single-flight key for break_down_tasks: the cache key plus the planning mode."""
+        return make_cache_key(self.cache_key(requirement), (mode or self.planning_mode).lower())
+
+    async def get_cached(self, requirement: str) -> Optional[Dict]:
+        """Returns the cached plan for `requirement`, or None (also when caching is disabled)."""
+        if self.cache is None:
+            return None
+        return await self.cache.get(self.cache_key(requirement))
+
+    @staticmethod
+    def _is_valid_tech_stack(parsed_json: Any) -> bool:
+        return isinstance(parsed_json, dict) and \
+            isinstance(parsed_json.get("language"), str) and \
+            isinstance(parsed_json.get("frameworks"), list) and \
+            isinstance(parsed_json.get("app_type"), str)
+
+    @staticmethod
+    def _default_plan() -> Dict:
+        return {
+            'tech_stack': {'language': 'Unknown', 'frameworks': [], 'app_type': 'Unknown'},
+            # Provide more generic default goals
+            'goals': [
+                "1. Define project requirements and scope.",
+                "2. Set up the development environment and project structure.",
+                "3. Implement core features based on requirements.",
+                "4. Develop necessary utility functions or modules.",
+                "5. Integrate external services or APIs if needed.",
+                "6. Implement user interface (if applicable).",
+                "7. Write unit and integration tests.",
+                "8. Add comprehensive error handling and logging.",
+                "9. Create documentation (README, code comments).",
+                "10. Prepare for deployment."
+            ]
+        }
+
+    async def break_down_tasks(self, requirement: str, use_cache: bool = True, mode: Optional[str] = None) -> Dict:
+        """Breaks a requirement into a tech stack and numbered goals.
+
+        With `use_cache`, a cached plan is returned when available. Complete
+        plans (every Gemini response parsed) are always written to the cache;
+        fallback defaults never are. `mode` overrides PLANNER_MODE.
+        """
+        if use_cache:
+            cached = await self.get_cached(requirement)
+            if cached is not None:
+                logger.info("Returning cached plan for requirement.")
+                return cached
+
+        mode = (mode or self.planning_mode).lower()
+        if mode == 'combined':
+            result, complete = await self._plan_combined(requirement)
+        else:
+            result, complete = await self._plan_sequential(requirement)
+        if complete and self.cache is not None:
+            await self.cache.set(self.cache_key(requirement), result)
+        return result
+
+    async def _plan_combined(self, requirement: str) -> Tuple[Dict, bool]:
+        """Gets tech stack and goals from one structured response.
+
+        Falls back to the two-call path only if the response cannot be parsed
+        or validated; upstream errors return the default plan as before.
+        """
+        combined_prompt = f"""Analyze this project requirement, determine the technical stack and break it down into 5-10 high-level, actionable development goals.
+Project Requirement: {requirement}
+
+Rules:
+1. Identify the main programming language (e.g., Python, JavaScript, Java).
+2. List key frameworks or libraries needed (e.g., Flask, React, Spring).
+3. Determine the type of application (e.g., Web API, Frontend Web App, CLI Tool).
+4. Goals must fit the tech stack and be ordered from project setup to deployment.
+
+Your response MUST be a valid JSON object following this exact structure:
+{{
+    "tech_stack": {{
+        "language": "string",
+        "frameworks": ["string"],
+        "app_type": "string"
+    }},
+    "goals": ["string"]
+}}"""
+        try:
+            logger.info("Requesting combined tech stack and goals from Gemini...")
+            result = await self._call_gemini(combined_prompt, request_json=True)
+            raw_text = self._extract_text_from_response(result)
+        except CircuitOpenError:
+            raise  # Gemini is known to be down: fail fast instead of returning the default plan
+        except (ConnectionError, ValueError) as e:
+            logger.error(f"Error processing requirement in break_down_tasks: {e}")
+            return self._default_plan(), False
+
+        logger.info(f"Raw combined planning response text: {raw_text[:500]}...")
+        try:
+            with timed("json_parse"):
+                parsed_json = extract_json(raw_text)
+            if not isinstance(parsed_json, dict) or not self._is_valid_tech_stack(parsed_json.get("tech_stack")):
+                raise ValueError("Parsed JSON does not contain a valid tech_stack.")
+            raw_goals = parsed_json.get("goals")
+            if not isinstance(raw_goals, list):
+                raise ValueError("Parsed JSON does not contain a goals list.")
+            # Strip any numbering the model added, then re-number consistently
+            parsed_goals = [re.sub(r"^\d+\.\s+", "", goal.strip()) for goal in raw_goals if isinstance(goal, str) and goal.strip()]
+            if not parsed_goals:
+                raise ValueError("Parsed JSON contains no goals.")
+        except (json.JSONDecodeError, ValueError) as e:
+            record_failure("json_parse")
+            logger.warning(f"Failed to parse combined planning response ({e}); falling back to two-call planning.")
+            return await self._plan_sequential(requirement)
+
+        goals = [f"{i+1}. {task}" for i, task in enumerate(parsed_goals)]
+        logger.info(f"Successfully parsed tech stack and {len(goals)} goals from one response.")
+        return {'goals': goals, 'tech_stack': parsed_json["tech_stack"]}, True
+
+    async def _plan_sequential(self, requirement: str) -> Tuple[Dict, bool]:
+        """Runs the tech stack prompt, then the goals prompt. Returns the plan and whether both parsed."""
+        tech_parsed = False
+        goals_parsed = False
+        default_plan = self._default_plan()
+        tech_stack = default_plan['tech_stack']
+        goals = default_plan['goals']
 
         try:
             # 1. Analyze Tech Stack (Requesting JSON response)
@@ -118,19 +263,19 @@ Your response MUST be a valid JSON object following this exact structure:
             # Extract and parse tech stack JSON
             raw_tech_text = self._extract_text_from_response(tech_result)
             logger.info(f"Raw tech analysis response text: {raw_tech_text[:500]}...") # Log beginning of text
-            cleaned_tech_json_str = self._clean_json_string(raw_tech_text)
             try:
-                parsed_json = json.loads(cleaned_tech_json_str)
+                with timed("json_parse"):
+                    parsed_json = extract_json(raw_tech_text)
                 # Basic validation
-                if isinstance(parsed_json.get("language"), str) and \
-                   isinstance(parsed_json.get("frameworks"), list) and \
-                   isinstance(parsed_json.get("app_type"), str):
+                if self._is_valid_tech_stack(parsed_json):
                     tech_stack = parsed_json
+                    tech_parsed = True
                     logger.info(f"Successfully parsed tech stack: {tech_stack}")
                 else:
                     raise ValueError("Parsed JSON does not match expected structure.")
             except (json.JSONDecodeError, ValueError) as e:
-                 logger.error(f"Failed to parse tech stack JSON: {e}. Raw text: {tech_text}")
+                 record_failure("json_parse")
+                 logger.error(f"Failed to parse tech stack JSON: {e}. Raw text: {raw_tech_text}")
                  # Keep default tech_stack on error
 
 
@@ -163,11 +308,14 @@ Example:
             if parsed_goals:
                 # Re-number the goals consistently
                 goals = [f"{i+1}. {task}" for i, task in enumerate(parsed_goals)]
+                goals_parsed = True
                 logger.info(f"Successfully parsed {len(goals)} goals.")
             else:
                 logger.warning("Could not parse numbered goals from response, using default goals.")
                 # Keep default goals if parsing fails
 
+        except CircuitOpenError:
+            raise  # Gemini is known to be down: fail fast instead of returning the default plan
         except (ConnectionError, ValueError) as e:
             logger.error(f"Error processing requirement in break_down_tasks: {e}")
             # Keep default goals/tech_stack on error
@@ -175,10 +323,19 @@ Example:
             logger.error(f"Unexpected error in break_down_tasks: {e}", exc_info=True)
             # Keep default goals/tech_stack on error
 
-        return {'goals': goals, 'tech_stack': tech_stack}
+        return {'goals': goals, 'tech_stack': tech_stack}, tech_parsed and goals_parsed
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The client passed in, else the shared one (looked up per call, so it survives a restart)."""
+        return self._client or get_client()
+
+    @client.setter
+    def client(self, client: httpx.AsyncClient) -> None:
+        self._client = client
 
     async def close(self):
-        """Close the httpx client."""
-        if hasattr(self, 'client') and self.client:
-            await self.client.aclose()
+        """Close the httpx client if it was passed in; the shared one is closed by core.gemini."""
+        if self._client is not None:
+            await self._client.aclose()
             logger.info("TaskPlannerAgent client closed.")
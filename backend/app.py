@@ -1,25 +1,41 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from typing import List, Dict, Optional
+from pydantic import BaseModel, Field
+from typing import List, Dict, Optional, Literal
 from agents.task_planner import TaskPlannerAgent
 from agents.dev_bot import DevBot
-from agents.github_agent import GitHubAgent
+from agents.github_agent import GitHubAgent, share_session
+from core.archive import build_zip, stream_zip
+from core.credentials import SESSION_COOKIE, CredentialStore, new_session_id
+from core.cache import MongoCacheTier, ProjectCache, ResponseCache, TTLCache
+from core.gemini import close_client as close_gemini_client, resilience as gemini_resilience
+from core.jobs import JobStore, format_sse
+from core.logs import RequestIdMiddleware, configure_logging, dropped_records, shutdown_logging
+from core.metrics import ServerTimingMiddleware, record_failure, registry as metrics_registry, timed, timed_iterator
+from core.persistence import MongoStore, mongo_client_options
+from core.projects import MissingBlobsError, ProjectRecords, new_project_id
+from core.resilience import CircuitOpenError
+from core.scheduler import JobScheduler, QueueFullError, ScheduledService
+from core.state import STATE_BACKEND, MongoState, open_state
+from core.usage import QuotaExceededError, UsageMiddleware, client_var, ledger as usage_ledger
 from pymongo import MongoClient
+import logging
+import math
 import os
-import datetime
 from dotenv import load_dotenv
 import asyncio
-from asgiref.sync import sync_to_async
 from pathlib import Path
-import atexit
+import time
 from contextlib import asynccontextmanager # Import asynccontextmanager for lifespan
 
 # Load environment variables from parent directory
 env_path = Path(__file__).parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
+configure_logging()
+
+logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
 app = FastAPI()
@@ -32,6 +48,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Per-request stage timings (Server-Timing header) and request latency histograms for /metrics
+app.add_middleware(ServerTimingMiddleware)
+# Attributes Gemini token usage to the calling client (X-API-Key, X-Client-Id or address) and endpoint
+app.add_middleware(UsageMiddleware)
+# Request ids in the X-Request-Id header and on every log line (added last so it runs outermost)
+app.add_middleware(RequestIdMiddleware)
 
 # Mount static files and frontend assets
 static_dir = Path(__file__).parent / "templates"
@@ -48,87 +70,230 @@ services = {
     'dev_bot': None
 }
 
-# Initialize MongoDB
-try:
-    mongo_client = MongoClient(os.getenv('MONGODB_URI'), serverSelectionTimeoutMS=5000)
-    mongo_client.server_info()  # Test connection
-    db = mongo_client.synapse
-    services['mongodb'] = db
-    print("MongoDB connection successful")
-except Exception as e:
-    print(f"Warning: MongoDB connection failed: {e}")
-    db = None
+mongo_client = None
+mongo_store: Optional[MongoStore] = None
+
+# Per-user GitHub tokens, job state and job archives live here, so several workers
+# (gunicorn -w N) can serve the same users; see core/state.py
+state = open_state()
+# GitHub tokens set through /api/update-github-token are kept this long per browser session
+GITHUB_TOKEN_TTL_SECONDS = float(os.getenv('GITHUB_TOKEN_TTL_HOURS', '168')) * 3600
+GITHUB_TOKENS_NAMESPACE = 'github_tokens'
+# Encrypted with SECRET_KEY, under the session id of the cookie the token was set with
+github_tokens = CredentialStore(state, GITHUB_TOKENS_NAMESPACE, ttl=GITHUB_TOKEN_TTL_SECONDS)
+# Agents for tokens set through the API (by session id), built once per worker
+github_agents = TTLCache(maxsize=128, ttl_seconds=3600)
+project_records: Optional[ProjectRecords] = None
+
+# Startup progress: the app serves requests (liveness) while external services
+# are still connecting; readiness flips once startup_services() has finished.
+startup_state = {
+    'ready': False,
+    'started_at': None,
+    'duration_seconds': None,
+    'services': {'mongodb': 'pending', 'github': 'pending'},
+}
+startup_task: Optional[asyncio.Task] = None
+STARTUP_WAIT_SECONDS = float(os.getenv('STARTUP_WAIT_SECONDS', '10'))
 
-# Initialize other services (moved DevBot initialization to lifespan)
+# Initialize other services (network checks and DevBot initialization happen in lifespan)
 try:
     gemini_api_key = os.getenv('GEMINI_API_KEY')
     if not gemini_api_key:
-        print("Warning: GEMINI_API_KEY not found in environment variables.")
+        logger.warning("GEMINI_API_KEY not found in environment variables.")
         # Handle missing key appropriately, maybe disable AI features
 
-    services['task_planner'] = TaskPlannerAgent(gemini_api_key)
+    # Plan cache: in-memory LRU/TTL, plus a shared MongoDB tier attached once MongoDB is up
+    planner_cache = ResponseCache(
+        "planner",
+        maxsize=int(os.getenv('PLANNER_CACHE_SIZE', '256')),
+        ttl_seconds=int(os.getenv('PLANNER_CACHE_TTL', '3600'))
+    )
+    services['task_planner'] = TaskPlannerAgent(gemini_api_key, cache=planner_cache)
     # services['dev_bot'] will be initialized in lifespan
+except Exception as e:
+    logger.error(f"Error initializing services: {e}")
+    planner_cache = None
+
+def connect_mongodb():
+    """Blocking: resolves the URI and waits for server selection (runs off the event loop)."""
+    client = MongoClient(os.getenv('MONGODB_URI'), **mongo_client_options())
+    try:
+        client.server_info()  # Test connection
+    except Exception:
+        client.close()
+        raise
+    return client
+
+async def init_mongodb():
+    global mongo_client, mongo_store, project_records, state
+    try:
+        mongo_client = await asyncio.get_running_loop().run_in_executor(None, connect_mongodb)
+        db = mongo_client.synapse
+        mongo_store = MongoStore(db)
+        records = ProjectRecords(mongo_store)
+        try:
+            await records.ensure_indexes()
+        except Exception as e:
+            logger.warning(f"Could not create project indexes: {e}")
+        if STATE_BACKEND == 'mongo':
+            shared_state = MongoState(mongo_store)
+            await shared_state.ensure_indexes()
+            state = jobs.state = shared_state
+            github_tokens.use_state(shared_state)
+            logger.info("Shared state in MongoDB")
+        try:
+            await usage_ledger.attach(mongo_store)
+        except Exception as e:
+            logger.warning(f"Could not load Gemini usage from MongoDB: {e}")
+        project_records = records
+        services['mongodb'] = db
+        if planner_cache is not None and os.getenv('PLANNER_CACHE_MONGO', 'false').lower() == 'true':
+            planner_cache.mongo_tier = MongoCacheTier(db.planner_cache, ttl_seconds=int(os.getenv('PLANNER_CACHE_TTL', '3600')))
+        startup_state['services']['mongodb'] = 'ok'
+        logger.info("MongoDB connection successful")
+    except Exception as e:
+        startup_state['services']['mongodb'] = 'unavailable'
+        logger.warning(f"MongoDB connection failed: {e}")
 
+async def init_github():
     # Initialize GitHub agent with validation
     github_token = os.getenv('GITHUB_TOKEN')
-    if github_token and len(github_token) > 0:
+    if not github_token:
+        startup_state['services']['github'] = 'disabled'
+        logger.warning("Invalid or missing GitHub token")
+        return
+    try:
         github_agent = GitHubAgent(github_token)
         # Test the token by trying to get the authenticated user
-        github_agent.github.get_user().login
+        await github_agent.verify()
         services['github'] = github_agent
-        print("GitHub authentication successful")
-    else:
-        print("Warning: Invalid or missing GitHub token")
-except Exception as e:
-    print(f"Error initializing services: {e}")
-
-# Convert MongoDB operations to async
-async def safe_insert_one(document):
-    if services['mongodb'] is not None:
-        return await sync_to_async(services['mongodb'].files.insert_one)(document)
-    return None
-
-async def safe_find_one(sort_params=None):
-    if services['mongodb'] is not None:
-        return await sync_to_async(services['mongodb'].files.find_one)(sort=sort_params)
-    return None
+        startup_state['services']['github'] = 'ok'
+        logger.info("GitHub authentication successful")
+    except Exception as e:
+        startup_state['services']['github'] = 'unavailable'
+        logger.warning(f"GitHub authentication failed: {e}")
+
+async def startup_services():
+    """Connects external services concurrently; failures leave the service disabled."""
+    started = time.perf_counter()
+    await asyncio.gather(init_mongodb(), init_github())
+    startup_state['duration_seconds'] = round(time.perf_counter() - started, 3)
+    startup_state['ready'] = True
+    logger.info(f"Services ready in {startup_state['duration_seconds']}s")
+
+async def wait_for_startup() -> None:
+    """Lets a request that needs MongoDB or GitHub wait (bounded) for startup to finish."""
+    if startup_task is not None and not startup_task.done():
+        try:
+            await asyncio.wait_for(asyncio.shield(startup_task), timeout=STARTUP_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+# Background project generation jobs (progress is streamed over SSE)
+jobs = JobStore(state=state)
+
+# Admission control for every Gemini-bound call (fixed worker pool + bounded queue + per-client token quotas)
+llm_scheduler = JobScheduler(name="llm", admit=usage_ledger.check)
+
+# Project records live in MongoDB, keyed by the project id handed to the client
+async def get_github_agent(request: Request) -> Optional[GitHubAgent]:
+    """The GitHub agent for the session's own token (set through the API), else the server's.
+
+    A session whose token has expired (or was set on a worker that could not
+    share it) gets None, never the server's agent, so its pushes cannot land
+    on the server owner's account.
+    """
+    session_id = request.cookies.get(SESSION_COOKIE)
+    if not session_id:
+        return services['github']
+    token = await github_tokens.get(session_id)
+    if token is None:
+        return None
+    agent = github_agents.get(session_id)
+    if agent is None:
+        agent = GitHubAgent(token)
+        # Verified when it was set; pooled, so its connections are closed once idle rather than leaked
+        # when the agent falls out of github_agents
+        share_session(token, agent.session)
+        github_agents.set(session_id, agent)
+    return agent
+
+async def get_project_records() -> Optional[ProjectRecords]:
+    """Project records, or None when MongoDB is unavailable."""
+    await wait_for_startup()
+    return project_records
 
 # --- Lifespan Management ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: Initialize services that need async cleanup
-    print("Application startup...")
+    global startup_task
+    logger.info("Application startup...")
+    startup_state['started_at'] = time.time()
+    if not state.shared and STATE_BACKEND != 'mongo' and int(os.getenv('WEB_CONCURRENCY', '1')) > 1:
+        logger.warning("Running several workers with STATE_BACKEND=memory: jobs and GitHub tokens are not shared between them.")
+    llm_scheduler.start()
+    # MongoDB and GitHub connect in the background so the port binds immediately
+    startup_task = asyncio.ensure_future(startup_services())
     gemini_api_key = os.getenv('GEMINI_API_KEY')
     if gemini_api_key:
-        services['dev_bot'] = DevBot(gemini_api_key)
-        print("DevBot initialized.")
+        project_cache = None
+        if os.getenv('PROJECT_CACHE', 'true').lower() == 'true':
+            project_cache = ProjectCache(
+                str(Path(__file__).resolve().parent / os.getenv('PROJECT_CACHE_DIR', '.project_cache')),  # Relative to backend/
+                max_bytes=int(os.getenv('PROJECT_CACHE_MAX_MB', '256')) * 1024 * 1024,
+                store_archives=os.getenv('PROJECT_CACHE_ARCHIVES', 'false').lower() == 'true'
+            )
+        dev_bot = DevBot(gemini_api_key, project_cache=project_cache)
+        # Identical concurrent generations (double clicks, several tabs) share one Gemini call and result
+        services['dev_bot'] = ScheduledService(dev_bot, llm_scheduler, ('generate_project',),
+                                               keys={'generate_project': dev_bot.generation_key},
+                                               broadcasts={'generate_project': 'progress'})
+        logger.info("DevBot initialized.")
     else:
-        print("Warning: DevBot not initialized due to missing GEMINI_API_KEY.")
+        logger.warning("DevBot not initialized due to missing GEMINI_API_KEY.")
         services['dev_bot'] = None # Ensure it's None if not initialized
-
-    # MongoDB client is managed by pymongo's connection pool,
-    # but explicit close on shutdown is good practice if needed elsewhere.
-    # atexit handles the current MongoDB cleanup.
+    if services['task_planner'] is not None and not isinstance(services['task_planner'], ScheduledService):
+        planner = services['task_planner']
+        services['task_planner'] = ScheduledService(planner, llm_scheduler, ('break_down_tasks',),
+                                                    keys={'break_down_tasks': planner.plan_key})
 
     yield # Application runs here
 
     # Shutdown: Cleanup resources
-    print("Application shutdown...")
+    logger.info("Application shutdown...")
+    if not startup_task.done():
+        startup_task.cancel()
+        await asyncio.gather(startup_task, return_exceptions=True)
+    await jobs.cancel_all()
+    await jobs.flush()
+    await llm_scheduler.stop()
+    GitHubAgent.shutdown_executor()
     if services.get('dev_bot'):
         try:
             await services['dev_bot'].close()
-            print("DevBot client closed.")
+            logger.info("DevBot client closed.")
         except Exception as e:
-            print(f"Error closing DevBot client: {e}")
+            logger.error(f"Error closing DevBot client: {e}")
+    if services.get('task_planner'):
+        try:
+            await services['task_planner'].close()
+        except Exception as e:
+            logger.error(f"Error closing TaskPlannerAgent client: {e}")
+    await close_gemini_client()
 
-    if 'mongodb' in services and services['mongodb'] is not None:
-         # mongo_client is defined outside, accessible here
+    await state.close()
+    if mongo_store is not None:
+        await mongo_store.close()
+    if mongo_client is not None:
          try:
             mongo_client.close()
-            print("MongoDB connection closed.")
+            logger.info("MongoDB connection closed.")
          except Exception as e:
-            print(f"Error closing MongoDB connection: {e}")
-    print("Shutdown complete.")
+            logger.error(f"Error closing MongoDB connection: {e}")
+    logger.info("Shutdown complete.")
+    shutdown_logging()
 
 # Assign lifespan to the app
 app.router.lifespan_context = lifespan
@@ -136,37 +301,117 @@ app.router.lifespan_context = lifespan
 # Request Models
 class RequirementRequest(BaseModel):
     requirement: str
+    projectId: Optional[str] = None # Re-plan an existing project instead of starting a new one
+    bypass_cache: bool = False # Skip the plan cache lookup (a fresh plan still refreshes the cache)
+    planning_mode: Optional[Literal['sequential', 'combined']] = None # Defaults to PLANNER_MODE
 
 class TasksRequest(BaseModel):
     tasks: List[str]
     project_type: Optional[str] = None # Add project_type field
+    compression_level: Optional[int] = Field(default=None, ge=0, le=9) # 0 = store only, 9 = smallest archive
+    stream: Optional[bool] = None # Stream Gemini output and parse files incrementally (default: DEVBOT_STREAM)
+    chunked: Optional[bool] = None # Generate a file manifest, then the files in parallel batches (default: DEVBOT_CHUNKED)
+    bypass_cache: bool = False # Regenerate even if the project cache has these tasks
+    projectId: Optional[str] = None # Returned by /api/process-requirement; a new id is assigned if missing
 
 class GitHubRequest(BaseModel):
     repoName: str
+    projectId: Optional[str] = None # Project whose generated files are pushed
     tasks: Optional[List[str]] = []
 
 class GitHubTokenRequest(BaseModel):
     token: str
 
+def queue_full_response(error: QueueFullError) -> JSONResponse:
+    """503 with Retry-After for requests rejected by the LLM scheduler."""
+    record_failure("queue_full")
+    return JSONResponse(
+        status_code=503,
+        content={"success": False, "error": str(error), "retryAfter": error.retry_after},
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+def quota_exceeded_response(error: QuotaExceededError) -> JSONResponse:
+    """429 with Retry-After (seconds until the quota resets) for clients over their token quota."""
+    record_failure("quota")
+    return JSONResponse(
+        status_code=429,
+        content={"success": False, "error": str(error), "retryAfter": error.retry_after},
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+def upstream_unavailable_response(error: str, retry_after: float) -> JSONResponse:
+    """503 with Retry-After while the Gemini circuit breaker is open."""
+    retry_after = max(1, math.ceil(retry_after))
+    return JSONResponse(
+        status_code=503,
+        content={"success": False, "error": error, "retryAfter": retry_after},
+        headers={"Retry-After": str(retry_after)}
+    )
+
+async def generate_project_files(tasks: List[str], project_type: str, bypass_cache: bool = False, **kwargs) -> Dict:
+    """Serves cached projects directly; everything else goes through the LLM scheduler."""
+    if not bypass_cache:
+        cached = await services['dev_bot'].get_cached_project(tasks, project_type, kwargs.get('progress'))
+        if cached is not None:
+            return cached
+    return await services['dev_bot'].generate_project(tasks, project_type, use_cache=False, **kwargs)
+
+def zip_streaming_response(result: Dict, compression_level: Optional[int] = None, headers: Optional[Dict] = None) -> Response:
+    """Streams the generated files as a ZIP archive while it is being compressed."""
+    zip_filename = result.get('zip_filename', 'generated_project.zip')
+    response_headers = {"Content-Disposition": f"attachment; filename={zip_filename}"}
+    response_headers.update(headers or {})
+    if compression_level is None and result.get('archive'):
+        # Cached archive built with the default compression level
+        return Response(content=result['archive'], media_type='application/zip', headers=response_headers)
+    return StreamingResponse(
+        timed_iterator("archive", stream_zip(result['files_created'], compression_level)),
+        media_type='application/zip',
+        headers=response_headers
+    )
+
 @app.post("/api/process-requirement")
 async def process_requirement(req: RequirementRequest):
     try:
-        print(f"Processing requirement: {req.requirement}")
+        logger.info(f"Processing requirement ({len(req.requirement)} chars)")
+        logger.debug(f"Requirement: {req.requirement}")
         if not services['task_planner']:
             raise ValueError("Task planner service is not initialized")
             
-        result = await services['task_planner'].break_down_tasks(req.requirement)
-        print(f"Generated analysis: {result}")
+        # Cache hits are answered directly, without waiting for an LLM worker
+        result = None if req.bypass_cache else await services['task_planner'].get_cached(req.requirement)
+        cached = result is not None
+        if not cached:
+            result = await services['task_planner'].break_down_tasks(req.requirement, use_cache=False, mode=req.planning_mode)
+        logger.info(f"Generated analysis (cached: {cached}): {len(result.get('goals', []))} goals")
+        logger.debug(f"Analysis: {result}")
+
+        # Save the analysis under the project id so later steps can find it
+        project_id = req.projectId or new_project_id()
+        try:
+            records = await get_project_records()
+            if records is not None:
+                await records.save_analysis(project_id, req.requirement, result['goals'], result['tech_stack'])
+        except Exception as mongo_error:
+            record_failure("mongo")
+            logger.error(f"MongoDB error: {str(mongo_error)}")
         
         return {
             'success': True,
+            'projectId': project_id,
             'tasks': result['goals'],  # Using the new 'goals' key
-            'techStack': result['tech_stack']
+            'techStack': result['tech_stack'],
+            'cached': cached
         }
+    except QueueFullError as e:
+        return queue_full_response(e)
+    except QuotaExceededError as e:
+        return quota_exceeded_response(e)
+    except CircuitOpenError as e:
+        return upstream_unavailable_response(str(e), e.retry_after)
     except Exception as e:
-        print(f"Error processing requirement: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Error processing requirement: {str(e)}")
         return JSONResponse(
             status_code=500,
             content={"success": False, "error": str(e)}
@@ -181,7 +426,8 @@ async def generate_code(req: TasksRequest):
                 content={"success": False, "error": "No tasks provided"}
             )
 
-        print(f"Generating code for tasks: {req.tasks}")
+        logger.info(f"Generating code for {len(req.tasks)} tasks")
+        logger.debug(f"Tasks: {req.tasks}")
 
         # Check if DevBot is initialized
         if not services.get('dev_bot'):
@@ -192,74 +438,213 @@ async def generate_code(req: TasksRequest):
 
         # Determine project type: Prioritize request body, fallback to generic
         project_type = req.project_type if req.project_type else 'generic'
-        print(f"Using project type: {project_type}")
+        logger.info(f"Using project type: {project_type}")
 
         # Generate project files using the determined project_type
-        result = await services['dev_bot'].generate_project(req.tasks, project_type)
+        result = await generate_project_files(req.tasks, project_type, bypass_cache=req.bypass_cache, stream=req.stream, chunked=req.chunked)
         # Avoid logging potentially large result content unless debugging
-        print(f"generate_project result success: {result.get('success')}")
+        logger.info(f"generate_project result success: {result.get('success')}")
         if result.get('error'):
-             print(f"generate_project error: {result.get('error')}")
+             logger.error(f"generate_project error: {result.get('error')}")
 
 
         if not result.get('success'):
+            if result.get('retry_after') is not None:
+                return upstream_unavailable_response(result['error'], result['retry_after'])
             return JSONResponse(
                 status_code=500,
                 content={"success": False, "error": "Failed to generate project files"}
             )
 
         # Save info to MongoDB
+        project_id = req.projectId or new_project_id()
+        raw_files_created = result.get('files_created')
+        processed_files_created = raw_files_created if isinstance(raw_files_created, dict) else {}
         try:
-            raw_files_created = result.get('files_created')
-            processed_files_created = raw_files_created if isinstance(raw_files_created, dict) else {}
-            await safe_insert_one({
-                'tasks': req.tasks,
-                'generated_at': datetime.datetime.utcnow(),
-                'files_created': processed_files_created
-            })
-            print("Saved project details to MongoDB successfully")
+            records = await get_project_records()
+            if records is not None:
+                records.save_generation(project_id, req.tasks, processed_files_created, result.get('workspace_id'))
+                logger.info("Saved project details to MongoDB successfully")
         except Exception as mongo_error:
-            print(f"MongoDB error: {str(mongo_error)}")
-
-        # Return the ZIP file for download
-        zip_path = result['zip_file']
-        if os.path.exists(zip_path):
-            response = FileResponse(
-                path=zip_path,
-                media_type='application/zip',
-                filename=os.path.basename(zip_path),
+            record_failure("mongo")
+            logger.error(f"MongoDB error: {str(mongo_error)}")
+
+        # Stream the ZIP archive for download straight from the generated contents
+        if processed_files_created:
+            return zip_streaming_response(
+                result,
+                req.compression_level,
                 headers={
-                    "Content-Disposition": f"attachment; filename={os.path.basename(zip_path)}",
-                    "Access-Control-Expose-Headers": "Content-Disposition"
+                    "X-Project-Id": project_id,
+                    "Access-Control-Expose-Headers": "Content-Disposition, X-Project-Id"
                 }
             )
-            
-            # Clean up the ZIP file after sending
-            def cleanup_zip(zip_path=zip_path):
-                try:
-                    if os.path.exists(zip_path):
-                        os.remove(zip_path)
-                        print(f"Cleaned up ZIP file: {zip_path}")
-                except Exception as e:
-                    print(f"Error cleaning up ZIP file: {str(e)}")
-            
-            response.background = cleanup_zip
-            return response
         else:
             return JSONResponse(
                 status_code=500,
                 content={"success": False, "error": "ZIP file not found"}
             )
 
+    except QueueFullError as e:
+        return queue_full_response(e)
+    except QuotaExceededError as e:
+        return quota_exceeded_response(e)
     except Exception as e:
-        print(f"Error generating code: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Error generating code: {str(e)}")
         return JSONResponse(
             status_code=500,
             content={"success": False, "error": str(e)}
         )
 
+async def run_generation_job(job, req: TasksRequest, project_id: str, pending_result):
+    """Waits for a scheduled code generation, publishing progress events as it goes."""
+    try:
+        result = await pending_result
+        if not result.get('success'):
+            logger.warning(f"Generation job {job.id} failed: {result.get('error')}")
+            if result.get('retry_after') is not None:
+                job.fail(result['error'])  # Gemini is down; tell the client when to retry
+            else:
+                job.fail("Failed to generate project files")
+            return
+
+        files_created = result.get('files_created') or {}
+        missing_files = result.get('missing_files') or []
+        job.progress('files_ready', total=len(files_created), missing=len(missing_files))
+
+        # Save info to MongoDB; a background job can wait for the batch, so write errors are caught here
+        try:
+            records = await get_project_records()
+            if records is not None:
+                await records.save_generation(project_id, req.tasks, files_created, result.get('workspace_id'))
+        except Exception as mongo_error:
+            record_failure("mongo")
+            logger.error(f"MongoDB error: {str(mongo_error)}")
+
+        # Build the archive off the event loop so it is ready when the client asks for it
+        zip_bytes = result.get('archive') if req.compression_level is None else None
+        if not zip_bytes:
+            loop = asyncio.get_running_loop()
+            with timed("archive"):
+                zip_bytes = await loop.run_in_executor(None, build_zip, files_created, req.compression_level)
+        download_url = f"/api/jobs/{job.id}/download"
+        await jobs.save_archive(job, zip_bytes)  # Any worker can serve the download
+        job.publish('archive_ready', size=len(zip_bytes), downloadUrl=download_url)
+        job.succeed(
+            {'zip_bytes': zip_bytes, 'zip_filename': result.get('zip_filename', 'generated_project.zip')},
+            downloadUrl=download_url,
+            projectId=project_id,
+            files=len(files_created),
+            missingFiles=missing_files,
+            truncated=bool(result.get('truncated'))
+        )
+    except asyncio.CancelledError:
+        job.fail("Job cancelled")
+        raise
+    except Exception as e:
+        logger.error(f"Error in generation job {job.id}: {str(e)}")
+        job.fail(str(e))
+
+@app.post("/api/jobs/generate-code", status_code=202)
+async def create_generate_code_job(req: TasksRequest):
+    """Starts code generation in the background and returns the job id immediately."""
+    if not req.tasks:
+        return JSONResponse(
+            status_code=400,
+            content={"success": False, "error": "No tasks provided"}
+        )
+    if not services.get('dev_bot'):
+        return JSONResponse(
+            status_code=503,
+            content={"success": False, "error": "Code generation service (DevBot) is not available. Check API key."}
+        )
+
+    project_type = req.project_type if req.project_type else 'generic'
+    project_id = req.projectId or new_project_id()
+    job = jobs.create()
+    cached = None
+    if not req.bypass_cache:
+        cached = await services['dev_bot'].get_cached_project(req.tasks, project_type, job.progress)
+    if cached is not None:
+        pending_result = asyncio.get_running_loop().create_future()
+        pending_result.set_result(cached)
+    else:
+        try:
+            # Admission happens here so a full queue is reported before a job id is handed out
+            pending_result = services['dev_bot'].generate_project(
+                req.tasks, project_type, stream=req.stream, chunked=req.chunked, progress=job.progress, use_cache=False
+            )
+        except QueueFullError as e:
+            jobs.discard(job.id)
+            return queue_full_response(e)
+        except QuotaExceededError as e:
+            jobs.discard(job.id)
+            return quota_exceeded_response(e)
+        job.publish('queued', queueDepth=llm_scheduler.stats()['queue_depth'])
+    await jobs.synced(job)  # Other workers may get the follow-up requests for this job
+    jobs.run(job, run_generation_job(job, req, project_id, pending_result))
+    return {
+        'success': True,
+        'jobId': job.id,
+        'projectId': project_id,
+        'eventsUrl': f"/api/jobs/{job.id}/events",
+        'downloadUrl': f"/api/jobs/{job.id}/download"
+    }
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await jobs.find(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"success": False, "error": "Job not found"})
+    return {'success': True, **job.snapshot()}
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Server-Sent Events stream of a job's progress, replayed from the start (or Last-Event-ID)."""
+    job = await jobs.find(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"success": False, "error": "Job not found"})
+
+    try:
+        after = int(request.headers.get('last-event-id', 0))
+    except ValueError:
+        after = 0
+
+    async def event_stream():
+        async for event in job.follow(after):
+            if await request.is_disconnected():
+                break
+            yield format_sse(event)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/jobs/{job_id}/download")
+async def download_job_archive(job_id: str):
+    job = await jobs.find(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"success": False, "error": "Job not found"})
+    if job.status != 'succeeded':
+        return JSONResponse(
+            status_code=409,
+            content={"success": False, "error": f"Job is {job.status}", "status": job.status}
+        )
+    zip_bytes = await jobs.load_archive(job)
+    if zip_bytes is None:
+        return JSONResponse(status_code=404, content={"success": False, "error": "Archive expired"})
+    zip_filename = job.snapshot()['zipFilename']
+    return Response(
+        content=zip_bytes,
+        media_type='application/zip',
+        headers={
+            "Content-Disposition": f"attachment; filename={zip_filename}",
+            "Access-Control-Expose-Headers": "Content-Disposition"
+        }
+    )
+
 @app.post("/api/generate-project")
 async def generate_project(req: TasksRequest):
     try:
@@ -269,7 +654,8 @@ async def generate_project(req: TasksRequest):
                 content={"success": False, "error": "No tasks provided"}
             )
 
-        print(f"Generating project for tasks: {req.tasks}")
+        logger.info(f"Generating project for {len(req.tasks)} tasks")
+        logger.debug(f"Tasks: {req.tasks}")
 
         # Check if DevBot is initialized
         if not services.get('dev_bot'):
@@ -278,56 +664,69 @@ async def generate_project(req: TasksRequest):
                 content={"success": False, "error": "Code generation service (DevBot) is not available. Check API key."}
             )
 
-        # Get the latest analysis from MongoDB to determine project type
-        try:
-            latest_analysis = await safe_find_one(sort_params=[('_id', -1)])
-            if latest_analysis:
-                project_type = latest_analysis.get('tech_stack', {}).get('app_type', 'generic')
-                print(f"Retrieved project type: {project_type}")
-            else:
-                project_type = 'generic'
-        except Exception as mongo_error:
-            print(f"MongoDB error: {str(mongo_error)}")
-            project_type = 'generic'
+        # Get the project's analysis from MongoDB to determine project type
+        project_id = req.projectId or new_project_id()
+        project_type = req.project_type or 'generic'
+        if req.projectId:
+            try:
+                records = await get_project_records()
+                analysis = await records.get(project_id, ['tech_stack']) if records is not None else None
+                if analysis and analysis.get('tech_stack'):
+                    project_type = analysis['tech_stack'].get('app_type', project_type)
+                    logger.info(f"Retrieved project type: {project_type}")
+            except Exception as mongo_error:
+                record_failure("mongo")
+                logger.error(f"MongoDB error: {str(mongo_error)}")
 
         # Generate project structure and code
-        result = await services['dev_bot'].generate_project(req.tasks, project_type)
+        result = await generate_project_files(req.tasks, project_type, bypass_cache=req.bypass_cache, stream=req.stream, chunked=req.chunked)
+        if result.get('retry_after') is not None:
+            return upstream_unavailable_response(result['error'], result['retry_after'])
 
         # Save to MongoDB
+        raw_files_created_project = result.get('files_created')
+        processed_files_created_project = raw_files_created_project if isinstance(raw_files_created_project, dict) else {}
         try:
-            raw_files_created_project = result.get('files_created')
-            processed_files_created_project = raw_files_created_project if isinstance(raw_files_created_project, dict) else {}
-            await safe_insert_one({
-                'tasks': req.tasks,
-                'tree_structure': result.get('tree_structure'), # Use .get for safety
-                'zip_file': result.get('zip_file'),         # Use .get for safety
-                'files_created': processed_files_created_project # Add files_created here, ensuring it's a dict
-            })
-            print("Saved project details to MongoDB successfully")
+            records = await get_project_records()
+            if records is not None:
+                records.save_generation(
+                    project_id,
+                    req.tasks,
+                    processed_files_created_project, # Ensuring it's a dict
+                    workspace_id=result.get('workspace_id'), # Use .get for safety
+                    tree_structure=result.get('tree_structure')
+                )
+                logger.info("Saved project details to MongoDB successfully")
         except Exception as mongo_error:
-            print(f"MongoDB error: {str(mongo_error)}")
+            record_failure("mongo")
+            logger.error(f"MongoDB error: {str(mongo_error)}")
 
         # Provide the ZIP file for download
-        zip_path = result['zip_file']
-        if os.path.exists(zip_path):
-            return FileResponse(zip_path, media_type='application/zip', filename=os.path.basename(zip_path))
+        if processed_files_created_project:
+            return zip_streaming_response(
+                result,
+                req.compression_level,
+                headers={"X-Project-Id": project_id, "Access-Control-Expose-Headers": "Content-Disposition, X-Project-Id"}
+            )
         else:
             return JSONResponse(
                 status_code=500,
                 content={"success": False, "error": "ZIP file not found"}
             )
 
+    except QueueFullError as e:
+        return queue_full_response(e)
+    except QuotaExceededError as e:
+        return quota_exceeded_response(e)
     except Exception as e:
-        print(f"Error generating project: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Error generating project: {str(e)}")
         return JSONResponse(
             status_code=500,
             content={"success": False, "error": str(e)}
         )
 
 @app.post("/api/push-to-github")
-async def push_to_github(req: GitHubRequest):
+async def push_to_github(req: GitHubRequest, request: Request):
     try:
         if not req.repoName:
             return JSONResponse(
@@ -335,70 +734,97 @@ async def push_to_github(req: GitHubRequest):
                 content={"success": False, "error": "No repository name provided"}
             )
 
-        print(f"Pushing to GitHub repo: {req.repoName}")
+        if not req.projectId:
+            return JSONResponse(
+                status_code=400,
+                content={"success": False, "error": "No project id provided"}
+            )
+
+        logger.info(f"Pushing project {req.projectId} to GitHub repo: {req.repoName}")
         
-        # Get latest files from MongoDB
+        # Get the project's files from MongoDB
         try:
-            latest_files = await safe_find_one(sort_params=[('_id', -1)])
-            if not latest_files:
+            records = await get_project_records()
+            if records is None:
+                raise RuntimeError("MongoDB is not available")
+            files_to_push = await records.get_files(req.projectId)
+            if not files_to_push:
                 return JSONResponse(
                     status_code=404,
                     content={"success": False, "error": "No files found to push"}
                 )
+        except MissingBlobsError as e:
+            logger.error(str(e))
+            return JSONResponse(
+                status_code=410,
+                content={"success": False, "error": "Some of the project's files have expired. Generate the project again before pushing."}
+            )
         except Exception as mongo_error:
-            print(f"MongoDB error: {str(mongo_error)}")
+            record_failure("mongo")
+            logger.error(f"MongoDB error: {str(mongo_error)}")
             return JSONResponse(
                 status_code=500,
                 content={"success": False, "error": f"MongoDB error: {str(mongo_error)}"}
             )
 
+        github = await get_github_agent(request)
+        if github is None:
+            if request.cookies.get(SESSION_COOKIE):
+                error = "Your GitHub token has expired. Set it again with /api/update-github-token."
+            else:
+                error = "No GitHub token configured. Set one with /api/update-github-token."
+            return JSONResponse(status_code=401, content={"success": False, "error": error})
+
         # Create repository and push files
-        repo_url = await services['github'].create_repository(req.repoName)
-        
-        # Check for 'files_created' key and ensure it's a dictionary
-        files_to_push = latest_files.get('files_created')
-        if not files_to_push or not isinstance(files_to_push, dict):
-            return JSONResponse(
-                status_code=404, # Or 400 Bad Request if the data format is wrong
-                content={"success": False, "error": "No valid file data (files_created) found in the latest record to push."}
-            )
-            
-        await services['github'].push_files(req.repoName, files_to_push)
-        
-        # Create issues for tasks
-        if req.tasks:
-            await services['github'].create_issues(req.repoName, req.tasks)
+        try:
+            with timed("github_push"):
+                repo_url = await github.create_repository(req.repoName)
+
+                await github.push_files(req.repoName, files_to_push)
+
+                # Create issues for tasks
+                if req.tasks:
+                    await github.create_issues(req.repoName, req.tasks)
+        except Exception:
+            record_failure("github")
+            raise
         
-        print(f"Successfully pushed to GitHub: {repo_url}")
+        logger.info(f"Successfully pushed to GitHub: {repo_url}")
         return {
             'success': True,
             'repoUrl': repo_url
         }
     except Exception as e:
-        print(f"Error pushing to GitHub: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Error pushing to GitHub: {str(e)}")
         return JSONResponse(
             status_code=500,
             content={"success": False, "error": str(e)}
         )
 
 @app.post("/api/update-github-token")
-async def update_github_token(req: GitHubTokenRequest):
+async def update_github_token(req: GitHubTokenRequest, request: Request, response: Response):
     try:
         # Initialize new GitHub agent with the token
         github_agent = GitHubAgent(req.token)
-        # Verify token by trying to get the authenticated user
-        github_agent.github.get_user().login
+        # Verify token by trying to get the authenticated user (off the event loop)
+        await github_agent.verify()
         
-        # If we got here, token is valid
-        services['github'] = github_agent
+        # If we got here, token is valid; it applies to a new session (on every worker), whose
+        # id only this caller gets, in an HttpOnly cookie
+        previous = request.cookies.get(SESSION_COOKIE)
+        if previous:
+            await github_tokens.delete(previous)
+        session_id = new_session_id()
+        await github_tokens.put(session_id, req.token)
+        github_agents.set(session_id, github_agent)
+        response.set_cookie(SESSION_COOKIE, session_id, max_age=int(GITHUB_TOKEN_TTL_SECONDS), httponly=True,
+                            secure=request.url.scheme == 'https', samesite='lax')
         return {
             'success': True,
             'message': 'GitHub token updated successfully'
         }
     except Exception as e:
-        print(f"Error updating GitHub token: {str(e)}")
+        logger.error(f"Error updating GitHub token: {str(e)}")
         return JSONResponse(
             status_code=400,
             content={
@@ -408,7 +834,7 @@ async def update_github_token(req: GitHubTokenRequest):
         )
 
 @app.post('/api/generate')
-async def generate_project(tasks: List[str], project_type: str):
+async def generate_project(tasks: List[str], project_type: str, compression_level: Optional[int] = Query(default=None, ge=0, le=9)):
     try:
         if not tasks or not project_type:
             raise HTTPException(status_code=400, detail='Missing required fields')
@@ -417,42 +843,135 @@ async def generate_project(tasks: List[str], project_type: str):
         if not services.get('dev_bot'):
              raise HTTPException(status_code=503, detail="Code generation service (DevBot) is not available.")
 
-        result = await services['dev_bot'].generate_project(tasks, project_type)
+        result = await generate_project_files(tasks, project_type)
 
+        if result.get('retry_after') is not None:
+            return upstream_unavailable_response(result['error'], result['retry_after'])
         if not result.get('success'):
             raise HTTPException(status_code=500, detail=result.get('error', 'Unknown error during project generation'))
 
-        # Check if the ZIP file exists
-        if not os.path.exists(result['zip_file']):
+        # Check that there is something to archive
+        if not result.get('files_created'):
             raise HTTPException(status_code=500, detail='Failed to create ZIP file')
 
         try:
-            return FileResponse(
-                path=result['zip_file'],
-                media_type='application/zip',
-                filename='generated_project.zip'
-            )
+            return zip_streaming_response(result, compression_level)
         except Exception as e:
-            app.logger.error(f"Error sending file: {str(e)}")
+            logger.error(f"Error sending file: {str(e)}")
             raise HTTPException(status_code=500, detail='Failed to send generated files')
 
+    except QueueFullError as e:
+        return queue_full_response(e)
+    except QuotaExceededError as e:
+        return quota_exceeded_response(e)
     except Exception as e:
-        app.logger.error(f"Error in generate_project route: {str(e)}", exc_info=True)
+        logger.exception(f"Error in generate_project route: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/cache")
+async def cache_stats():
+    """Hit/miss counters of the response caches"""
+    planner = services.get('task_planner')
+    dev_bot = services.get('dev_bot')
+    return {
+        'planner': planner.cache.stats() if planner is not None and planner.cache is not None else None,
+        'projects': dev_bot.project_cache.stats() if dev_bot is not None and dev_bot.project_cache is not None else None
+    }
+
+@app.get("/api/queue")
+async def queue_stats():
+    """Queue depth, wait times and rejections of the LLM scheduler, and Gemini circuit breaker state"""
+    return {**llm_scheduler.stats(), 'gemini': gemini_resilience.stats()}
+
+@app.get("/api/usage")
+async def usage_stats():
+    """The calling client's Gemini token usage, cost estimate and remaining daily quota"""
+    return usage_ledger.client_stats(client_var.get())
+
+def collect_service_metrics():
+    """Scheduler, circuit breaker, cache, MongoDB store and log queue stats as Prometheus metrics."""
+    queue = llm_scheduler.stats()
+    yield 'codegen_llm_queue_depth', 'gauge', 'Jobs waiting for an LLM worker', [({}, queue['queue_depth'])]
+    yield 'codegen_llm_running', 'gauge', 'Jobs running on LLM workers', [({}, queue['running'])]
+    yield 'codegen_llm_jobs_total', 'counter', 'LLM scheduler jobs by outcome', [
+        ({'result': result}, queue[result]) for result in ('completed', 'failed', 'rejected')
+    ]
+    yield 'codegen_llm_coalesced_total', 'counter', 'Calls that joined an identical in-flight job', [({}, queue['coalesced'])]
+    breaker = gemini_resilience.stats()
+    yield 'codegen_gemini_circuit_state', 'gauge', 'Gemini circuit breaker state (1 for the current state)', [
+        ({'state': state}, int(breaker['state'] == state)) for state in ('closed', 'open', 'half_open')
+    ]
+    yield 'codegen_gemini_retries_total', 'counter', 'Retried Gemini requests', [({}, breaker['retries'])]
+    yield 'codegen_gemini_hedges_total', 'counter', 'Hedged Gemini requests', [({}, breaker['hedges'])]
+
+    planner = services.get('task_planner')
+    dev_bot = services.get('dev_bot')
+    caches = {
+        'plan': planner.cache if planner is not None else None,
+        'project': dev_bot.project_cache if dev_bot is not None else None,
+    }
+    samples = []
+    for name, cache in caches.items():
+        if cache is not None:
+            stats = cache.stats()
+            samples.append(({'cache': name, 'result': 'hit'}, stats['hits']))
+            samples.append(({'cache': name, 'result': 'miss'}, stats['misses']))
+    yield 'codegen_cache_requests_total', 'counter', 'Response cache lookups', samples
+
+    if mongo_store is not None:
+        stats = mongo_store.stats()
+        yield 'codegen_mongo_pending_writes', 'gauge', 'Writes queued for the next MongoDB batch', [({}, stats['pending'])]
+        yield 'codegen_mongo_writes_total', 'counter', 'Batched MongoDB writes by outcome', [
+            ({'result': 'written'}, stats['written']), ({'result': 'failed'}, stats['failed'])
+        ]
+
+    usage = usage_ledger.stats()
+    yield 'codegen_client_tokens_total', 'counter', 'Gemini tokens by client since startup', [
+        ({'client': client, 'kind': kind}, totals[f'{kind}_tokens'])
+        for client, totals in usage['clients'].items() for kind in ('prompt', 'output')
+    ]
+    yield 'codegen_client_tokens_today', 'gauge', 'Gemini tokens by client since UTC midnight (counted against quotas)', [
+        ({'client': client}, totals['tokens_today']) for client, totals in usage['clients'].items()
+    ]
+    yield 'codegen_quota_rejections_total', 'counter', 'Requests rejected because the client was over its token quota', [
+        ({}, usage['rejected'])
+    ]
+
+    yield 'codegen_log_dropped_records_total', 'counter', 'Log records dropped because the log queue was full', [
+        ({}, dropped_records())
+    ]
+
+metrics_registry.add_collector(collect_service_metrics)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage latency histograms, token and failure counters, service stats"""
+    return Response(content=metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Serve the main frontend HTML page
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    """Health check endpoint for monitoring"""
+    """Health check endpoint for monitoring (liveness: answers as soon as the app is up)"""
     return {
         "status": "healthy",
+        "ready": startup_state['ready'],
         "mongodb": services['mongodb'] is not None,
         "task_planner": services['task_planner'] is not None,
         "dev_bot": services['dev_bot'] is not None,
         "github": services['github'] is not None
     }
 
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: 503 until background service startup has finished"""
+    body = {
+        "ready": startup_state['ready'],
+        "startup_seconds": startup_state['duration_seconds'],
+        "services": startup_state['services'],
+    }
+    return JSONResponse(body, status_code=200 if startup_state['ready'] else 503)
+
 # Mount frontend files (CSS, JS, HTML) at the end to avoid conflicts with API routes
 app.mount("/", StaticFiles(directory=str(frontend_dir), html=True), name="frontend")
 
@@ -0,0 +1,68 @@
+"""Single-call vs chunked project generation against the fake Gemini.
+
+Usage (from backend/):
+    python benchmarks/bench_chunked_generation.py [--sizes 4,12,24,48] [--ms-per-file 150]
+
+Output time of the fake grows with the number of files in a response
+(--ms-per-file) and responses with more than --max-output-files files are
+truncated, like a response that hit maxOutputTokens. Single-call generation
+therefore slows down linearly and eventually fails on large projects, while
+chunked generation is bounded by its slowest batch.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.dev_bot import DevBot  # noqa: E402
+from benchmarks.fake_gemini import create_app  # noqa: E402
+
+
+async def generate(fake_app, chunked: bool, chunk_files: int, concurrency: int):
+    bot = DevBot("benchmark-key", client=httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_app)))
+    bot.chunk_files = chunk_files
+    bot.chunk_concurrency = concurrency
+    start = time.perf_counter()
+    result = await bot.generate_project(["Build the benchmark project"], "python", stream=False,
+                                        use_cache=False, chunked=chunked)
+    elapsed = time.perf_counter() - start
+    await bot.close()
+    return elapsed, len(result.get("files_created") or {}) if result.get("success") else 0
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="4,12,24,48", help="Comma-separated project sizes (files)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--ms-per-file", type=float, default=150)
+    parser.add_argument("--max-output-files", type=int, default=20)
+    parser.add_argument("--chunk-files", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    import logging
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    print(f"{'files':>6}{'mode':>10}{'mean s':>9}{'files ok':>10}")
+    for size in (int(value) for value in args.sizes.split(",")):
+        for chunked in (False, True):
+            timings, generated = [], []
+            for run in range(args.runs):
+                fake_app = create_app(latency_ms=args.latency_ms, seed=run, project_files=size,
+                                      ms_per_file=args.ms_per_file, max_output_files=args.max_output_files)
+                elapsed, files = await generate(fake_app, chunked, args.chunk_files, args.concurrency)
+                timings.append(elapsed)
+                generated.append(files)
+            mode = "chunked" if chunked else "single"
+            print(f"{size:>6}{mode:>10}{statistics.mean(timings):>9.2f}{min(generated):>7}/{size:<2}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+"""Parse success and speed of the LLM JSON extractor vs the old fence regex.
+
+Usage (from backend/):
+    python benchmarks/bench_json_extract.py [--corpus DIR] [--files 40] [--repeat 20]
+
+Without --corpus, responses are synthesized for each defect class seen from
+Gemini (fences, prose, nested objects, trailing commas, raw newlines,
+truncation). A truncated response is never counted as fully recovered,
+even when every entry before the cut is kept. To benchmark real responses, run the app with
+GEMINI_CAPTURE_DIR=some/dir for a while and pass that directory: every
+*.txt file in it is parsed (no expected result, so only success, recovered
+entries and time are reported).
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.json_extract import recover_json  # noqa: E402
+from core.json_stream import extract_files  # noqa: E402
+
+
+def legacy_parse(text: str):
+    """The _clean_json_string + json.loads parsing the agents used before."""
+    match = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", text, re.DOTALL | re.IGNORECASE)
+    return json.loads(match.group(1).strip() if match else text.strip())
+
+
+def project_json(files: int, indent=None) -> str:
+    entries = [{
+        "name": f"src/module_{i}.js",
+        "content": f"// Module {i}\nexport function handler{i}(req) {{\n  if (!req) {{ return {{ \"error\": \"missing\" }}; }}\n"
+                   + "".join(f"  const value{j} = `${{req.id}}-{j}`;\n" for j in range(30)) + "}\n"
+    } for i in range(files)]
+    return json.dumps({"files": entries}, indent=indent)
+
+
+def synthetic_corpus(files: int):
+    """(name, text, expected file count or None for planner responses)."""
+    clean = project_json(files, indent=2)
+    plan = json.dumps({"tech_stack": {"language": "JavaScript", "frameworks": ["React"], "app_type": "Web App"},
+                       "goals": [f"Goal {i}" for i in range(1, 9)]}, indent=2)
+    raw_newlines = re.sub(r'\\n', '\n', clean)  # Unescaped newlines inside the content strings
+    trailing_commas = clean.replace('"\n    }', '",\n    }').replace('}\n  ]', '},\n  ]')
+    cut = clean[:int(len(clean) * 0.6)]
+    return [
+        ("bare", clean, files),
+        ("fenced", f"```json\n{clean}\n```", files),
+        ("prose+fenced", f"Here is your project:\n\n```json\n{clean}\n```\n\nLet me know if you need changes.", files),
+        ("nested plan", f"```json\n{plan}\n```", None),
+        ("trailing commas", f"```json\n{trailing_commas}\n```", files),
+        ("raw newlines", f"```json\n{raw_newlines}\n```", files),
+        ("truncated", f"```json\n{cut}", files),
+    ]
+
+
+def time_parser(parse, text: str, repeat: int):
+    try:
+        result = parse(text)
+    except ValueError:  # json.JSONDecodeError is a ValueError
+        result = None
+    start = time.perf_counter()
+    for _ in range(repeat):
+        try:
+            parse(text)
+        except ValueError:
+            pass
+    return result, (time.perf_counter() - start) / repeat * 1e6
+
+
+def recovered(result, is_files: bool) -> int:
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return sum(1 for entry in result if isinstance(entry, dict) and "content" in entry)
+    if is_files:
+        files = result.get("files") if isinstance(result, dict) else None
+        return recovered(files, True) if isinstance(files, list) else 0
+    return len(result) if isinstance(result, dict) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="Directory of captured raw responses (*.txt)")
+    parser.add_argument("--files", type=int, default=40, help="Files per synthetic project")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    if args.corpus:
+        cases = []
+        for path in sorted(glob.glob(os.path.join(args.corpus, "*.txt"))):
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            cases.append((os.path.basename(path)[:24], text, -1 if '"files"' in text else None))
+    else:
+        cases = synthetic_corpus(args.files)
+
+    print(f"{'response':<26}{'KB':>7}{'expected':>10}{'old':>6}{'new':>6}{'cut':>5}{'old us':>10}{'new us':>10}")
+    legacy_ok = new_ok = new_truncated = 0
+    for name, text, expected in cases:
+        is_files = expected is not None
+        new_parse = extract_files if is_files else recover_json
+        old_result, old_us = time_parser(legacy_parse, text, args.repeat)
+        new_result, new_us = time_parser(new_parse, text, args.repeat)
+        new_value, truncated = new_result if new_result is not None else (None, False)
+        old_count, new_count = recovered(old_result, is_files), recovered(new_value, is_files)
+        new_truncated += truncated
+        if expected is None:
+            expected = 2  # tech_stack and goals
+        if expected == -1:  # Captured response: no ground truth
+            legacy_ok += old_count > 0
+            new_ok += new_count > 0 and not truncated
+            expected_label = "?"
+        else:
+            legacy_ok += old_count == expected
+            new_ok += new_count == expected and not truncated
+            expected_label = str(expected)
+        print(f"{name:<26}{len(text) / 1024:>7.1f}{expected_label:>10}{old_count:>6}{new_count:>6}"
+              f"{'yes' if truncated else '':>5}{old_us:>10.0f}{new_us:>10.0f}")
+    print(f"\nFully recovered: old {legacy_ok}/{len(cases)}, new {new_ok}/{len(cases)}"
+          f" ({new_truncated} truncated, partially recovered)")
+
+
+if __name__ == "__main__":
+    main()
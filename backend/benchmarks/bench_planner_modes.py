@@ -0,0 +1,85 @@
+"""Compares sequential vs combined planning latency against a mocked Gemini API.
+
+Usage (from backend/):
+    python benchmarks/bench_planner_modes.py [--requests 200] [--latency-ms 400]
+
+Each mocked generateContent call sleeps for a log-normally distributed
+latency around --latency-ms, so the benchmark measures how the number of
+round-trips per plan affects p50/p95 end-to-end latency.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.task_planner import TaskPlannerAgent  # noqa: E402
+
+TECH_STACK = {"language": "JavaScript", "frameworks": ["React", "Express"], "app_type": "Web App"}
+GOALS = [f"Goal number {i}" for i in range(1, 9)]
+
+
+def make_handler(latency_ms: float, rng: random.Random):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        prompt = json.loads(request.content)["contents"][0]["parts"][0]["text"]
+        await asyncio.sleep(rng.lognormvariate(0, 0.35) * latency_ms / 1000)
+        if '"goals"' in prompt:
+            text = json.dumps({"tech_stack": TECH_STACK, "goals": GOALS})
+        elif "technical stack" in prompt:
+            text = json.dumps(TECH_STACK)
+        else:
+            text = "\n".join(f"{i}. {goal}" for i, goal in enumerate(GOALS, 1))
+        return httpx.Response(200, json={"candidates": [{"content": {"parts": [{"text": text}]}}]})
+    return handler
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run_mode(mode: str, requests: int, concurrency: int, latency_ms: float, seed: int):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(make_handler(latency_ms, random.Random(seed))))
+    planner = TaskPlannerAgent("benchmark-key", client=client)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            result = await planner.break_down_tasks(f"benchmark requirement {i}", use_cache=False, mode=mode)
+            latencies.append(time.perf_counter() - start)
+            assert result["tech_stack"] == TECH_STACK, result
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    await planner.close()
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=400)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"{'mode':<12}{'calls/plan':>12}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    for mode, calls in (("sequential", 2), ("combined", 1)):
+        latencies = await run_mode(mode, args.requests, args.concurrency, args.latency_ms, args.seed)
+        print(f"{mode:<12}{calls:>12}{percentile(latencies, 50) * 1000:>10.1f}"
+              f"{percentile(latencies, 95) * 1000:>10.1f}{statistics.mean(latencies) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
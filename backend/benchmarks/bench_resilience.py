@@ -0,0 +1,86 @@
+"""Planner success rate and latency against the fault-injecting fake Gemini.
+
+Usage (from backend/):
+    python benchmarks/bench_resilience.py [--requests 200] [--error-rate 0.2] [--slow-rate 0.05]
+
+Scenarios: no retries, retries with jittered backoff, retries plus hedging,
+and a full outage (where the circuit breaker should make requests fail fast
+instead of burning every retry).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.task_planner import TaskPlannerAgent  # noqa: E402
+from benchmarks.fake_gemini import GOALS, create_app  # noqa: E402
+from core.resilience import CircuitBreaker, CircuitOpenError, Resilience, RetryPolicy  # noqa: E402
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run_scenario(fake_app, attempts: int, hedge_ms: float, requests: int, concurrency: int):
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_app))
+    resilience = Resilience("gemini", CircuitBreaker("gemini", failure_threshold=5, reset_timeout=30),
+                            RetryPolicy(attempts=attempts, base_delay=0.05, max_delay=1.0))
+    planner = TaskPlannerAgent("benchmark-key", client=client, resilience=resilience)
+    planner.hedge_after = hedge_ms / 1000 or None
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, ok, fast_failures = [], 0, 0
+
+    async def one(i: int):
+        nonlocal ok, fast_failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result = await planner.break_down_tasks(f"benchmark requirement {i}", use_cache=False, mode="combined")
+                ok += len(result["goals"]) == len(GOALS)
+            except CircuitOpenError:
+                fast_failures += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    await planner.close()
+    return latencies, ok, fast_failures, resilience.stats()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=1000)
+    parser.add_argument("--hedge-ms", type=float, default=150)
+    args = parser.parse_args()
+
+    import logging
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    faults = dict(latency_ms=args.latency_ms, error_rate=args.error_rate, slow_rate=args.slow_rate, slow_ms=args.slow_ms)
+    scenarios = [
+        ("no retries", create_app(**faults), 1, 0),
+        ("retries", create_app(**faults), 3, 0),
+        ("retries+hedge", create_app(**faults), 3, args.hedge_ms),
+        ("outage", create_app(latency_ms=args.latency_ms, outage_seconds=3600), 3, 0),
+    ]
+    print(f"{'scenario':<15}{'ok %':>7}{'fast-fail':>10}{'p50 ms':>9}{'p95 ms':>9}{'mean ms':>9}{'retries':>9}{'hedges':>8}{'upstream':>10}")
+    for name, fake_app, attempts, hedge_ms in scenarios:
+        latencies, ok, fast, stats = await run_scenario(fake_app, attempts, hedge_ms, args.requests, args.concurrency)
+        print(f"{name:<15}{ok / args.requests * 100:>7.1f}{fast:>10}{percentile(latencies, 50) * 1000:>9.1f}"
+              f"{percentile(latencies, 95) * 1000:>9.1f}{statistics.mean(latencies) * 1000:>9.1f}"
+              f"{stats['retries']:>9}{stats['hedges']:>8}{fake_app.state.requests:>10}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
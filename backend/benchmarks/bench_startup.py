@@ -0,0 +1,63 @@
+"""Measures cold startup of the FastAPI app: import, time to serve, time to ready.
+
+Usage (from backend/):
+    python benchmarks/bench_startup.py [--runs 5] [--mongodb-uri mongodb://127.0.0.1:1]
+
+Every run imports app.py in a fresh interpreter and enters its lifespan.
+"serving" is when uvicorn could bind the port (lifespan startup returned);
+"ready" is when background service startup finished. The default MongoDB URI
+points at a closed port, so "ready" includes a full server selection timeout,
+which is exactly the delay that must not hold up "serving".
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import asyncio, json, time
+t0 = time.perf_counter()
+import app as application
+t_import = time.perf_counter()
+
+async def main():
+    async with application.app.router.lifespan_context(application.app):
+        t_serving = time.perf_counter()
+        await application.startup_task
+        t_ready = time.perf_counter()
+    return t_serving, t_ready
+
+t_serving, t_ready = asyncio.run(main())
+print(json.dumps({"import": t_import - t0, "serving": t_serving - t0, "ready": t_ready - t0}))
+"""
+
+
+def run_once(env):
+    output = subprocess.run([sys.executable, "-c", CHILD], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--mongodb-uri", default="mongodb://127.0.0.1:1")
+    parser.add_argument("--github-token", default="", help="Empty disables the GitHub check")
+    args = parser.parse_args()
+
+    env = dict(os.environ, MONGODB_URI=args.mongodb_uri, GITHUB_TOKEN=args.github_token,
+               GEMINI_API_KEY=os.environ.get("GEMINI_API_KEY", "benchmark-key"), PROJECT_CACHE="false")
+    results = [run_once(env) for _ in range(args.runs)]
+
+    print(f"{'phase':<10}{'median s':>10}{'max s':>10}")
+    for phase in ("import", "serving", "ready"):
+        values = [r[phase] for r in results]
+        print(f"{phase:<10}{statistics.median(values):>10.3f}{max(values):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Fault-injecting fake of the Gemini generateContent API.
+
+Run it as a local server and point the app at it:
+    python benchmarks/fake_gemini.py --port 8001 --error-rate 0.2 --slow-rate 0.05
+    GEMINI_API_BASE=http://127.0.0.1:8001/v1 uvicorn app:app
+
+or mount it in-process with httpx.ASGITransport(app=create_app(...)), as
+bench_resilience.py does. Responses are canned: planning prompts get a tech
+stack and goals, code generation prompts get a project of `project_files`
+files (or the manifest, or just the files of a chunked batch). Output time
+grows with `ms_per_file`, and responses with more than `max_output_files`
+files are cut off mid-JSON, like a response that hit maxOutputTokens.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TECH_STACK = {"language": "Python", "frameworks": ["FastAPI"], "app_type": "Web API"}
+GOALS = [f"Goal number {i}" for i in range(1, 9)]
+BATCH_MARKER = "Generate ONLY these files:"
+
+
+def file_names(count: int):
+    return [f"src/module_{i}.py" for i in range(1, count + 1)]
+
+
+def file_body(name: str, lines: int) -> str:
+    return f"# {name}\n" + "".join(f"def handler_{i}(request):\n    return {{'line': {i}}}\n\n" for i in range(lines))
+
+
+def answer_for(prompt: str, project_files: int = 2, file_lines: int = 20) -> Tuple[str, int]:
+    """Canned answer for a prompt, and how many files it generates."""
+    if "file manifest" in prompt:
+        manifest = [{"name": name, "description": f"Handlers for {name}"} for name in file_names(project_files)]
+        return json.dumps({"files": manifest}), 0
+    if BATCH_MARKER in prompt:
+        names = [line[2:].strip() for line in prompt.split(BATCH_MARKER, 1)[1].splitlines() if line.startswith("- ")]
+        return json.dumps({"files": [{"name": name, "content": file_body(name, file_lines)} for name in names]}), len(names)
+    if '"files"' in prompt:
+        files = [{"name": name, "content": file_body(name, file_lines)} for name in file_names(project_files)]
+        return json.dumps({"files": files}), project_files
+    if '"goals"' in prompt:
+        return json.dumps({"tech_stack": TECH_STACK, "goals": GOALS}), 0
+    if "technical stack" in prompt:
+        return json.dumps(TECH_STACK), 0
+    return "\n".join(f"{i}. {goal}" for i, goal in enumerate(GOALS, 1)), 0
+
+
+def create_app(latency_ms: float = 50, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+               slow_rate: float = 0.0, slow_ms: float = 2000, outage_seconds: float = 0.0, seed: int = 1,
+               project_files: int = 2, file_lines: int = 20, ms_per_file: float = 0.0,
+               max_output_files: Optional[int] = None) -> FastAPI:
+    """Builds the fake. Faults are drawn per request:
+
+    - error_rate: 503 responses
+    - rate_limit_rate: 429 responses with Retry-After: 1
+    - slow_rate: responses delayed by slow_ms (a latency tail for hedging)
+    - outage_seconds: every request fails with 503 for this long after startup
+    """
+    app = FastAPI()
+    rng = random.Random(seed)
+    started = time.monotonic()
+    app.state.requests = 0
+
+    async def fault():
+        app.state.requests += 1
+        if time.monotonic() - started < outage_seconds:
+            return JSONResponse({"error": {"code": 503, "message": "outage"}}, status_code=503)
+        roll = rng.random()
+        if roll < error_rate:
+            return JSONResponse({"error": {"code": 503, "message": "injected"}}, status_code=503)
+        if roll < error_rate + rate_limit_rate:
+            return JSONResponse({"error": {"code": 429, "message": "injected"}}, status_code=429,
+                                headers={"Retry-After": "1"})
+        delay = slow_ms if rng.random() < slow_rate else rng.lognormvariate(0, 0.35) * latency_ms
+        await asyncio.sleep(delay / 1000)
+        return None
+
+    @app.post("/v1/models/{model_method}")
+    async def generate(model_method: str, request: Request):
+        error = await fault()
+        if error is not None:
+            return error
+        body = await request.json()
+        prompt = body["contents"][0]["parts"][0]["text"]
+        text, files = answer_for(prompt, project_files, file_lines)
+        if max_output_files is not None and files > max_output_files:
+            text = text[:len(text) * max_output_files // files]  # Ran out of output tokens
+            files = max_output_files
+        await asyncio.sleep(files * ms_per_file / 1000)
+        # Roughly 4 characters per token
+        usage = {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4,
+                 "totalTokenCount": (len(prompt) + len(text)) // 4}
+        chunk = {"candidates": [{"content": {"parts": [{"text": text}]}}], "usageMetadata": usage}
+        if model_method.endswith(":streamGenerateContent"):
+            half = len(text) // 2
+            chunks = [{"candidates": [{"content": {"parts": [{"text": part}]}}]} for part in (text[:half], text[half:])]
+            chunks[-1]["usageMetadata"] = usage
+            return StreamingResponse((f"data: {json.dumps(c)}\n\n" for c in chunks), media_type="text/event-stream")
+        return chunk
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-ms", type=float, default=2000)
+    parser.add_argument("--outage-seconds", type=float, default=0.0)
+    parser.add_argument("--project-files", type=int, default=2)
+    parser.add_argument("--ms-per-file", type=float, default=0.0)
+    parser.add_argument("--max-output-files", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(create_app(args.latency_ms, args.error_rate, args.rate_limit_rate, args.slow_rate,
+                           args.slow_ms, args.outage_seconds, project_files=args.project_files,
+                           ms_per_file=args.ms_per_file, max_output_files=args.max_output_files),
+                host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
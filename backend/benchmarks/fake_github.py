@@ -0,0 +1,244 @@
+"""Fake of the GitHub REST endpoints GitHubAgent uses for issues and pushes, with rate-limit injection.
+
+Run it as a local server and point the app at it:
+    python benchmarks/fake_github.py --port 8002 --rate-limited-posts 3 --rate-limit-status 403
+    GITHUB_API_URL=http://127.0.0.1:8002 GITHUB_TOKEN=fake uvicorn app:app
+
+Every token is accepted (unless `valid_tokens` is given) and belongs to the user `fake-user`. Repositories
+exist once they are created or seeded. The first `rate_limited_posts` issue
+creations are answered with `rate_limit_status` (403 secondary rate limit or
+429) and a Retry-After of `retry_after` seconds. Issue lists are paginated
+like GitHub's (Link header) and filtered by `labels`, so tests can check how
+many pages a push reads. Every repository starts with one commit (a README)
+on `main`, and the Git Data endpoints (refs, commits, trees, blobs) keep
+real git SHAs, so tests can check how many blobs, trees and commits a push made.
+"""
+import argparse
+import hashlib
+import json
+import time
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+LOGIN = "fake-user"
+
+
+def create_app(rate_limited_posts: int = 0, rate_limit_status: int = 403, retry_after: float = 1,
+               seed_issues: Optional[Dict[str, List[Dict]]] = None, per_page: int = 30,
+               valid_tokens: Optional[List[str]] = None) -> FastAPI:
+    """Builds the fake. `seed_issues` maps "owner/repo" to issues ({"title", "labels"}) that already exist."""
+    app = FastAPI()
+    repos: Dict[str, List[Dict]] = {name: [] for name in (seed_issues or {})}
+    app.state.stats = {"issue_posts": 0, "rate_limited": 0, "issue_pages": 0, "created": [],
+                       "blob_posts": 0, "tree_posts": 0, "commit_posts": 0, "ref_updates": 0}
+    app.state.repos = repos
+    # "owner/repo" -> {"blobs": {sha: content}, "trees": {sha: {path: blob sha}}, "commits": {sha: commit}, "head": sha}
+    gits: Dict[str, Dict] = {}
+    app.state.gits = gits
+
+    def base(request: Request) -> str:
+        return str(request.base_url).rstrip("/")
+
+    def user_json(request: Request) -> Dict:
+        return {"login": LOGIN, "id": 1, "type": "User", "url": f"{base(request)}/users/{LOGIN}"}
+
+    def repo_json(request: Request, full_name: str) -> Dict:
+        owner, name = full_name.split("/")
+        return {
+            "id": abs(hash(full_name)) % 10**6, "name": name, "full_name": full_name,
+            "owner": {"login": owner, "id": 1, "type": "User"},
+            "url": f"{base(request)}/repos/{full_name}",
+            "html_url": f"https://github.example/{full_name}",
+            "default_branch": "main", "private": False,
+        }
+
+    def issue_json(request: Request, full_name: str, number: int, issue: Dict) -> Dict:
+        return {
+            "id": number, "number": number, "title": issue["title"], "body": issue.get("body", ""), "state": "open",
+            "labels": [{"name": label} for label in issue.get("labels", [])],
+            "url": f"{base(request)}/repos/{full_name}/issues/{number}",
+        }
+
+    def add_issue(full_name: str, issue: Dict) -> int:
+        repos[full_name].append(issue)
+        return len(repos[full_name])
+
+    def put_blob(git: Dict, content: str) -> str:
+        data = content.encode("utf-8")
+        sha = hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+        git["blobs"][sha] = content
+        return sha
+
+    def put_object(store: Dict, value: Dict) -> str:
+        sha = hashlib.sha1(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+        store[sha] = value
+        return sha
+
+    def put_commit(git: Dict, message: str, tree: str, parents: List[str]) -> str:
+        return put_object(git["commits"], {"message": message, "tree": tree, "parents": parents, "n": len(git["commits"])})
+
+    def add_repo(full_name: str) -> None:
+        repos.setdefault(full_name, [])
+        if full_name not in gits:
+            git = gits[full_name] = {"blobs": {}, "trees": {}, "commits": {}}
+            readme = put_blob(git, f"# {full_name.split('/')[1]}\n")
+            git["head"] = put_commit(git, "Initial commit", put_object(git["trees"], {"README.md": readme}), [])
+
+    for full_name, issues in (seed_issues or {}).items():
+        add_repo(full_name)
+        for issue in issues:
+            add_issue(full_name, issue)
+
+    @app.get("/user")
+    async def get_user(request: Request):
+        token = request.headers.get("authorization", "").partition(" ")[2]
+        if valid_tokens is not None and token not in valid_tokens:
+            return JSONResponse({"message": "Bad credentials"}, status_code=401)
+        return user_json(request)
+
+    @app.post("/user/repos")
+    async def create_repo(request: Request):
+        body = await request.json()
+        full_name = f"{LOGIN}/{body['name']}"
+        add_repo(full_name)
+        return JSONResponse(repo_json(request, full_name), status_code=201)
+
+    @app.get("/repos/{owner}/{name}")
+    async def get_repo(owner: str, name: str, request: Request):
+        full_name = f"{owner}/{name}"
+        if full_name not in repos:
+            return JSONResponse({"message": "Not Found"}, status_code=404)
+        return repo_json(request, full_name)
+
+    def git_url(request: Request, full_name: str, kind: str, sha: str) -> str:
+        return f"{base(request)}/repos/{full_name}/git/{kind}/{sha}"
+
+    def ref_json(request: Request, full_name: str) -> Dict:
+        head = gits[full_name]["head"]
+        return {"ref": "refs/heads/main", "url": git_url(request, full_name, "refs", "heads/main"),
+                "object": {"sha": head, "type": "commit", "url": git_url(request, full_name, "commits", head)}}
+
+    def commit_json(request: Request, full_name: str, sha: str) -> Dict:
+        commit = gits[full_name]["commits"][sha]
+        return {"sha": sha, "url": git_url(request, full_name, "commits", sha), "message": commit["message"],
+                "tree": {"sha": commit["tree"], "url": git_url(request, full_name, "trees", commit["tree"])},
+                "parents": [{"sha": parent, "url": git_url(request, full_name, "commits", parent)}
+                            for parent in commit["parents"]]}
+
+    def tree_json(request: Request, full_name: str, sha: str) -> Dict:
+        entries = [{"path": path, "mode": "100644", "type": "blob", "sha": blob,
+                    "url": git_url(request, full_name, "blobs", blob)}
+                   for path, blob in sorted(gits[full_name]["trees"][sha].items())]
+        return {"sha": sha, "url": git_url(request, full_name, "trees", sha), "tree": entries, "truncated": False}
+
+    @app.get("/repos/{owner}/{name}/git/ref/{ref:path}")
+    @app.get("/repos/{owner}/{name}/git/refs/{ref:path}")  # Older PyGithub
+    async def get_ref(owner: str, name: str, ref: str, request: Request):
+        full_name = f"{owner}/{name}"
+        if full_name not in gits or ref != "heads/main":
+            return JSONResponse({"message": "Not Found"}, status_code=404)
+        return ref_json(request, full_name)
+
+    @app.patch("/repos/{owner}/{name}/git/refs/{ref:path}")
+    async def update_ref(owner: str, name: str, ref: str, request: Request):
+        full_name = f"{owner}/{name}"
+        body = await request.json()
+        git = gits[full_name]
+        if body["sha"] not in git["commits"]:
+            return JSONResponse({"message": "Object does not exist"}, status_code=422)
+        if not body.get("force") and git["head"] not in git["commits"][body["sha"]]["parents"]:
+            return JSONResponse({"message": "Update is not a fast forward"}, status_code=422)
+        git["head"] = body["sha"]
+        app.state.stats["ref_updates"] += 1
+        return ref_json(request, full_name)
+
+    @app.get("/repos/{owner}/{name}/git/commits/{sha}")
+    async def get_commit(owner: str, name: str, sha: str, request: Request):
+        return commit_json(request, f"{owner}/{name}", sha)
+
+    @app.post("/repos/{owner}/{name}/git/commits")
+    async def create_commit(owner: str, name: str, request: Request):
+        full_name = f"{owner}/{name}"
+        body = await request.json()
+        app.state.stats["commit_posts"] += 1
+        sha = put_commit(gits[full_name], body["message"], body["tree"], body.get("parents", []))
+        return JSONResponse(commit_json(request, full_name, sha), status_code=201)
+
+    @app.get("/repos/{owner}/{name}/git/trees/{sha}")
+    async def get_tree(owner: str, name: str, sha: str, request: Request):
+        return tree_json(request, f"{owner}/{name}", sha)
+
+    @app.post("/repos/{owner}/{name}/git/trees")
+    async def create_tree(owner: str, name: str, request: Request):
+        full_name = f"{owner}/{name}"
+        body = await request.json()
+        git = gits[full_name]
+        app.state.stats["tree_posts"] += 1
+        entries = dict(git["trees"][body["base_tree"]]) if body.get("base_tree") else {}
+        entries.update({element["path"]: element["sha"] for element in body["tree"]})
+        return JSONResponse(tree_json(request, full_name, put_object(git["trees"], entries)), status_code=201)
+
+    @app.post("/repos/{owner}/{name}/git/blobs")
+    async def create_blob(owner: str, name: str, request: Request):
+        full_name = f"{owner}/{name}"
+        body = await request.json()
+        app.state.stats["blob_posts"] += 1
+        sha = put_blob(gits[full_name], body["content"])
+        return JSONResponse({"sha": sha, "url": git_url(request, full_name, "blobs", sha)}, status_code=201)
+
+    @app.get("/repos/{owner}/{name}/issues")
+    async def list_issues(owner: str, name: str, request: Request):
+        full_name = f"{owner}/{name}"
+        app.state.stats["issue_pages"] += 1
+        labels = [label for label in request.query_params.get("labels", "").split(",") if label]
+        issues = [issue_json(request, full_name, number, issue)
+                  for number, issue in enumerate(repos.get(full_name, []), 1)
+                  if all(label in issue.get("labels", []) for label in labels)]
+        page = int(request.query_params.get("page", "1"))
+        size = int(request.query_params.get("per_page", per_page))
+        chunk = issues[(page - 1) * size:page * size]
+        headers = {}
+        if page * size < len(issues):
+            params = dict(request.query_params, page=str(page + 1), per_page=str(size))
+            query = "&".join(f"{key}={value}" for key, value in params.items())
+            headers["Link"] = f'<{base(request)}/repos/{full_name}/issues?{query}>; rel="next"'
+        return JSONResponse(chunk, headers=headers)
+
+    @app.post("/repos/{owner}/{name}/issues")
+    async def create_issue(owner: str, name: str, request: Request):
+        stats = app.state.stats
+        stats["issue_posts"] += 1
+        if stats["rate_limited"] < rate_limited_posts:
+            stats["rate_limited"] += 1
+            message = "You have exceeded a secondary rate limit" if rate_limit_status == 403 else "Too Many Requests"
+            return JSONResponse({"message": message}, status_code=rate_limit_status,
+                                headers={"Retry-After": str(retry_after)})
+        body = await request.json()
+        full_name = f"{owner}/{name}"
+        issue = {"title": body["title"], "body": body.get("body", ""), "labels": body.get("labels", [])}
+        number = add_issue(full_name, issue)
+        stats["created"].append((time.monotonic(), body["title"]))
+        return JSONResponse(issue_json(request, full_name, number, issue), status_code=201, headers={
+            "X-RateLimit-Remaining": "4999", "X-RateLimit-Reset": str(int(time.time()) + 3600),
+        })
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--rate-limited-posts", type=int, default=0)
+    parser.add_argument("--rate-limit-status", type=int, default=403, choices=(403, 429))
+    parser.add_argument("--retry-after", type=float, default=1)
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(create_app(args.rate_limited_posts, args.rate_limit_status, args.retry_after),
+                host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
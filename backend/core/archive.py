@@ -0,0 +1,72 @@
+import os
+import zipfile
+from typing import Dict, Iterator, Optional
+
+DEFAULT_COMPRESSION_LEVEL = int(os.getenv('ZIP_COMPRESSION_LEVEL', '6'))
+CHUNK_SIZE = 64 * 1024  # Amount of uncompressed content fed to the compressor per step
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file object that collects ZIP output between yields.
+
+    zipfile falls back to streaming mode (data descriptors after each entry)
+    when the target cannot seek, which is what lets us hand bytes to the
+    client before the whole archive exists.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        if data:
+            self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(files: Dict[str, str], compresslevel: Optional[int] = None,
+               chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Yields a ZIP archive of `files` (path -> text content) chunk by chunk.
+
+    A compression level of 0 stores entries uncompressed; 1-9 use DEFLATE with
+    that level. Nothing is written to disk.
+    """
+    if compresslevel is None:
+        compresslevel = DEFAULT_COMPRESSION_LEVEL
+    if not 0 <= compresslevel <= 9:
+        raise ValueError(f"Compression level must be between 0 and 9, got {compresslevel}")
+
+    if compresslevel == 0:
+        compression, level = zipfile.ZIP_STORED, None
+    else:
+        compression, level = zipfile.ZIP_DEFLATED, compresslevel
+
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=compression, compresslevel=level) as zipf:
+        for path, content in files.items():
+            data = content.encode("utf-8") if isinstance(content, str) else bytes(content)
+            with zipf.open(path, "w") as entry:
+                for start in range(0, len(data), chunk_size):
+                    entry.write(data[start:start + chunk_size])
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    # Central directory is written when the archive is closed
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
+
+
+def build_zip(files: Dict[str, str], compresslevel: Optional[int] = None) -> bytes:
+    """Builds the whole ZIP archive of `files` in memory."""
+    return b"".join(stream_zip(files, compresslevel))
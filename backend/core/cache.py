@@ -0,0 +1,259 @@
+import asyncio
+import copy
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes free text for cache keys: case, whitespace and trailing punctuation."""
+    return re.sub(r"\s+", " ", text or "").strip().rstrip(".!?").lower()
+
+
+def make_cache_key(*parts: Any) -> str:
+    """Content-addressed key: SHA-256 of the JSON encoding of `parts`."""
+    encoded = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    """In-memory LRU cache whose entries also expire after `ttl_seconds`."""
+
+    def __init__(self, maxsize: int = 256, ttl_seconds: float = 3600):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class MongoCacheTier:
+    """Optional shared cache tier backed by a MongoDB collection with a TTL index.
+
+    pymongo is blocking, so every call runs on the default executor.
+    """
+
+    def __init__(self, collection, ttl_seconds: float = 3600):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self._indexed = False
+
+    def _ensure_index(self) -> None:
+        if not self._indexed:
+            self.collection.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+
+    def _get(self, key: str) -> Optional[Any]:
+        doc = self.collection.find_one({"_id": key})
+        if doc is None or doc["expires_at"] < datetime.datetime.utcnow():
+            return None  # The TTL monitor only runs once a minute
+        return doc["value"]
+
+    def _set(self, key: str, value: Any) -> None:
+        self._ensure_index()
+        expires_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.ttl_seconds)
+        self.collection.replace_one({"_id": key}, {"_id": key, "value": value, "expires_at": expires_at}, upsert=True)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await asyncio.get_running_loop().run_in_executor(None, self._get, key)
+
+    async def set(self, key: str, value: Any) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self._set, key, value)
+
+
+class ResponseCache:
+    """Two-tier response cache: in-memory LRU/TTL first, then an optional MongoDB tier.
+
+    Values are deep-copied in and out so callers can mutate what they get.
+    Errors from the MongoDB tier are logged and treated as misses.
+    """
+
+    def __init__(self, name: str, maxsize: int = 256, ttl_seconds: float = 3600,
+                 mongo_tier: Optional[MongoCacheTier] = None):
+        self.name = name
+        self.memory = TTLCache(maxsize, ttl_seconds)
+        self.mongo_tier = mongo_tier
+        self.hits = 0
+        self.mongo_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is None and self.mongo_tier is not None:
+            try:
+                value = await self.mongo_tier.get(key)
+            except Exception as e:
+                logger.warning(f"Cache '{self.name}' MongoDB lookup failed: {e}")
+            if value is not None:
+                self.mongo_hits += 1
+                self.memory.set(key, value)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return copy.deepcopy(value)
+
+    async def set(self, key: str, value: Any) -> None:
+        value = copy.deepcopy(value)
+        self.memory.set(key, value)
+        if self.mongo_tier is not None:
+            try:
+                await self.mongo_tier.set(key, value)
+            except Exception as e:
+                logger.warning(f"Cache '{self.name}' MongoDB write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'name': self.name,
+            'entries': len(self.memory),
+            'hits': self.hits,
+            'mongo_hits': self.mongo_hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'mongo_tier': self.mongo_tier is not None,
+        }
+
+
+class ProjectCache:
+    """Persistent cache of generated projects, stored as files in a directory.
+
+    Each entry is a gzipped JSON file map (`<key>.json.gz`) plus, optionally,
+    the finished ZIP archive (`<key>.zip`). When the directory grows past
+    `max_bytes`, the least recently used entries are evicted. Writes go
+    through a temporary file and an atomic rename, so several processes can
+    share the directory.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024, store_archives: bool = False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.store_archives = store_archives
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def _read(self, key: str) -> Optional[Dict[str, Any]]:
+        files_path = self._path(key, ".json.gz")
+        try:
+            with gzip.open(files_path, "rt", encoding="utf-8") as f:
+                files = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable project cache entry {key}: {e}")
+            self._remove(key)
+            return None
+        archive = None
+        try:
+            os.utime(files_path)  # Mark as recently used for eviction
+            with open(self._path(key, ".zip"), "rb") as f:
+                archive = f.read()
+        except OSError:
+            pass  # No stored archive, or the entry was evicted meanwhile
+        return {"files": files, "archive": archive}
+
+    def _atomic_write(self, path: str, data: bytes) -> None:
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _write(self, key: str, files: Dict[str, str], archive: Optional[bytes]) -> None:
+        payload = gzip.compress(json.dumps(files).encode("utf-8"))
+        if archive is not None and self.store_archives:
+            self._atomic_write(self._path(key, ".zip"), archive)
+        self._atomic_write(self._path(key, ".json.gz"), payload)
+        self._evict()
+
+    def _remove(self, key: str) -> None:
+        for suffix in (".json.gz", ".zip"):
+            try:
+                os.remove(self._path(key, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self) -> None:
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(".json.gz"):
+                    continue
+                key = entry.name[:-len(".json.gz")]
+                stat = entry.stat()
+                size = stat.st_size
+                archive_path = self._path(key, ".zip")
+                if os.path.exists(archive_path):
+                    size += os.path.getsize(archive_path)
+                entries.append((stat.st_mtime, key, size))
+                total += size
+        entries.sort()  # Oldest access first
+        for _, key, size in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(key)
+            total -= size
+            self.evictions += 1
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns {"files": {...}, "archive": bytes or None}, or None on a miss."""
+        entry = await asyncio.get_running_loop().run_in_executor(None, self._read, key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def set(self, key: str, files: Dict[str, str], archive: Optional[bytes] = None) -> None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, key, files, archive)
+        except OSError as e:
+            logger.warning(f"Failed to write project cache entry {key}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'name': 'projects',
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'max_bytes': self.max_bytes,
+            'store_archives': self.store_archives,
+        }
@@ -0,0 +1,76 @@
+import base64
+import hashlib
+import logging
+import os
+import secrets
+from typing import Optional
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from core.state import MemoryState
+
+logger = logging.getLogger(__name__)
+
+# Server secret the stored credentials are encrypted with; without it they never leave the worker
+SECRET_KEY = os.getenv('SECRET_KEY', '')
+# Cookie carrying the opaque session id credentials are stored under
+SESSION_COOKIE = 'synapse_session'
+
+
+def new_session_id() -> str:
+    """A random, unguessable session id issued by the server."""
+    return secrets.token_urlsafe(32)
+
+
+class CredentialStore:
+    """Credentials (e.g. GitHub tokens) of browser sessions, encrypted at rest.
+
+    Credentials are stored under a server-issued session id (see
+    new_session_id), never under anything the caller asserts about itself;
+    the state key is a hash of the id, so a dump of the state reveals
+    neither ids nor credentials. Values are encrypted with a key derived
+    from `secret`. Without a secret, credentials are kept in this worker's
+    memory only, and a session only works on the worker that set it.
+    """
+
+    def __init__(self, state, namespace: str, ttl: float, secret: str = SECRET_KEY):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._fernet = Fernet(base64.urlsafe_b64encode(hashlib.sha256(secret.encode('utf-8')).digest())) if secret else None
+        self.state = MemoryState()
+        self.use_state(state)
+
+    def use_state(self, state) -> None:
+        """Stores credentials in `state` from now on (e.g. once MongoDB is connected).
+
+        Without a secret they stay in this worker's memory. Credentials
+        stored before the switch are not carried over.
+        """
+        if self._fernet is not None:
+            self.state = state
+        elif state.shared:
+            logger.error("SECRET_KEY is not set: credentials stay in each worker's memory and are not shared; "
+                         "sessions only work on the worker that set them")
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return hashlib.sha256(session_id.encode('utf-8')).hexdigest()
+
+    async def put(self, session_id: str, credential: str) -> None:
+        value = self._fernet.encrypt(credential.encode('utf-8')).decode('ascii') if self._fernet else credential
+        await self.state.put(self.namespace, self._key(session_id), {'credential': value}, ttl=self.ttl)
+
+    async def get(self, session_id: str) -> Optional[str]:
+        record = await self.state.get(self.namespace, self._key(session_id))
+        if record is None:
+            return None
+        if self._fernet is None:
+            return record['credential']
+        try:
+            return self._fernet.decrypt(record['credential'].encode('ascii')).decode('utf-8')
+        except InvalidToken:
+            logger.warning("Ignoring a stored credential that does not decrypt (SECRET_KEY changed?)")
+            return None
+
+    async def delete(self, session_id: str) -> None:
+        await self.state.delete(self.namespace, self._key(session_id))
@@ -0,0 +1,96 @@
+import logging
+import os
+import time
+import uuid
+from typing import Optional
+
+import httpx
+
+from core.resilience import Resilience
+
+logger = logging.getLogger(__name__)
+
+# Base URL of the Gemini API (overridable, e.g. for a local fake server)
+GEMINI_API_BASE = os.getenv('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com/v1').rstrip('/')
+# Connection pool shared by every agent that talks to Gemini
+GEMINI_MAX_CONNECTIONS = int(os.getenv('GEMINI_MAX_CONNECTIONS', '20'))
+GEMINI_MAX_KEEPALIVE = int(os.getenv('GEMINI_MAX_KEEPALIVE', '10'))
+GEMINI_KEEPALIVE_EXPIRY = float(os.getenv('GEMINI_KEEPALIVE_EXPIRY', '60'))
+# Separate budgets: failing to connect should surface fast, generating a project can take minutes
+GEMINI_CONNECT_TIMEOUT = float(os.getenv('GEMINI_CONNECT_TIMEOUT', '10'))
+GEMINI_READ_TIMEOUT = float(os.getenv('GEMINI_READ_TIMEOUT', '120'))
+# A project generation call, retries included, gives up after this long (so a read timeout is retried at most briefly)
+GEMINI_GENERATION_DEADLINE = float(os.getenv('GEMINI_GENERATION_DEADLINE', '180'))
+GEMINI_HTTP2 = os.getenv('GEMINI_HTTP2', 'true').lower() == 'true'
+# Optional: save the raw text of every Gemini answer here, e.g. to build a parser benchmark corpus
+GEMINI_CAPTURE_DIR = os.getenv('GEMINI_CAPTURE_DIR')
+
+_client: Optional[httpx.AsyncClient] = None
+
+# Retries and circuit breaker shared by every Gemini call, so all agents see the same upstream health
+resilience = Resilience("gemini")
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401  (installed by httpx[http2])
+    except ImportError:
+        return False
+    return True
+
+
+def request_timeout(read: float = GEMINI_READ_TIMEOUT) -> httpx.Timeout:
+    """Timeout for one Gemini request; only the read budget differs between callers."""
+    return httpx.Timeout(read, connect=GEMINI_CONNECT_TIMEOUT, pool=GEMINI_CONNECT_TIMEOUT)
+
+
+def model_url(model: str, method: str, api_key: Optional[str], **params: str) -> str:
+    """URL of a model method, e.g. model_url("gemini-1.5-flash", "generateContent", key)."""
+    query = "&".join(f"{name}={value}" for name, value in {**params, 'key': api_key}.items())
+    return f"{GEMINI_API_BASE}/models/{model}:{method}?{query}"
+
+
+def capture_response(kind: str, text: str) -> None:
+    """Writes a raw response to GEMINI_CAPTURE_DIR (no-op when unset)."""
+    if not GEMINI_CAPTURE_DIR:
+        return
+    try:
+        os.makedirs(GEMINI_CAPTURE_DIR, exist_ok=True)
+        path = os.path.join(GEMINI_CAPTURE_DIR, f"{kind}-{int(time.time())}-{uuid.uuid4().hex[:8]}.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+    except OSError as e:
+        logger.warning(f"Could not capture Gemini response: {e}")
+
+
+def create_client() -> httpx.AsyncClient:
+    """A pooled client with keep-alive, and HTTP/2 when the h2 package is installed."""
+    http2 = GEMINI_HTTP2 and http2_available()
+    if GEMINI_HTTP2 and not http2:
+        logger.warning("GEMINI_HTTP2 is enabled but the 'h2' package is missing; using HTTP/1.1.")
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=GEMINI_MAX_CONNECTIONS,
+            max_keepalive_connections=GEMINI_MAX_KEEPALIVE,
+            keepalive_expiry=GEMINI_KEEPALIVE_EXPIRY
+        ),
+        timeout=request_timeout()
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    """The process-wide Gemini client, created on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_client()
+    return _client
+
+
+async def close_client() -> None:
+    """Closes the shared client (call once on application shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("Gemini client closed.")
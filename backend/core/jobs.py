@@ -0,0 +1,278 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+# Finished jobs (and their archives) are kept this long for late downloads
+JOB_TTL_SECONDS = int(os.getenv('JOB_TTL_SECONDS', '900'))
+# Interval between SSE keep-alive comments so idle streams are not cut by proxies
+SSE_KEEPALIVE_SECONDS = float(os.getenv('SSE_KEEPALIVE_SECONDS', '15'))
+# How often a worker following another worker's job polls the shared state for new events
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_MS', '500')) / 1000
+
+JOBS_NAMESPACE = 'jobs'
+JOB_EVENTS_NAMESPACE = 'job_events'
+
+TERMINAL_STATES = ('succeeded', 'failed')
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationJob:
+    """A project generation running in the background.
+
+    Progress is recorded as an ordered list of events (stage + data) that any
+    number of subscribers can replay and follow until the job finishes.
+    """
+
+    def __init__(self, job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.events: List[Dict[str, Any]] = []
+        self.result: Optional[Dict[str, Any]] = None  # Set on success (files, archive, ...)
+        self.error: Optional[str] = None
+        self._changed = asyncio.Condition()
+        self.on_publish = None  # Set by a JobStore with shared state to mirror events
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_STATES
+
+    def publish(self, stage: str, **data) -> None:
+        """Records a progress event and wakes up subscribers."""
+        event = {'id': len(self.events) + 1, 'stage': stage, 'time': time.time(), **data}
+        self.events.append(event)
+        asyncio.ensure_future(self._notify())
+        if self.on_publish is not None:
+            self.on_publish(self)
+
+    def start(self) -> None:
+        self.status = 'running'
+        self.publish('started')
+
+    def progress(self, stage: str, **data) -> None:
+        """Progress callback for the generator; the first event marks the job as running."""
+        if self.status == 'queued':
+            self.start()
+        self.publish(stage, **data)
+
+    def succeed(self, result: Dict[str, Any], **data) -> None:
+        self.result = result
+        self.status = 'succeeded'
+        self.finished_at = time.time()
+        self.publish('complete', **data)
+
+    def fail(self, error: str) -> None:
+        self.error = error
+        self.status = 'failed'
+        self.finished_at = time.time()
+        self.publish('failed', error=error)
+
+    async def _notify(self) -> None:
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def follow(self, after: int = 0) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Yields events with an id greater than `after` until the job finishes.
+
+        Yields None when no event arrived within the keep-alive interval.
+        """
+        sent = after
+        while True:
+            while sent < len(self.events):
+                event = self.events[sent]
+                sent += 1
+                yield event
+            if self.finished:
+                return
+            async with self._changed:
+                if sent >= len(self.events) and not self.finished:
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout=SSE_KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'jobId': self.id,
+            'status': self.status,
+            'createdAt': self.created_at,
+            'finishedAt': self.finished_at,
+            'lastEvent': self.events[-1] if self.events else None,
+            'error': self.error,
+            'zipFilename': self.result.get('zip_filename') if self.result else None,
+        }
+
+
+class SharedJob:
+    """Read-only view of a job running in another worker, backed by the shared state.
+
+    Offers what the job routes use (status, snapshot(), follow()); follow()
+    polls the state for new events every JOB_POLL_SECONDS.
+    """
+
+    def __init__(self, state, record: Dict[str, Any]):
+        self.state = state
+        self.id = record['jobId']
+        self._apply(record)
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        self.record = record
+        self.status = record['status']
+        self.error = record.get('error')
+        self.zip_filename = record.get('zipFilename') or 'generated_project.zip'
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_STATES
+
+    async def refresh(self) -> None:
+        record = await self.state.get(JOBS_NAMESPACE, self.id)
+        if record is not None:
+            self._apply(record)
+
+    async def follow(self, after: int = 0) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        sent = after
+        idle = 0.0
+        while True:
+            # The record is written after the events it summarizes, so read it first
+            await self.refresh()
+            events = await self.state.items(JOB_EVENTS_NAMESPACE, self.id, sent)
+            for event in events:
+                sent = event['id']
+                yield event
+            if events:
+                idle = 0.0
+            elif self.finished:
+                return
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            idle += JOB_POLL_SECONDS
+            if idle >= SSE_KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(self.record)
+
+
+def format_sse(event: Optional[Dict[str, Any]]) -> str:
+    """Formats a job event as a Server-Sent Events message (None -> keep-alive comment)."""
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"id: {event['id']}\nevent: {event['stage']}\ndata: {json.dumps(event)}\n\n"
+
+
+class JobStore:
+    """Registry of generation jobs with expiry of finished ones.
+
+    Jobs run in the worker process that created them. With a shared `state`
+    (see core.state), every job's events, status and archive are mirrored
+    there, so any worker can answer status, event stream and download
+    requests for it through find() and load_archive().
+    """
+
+    def __init__(self, ttl_seconds: int = JOB_TTL_SECONDS, state=None):
+        self.ttl_seconds = ttl_seconds
+        self.state = state
+        self._jobs: Dict[str, GenerationJob] = {}
+        self._tasks = set()  # Strong references to running job tasks
+        self._dirty = set()  # Ids of jobs with changes not yet written to the shared state
+        self._written: Dict[str, int] = {}  # Job id -> number of its events already written
+        self._syncing: Dict[str, asyncio.Task] = {}  # One writer task per job keeps its writes in order
+
+    @property
+    def shared(self) -> bool:
+        return self.state is not None and self.state.shared
+
+    def create(self) -> GenerationJob:
+        self._expire()
+        job = GenerationJob()
+        self._jobs[job.id] = job
+        if self.shared:
+            job.on_publish = self._mirror
+        return job
+
+    def get(self, job_id: str) -> Optional[GenerationJob]:
+        """A job of this worker."""
+        self._expire()
+        return self._jobs.get(job_id)
+
+    async def find(self, job_id: str):
+        """A job of this worker, or a SharedJob view of one running elsewhere."""
+        job = self.get(job_id)
+        if job is not None or not self.shared:
+            return job
+        record = await self.state.get(JOBS_NAMESPACE, job_id)
+        return SharedJob(self.state, record) if record is not None else None
+
+    async def save_archive(self, job: GenerationJob, zip_bytes: bytes) -> None:
+        """Stores a job's archive in the shared state (call before job.succeed())."""
+        if self.shared:
+            await self.state.put_blob(f"job:{job.id}", zip_bytes, ttl=self.ttl_seconds)
+
+    async def load_archive(self, job) -> Optional[bytes]:
+        if isinstance(job, GenerationJob):
+            return job.result['zip_bytes'] if job.result else None
+        return await self.state.get_blob(f"job:{job.id}")
+
+    def _mirror(self, job: GenerationJob) -> None:
+        self._dirty.add(job.id)
+        if job.id not in self._syncing:
+            self._syncing[job.id] = asyncio.ensure_future(self._sync(job))
+
+    async def _sync(self, job: GenerationJob) -> None:
+        """Writes new events, then the job record (which followers read first), until nothing changed."""
+        try:
+            while job.id in self._dirty:
+                self._dirty.discard(job.id)
+                written = self._written.get(job.id, 0)
+                events = job.events[written:]
+                for event in events:
+                    await self.state.append(JOB_EVENTS_NAMESPACE, job.id, event['id'], event, ttl=self.ttl_seconds)
+                self._written[job.id] = written + len(events)
+                await self.state.put(JOBS_NAMESPACE, job.id, job.snapshot(), ttl=self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"Could not mirror job {job.id} to the shared state: {e}")
+        finally:
+            self._syncing.pop(job.id, None)
+
+    async def synced(self, job: GenerationJob) -> None:
+        """Writes `job` to the shared state now, so other workers can find it once its id is handed out."""
+        if self.shared:
+            self._mirror(job)
+            task = self._syncing.get(job.id)
+            if task is not None:
+                await asyncio.shield(task)
+
+    async def flush(self) -> None:
+        """Waits for pending shared state writes (e.g. before shutdown)."""
+        if self._syncing:
+            await asyncio.gather(*self._syncing.values(), return_exceptions=True)
+
+    def discard(self, job_id: str) -> None:
+        self._jobs.pop(job_id, None)
+
+    def run(self, job: GenerationJob, coro) -> None:
+        """Runs `coro` in the background for `job`, keeping a reference until it finishes."""
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def cancel_all(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+            self._written.pop(job_id, None)
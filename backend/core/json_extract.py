@@ -0,0 +1,122 @@
+import json
+import logging
+import re
+from typing import Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_FENCE_RE = re.compile(r"```(?:json)?[ \t]*\r?\n?", re.IGNORECASE)
+# A complete string literal (raw control characters allowed) or a structural character
+_TOKEN_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\],:]', re.DOTALL)
+_CLOSERS = {'{': '}', '[': ']'}
+_decoder = json.JSONDecoder()
+
+
+def _object_start(text: str) -> int:
+    """Offset of the first "{" of the JSON in `text`, preferring the inside of a markdown fence."""
+    fence = _FENCE_RE.search(text)
+    start = text.find('{', fence.end() if fence else 0)
+    if start == -1 and fence:
+        start = text.find('{')
+    if start == -1:
+        raise ValueError("No JSON object found in the response")
+    return start
+
+
+def _escape_controls(string: str) -> str:
+    """Escapes raw newlines and tabs, which JSON does not allow inside strings."""
+    return string.replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t')
+
+
+def repair_json(text: str, start: int = 0) -> Tuple[str, bool]:
+    """Rewrites the JSON value starting at `start` into parseable JSON in one pass.
+
+    Repairs the defects LLMs commonly produce: raw newlines/tabs inside
+    strings, trailing commas before "}" or "]", and output that stops
+    mid-document. Truncated output is cut back to the last complete value
+    and its open objects/arrays are closed. Text after the balanced end is
+    ignored. Returns the repaired text and whether it had been truncated.
+
+    The scan only stops at strings and structural characters, so string
+    bodies (most of a code generation response) are skipped by the regex engine.
+    """
+    out: List[str] = []
+    stack: List[str] = []            # Open "{" / "["
+    expect_key: List[bool] = []      # Per open container: the next string is an object key
+    safe_len, safe_stack = 0, ''     # Last point where everything emitted is a complete value
+    previous = None                  # Previous token, to spot trailing commas
+    pos = start
+    for match in _TOKEN_RE.finditer(text, start):
+        gap = text[pos:match.start()]
+        token = match.group()
+        pos = match.end()
+        if token[0] == '"':
+            out.append(gap)
+            out.append(_escape_controls(token))
+            if stack and not expect_key[-1]:  # A value, not an object key
+                safe_len, safe_stack = len(out), ''.join(stack)
+        elif token in '{[':
+            out.append(gap)
+            out.append(token)
+            stack.append(token)
+            expect_key.append(token == '{')
+        elif token in '}]':
+            if not stack:
+                break
+            if previous == ',' and not gap.strip():
+                out.pop()  # Trailing comma
+            else:
+                out.append(gap)
+            out.append(_CLOSERS[stack.pop()])
+            expect_key.pop()
+            if not stack:
+                return ''.join(out), False
+            safe_len, safe_stack = len(out), ''.join(stack)
+        elif token == ',':
+            out.append(gap)
+            if stack:
+                safe_len, safe_stack = len(out), ''.join(stack)
+                expect_key[-1] = stack[-1] == '{'
+            out.append(token)
+        else:  # ':'
+            out.append(gap)
+            out.append(token)
+            if stack:
+                expect_key[-1] = False
+        previous = token[0]
+
+    # Ran out of text before the top-level value was closed
+    repaired = ''.join(out[:safe_len]).rstrip().rstrip(',')
+    return repaired + ''.join(_CLOSERS[opener] for opener in reversed(safe_stack)), True
+
+
+def recover_json(text: str) -> Tuple[Any, bool]:
+    """Returns the first JSON object in an LLM response and whether it was truncated.
+
+    The object may be wrapped in markdown fences or prose. Well-formed JSON
+    is decoded directly; anything else goes through repair_json. A truncated
+    object holds only the complete values before the cut. Raises ValueError
+    when no object can be recovered.
+    """
+    start = _object_start(text)
+    try:
+        value, _ = _decoder.raw_decode(text, start)
+        return value, False
+    except json.JSONDecodeError as e:
+        error = e
+    repaired, truncated = repair_json(text, start)
+    try:
+        value = json.loads(repaired)
+    except json.JSONDecodeError:
+        raise ValueError(f"Could not repair JSON in the response: {error}") from error
+    if truncated:
+        logger.warning("Response JSON was truncated; recovered the complete values before the cut")
+    else:
+        logger.info(f"Repaired malformed JSON in the response ({error.msg})")
+    return value, truncated
+
+
+def extract_json(text: str) -> Any:
+    """Returns the first JSON object in an LLM response (see recover_json)."""
+    return recover_json(text)[0]
+
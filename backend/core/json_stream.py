@@ -0,0 +1,134 @@
+import json
+import logging
+import re
+from typing import Any, Dict, List, Tuple
+
+from core.json_extract import extract_json, recover_json
+
+logger = logging.getLogger(__name__)
+
+_FILES_ARRAY_RE = re.compile(r'"files"\s*:\s*\[')
+
+
+class FilesArrayParser:
+    """Incremental parser for the `{"files": [{"name": ..., "content": ...}, ...]}` shape.
+
+    Text is fed in arbitrary chunks (e.g. as it streams from Gemini) and every
+    entry of the "files" array is returned as soon as its closing brace has
+    arrived, without waiting for the rest of the document. Leading prose or
+    markdown fences before the JSON are ignored.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0              # Next character of the buffer to scan
+        self._in_array = False     # Found the opening bracket of "files"
+        self._done = False         # Reached the closing bracket of "files"
+        self._depth = 0            # Brace/bracket depth inside the current entry
+        self._in_string = False
+        self._escape = False
+        self._entry_start = None   # Buffer offset of the current entry's "{"
+        self.entries_parsed = 0
+        self.entries_skipped = 0
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    def feed(self, text: str) -> List[Dict]:
+        """Adds a chunk of text and returns the file entries completed by it."""
+        if self._done or not text:
+            return []
+        self._buffer += text
+        completed = []
+
+        if not self._in_array:
+            match = _FILES_ARRAY_RE.search(self._buffer)
+            if not match:
+                # Keep only a tail long enough to still match a split key
+                if len(self._buffer) > 64:
+                    self._buffer = self._buffer[-64:]
+                return completed
+            self._in_array = True
+            self._buffer = self._buffer[match.end():]
+            self._pos = 0
+
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if self._entry_start is None:
+                # Between entries: skip whitespace and commas until "{" or "]"
+                if char == '{':
+                    self._entry_start = pos
+                    self._depth = 1
+                elif char == ']':
+                    self._done = True
+                    pos += 1
+                    break
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    entry = self._decode(buffer[self._entry_start:pos + 1])
+                    if entry is not None:
+                        completed.append(entry)
+                    self._entry_start = None
+            pos += 1
+
+        # Drop everything that has been fully consumed
+        cut = self._entry_start if self._entry_start is not None else pos
+        self._buffer = buffer[cut:]
+        self._pos = pos - cut
+        if self._entry_start is not None:
+            self._entry_start = 0
+        return completed
+
+    def _decode(self, raw: str):
+        try:
+            entry = json.loads(raw)
+        except json.JSONDecodeError:
+            try:
+                entry = extract_json(raw)  # e.g. raw newlines or a trailing comma inside the entry
+            except ValueError as e:
+                self.entries_skipped += 1
+                logger.warning(f"Skipping malformed file entry in streamed JSON: {e}")
+                return None
+        if not isinstance(entry, dict):
+            self.entries_skipped += 1
+            return None
+        self.entries_parsed += 1
+        return entry
+
+
+def extract_files(text: str) -> Tuple[List[Dict[str, Any]], bool]:
+    """Returns the entries of the {"files": [...]} object in a code generation response.
+
+    The whole document is recovered with recover_json when possible (fences,
+    prose, common defects and truncation are handled there). Otherwise every
+    entry that parses on its own is salvaged. Also returns whether the
+    response was truncated, i.e. files after the cut may be missing. Raises
+    ValueError when no files list is found.
+    """
+    try:
+        data, truncated = recover_json(text)
+    except ValueError as e:
+        parser = FilesArrayParser()
+        entries = parser.feed(text)
+        if not entries:
+            raise
+        logger.warning(f"Salvaged {len(entries)} file entries from unparseable JSON ({e})")
+        return entries, not parser.done
+    if not isinstance(data, dict) or not isinstance(data.get("files"), list):
+        raise ValueError("Invalid JSON structure received from AI. Expected {'files': [...]}")
+    return data["files"], truncated
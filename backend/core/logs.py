@@ -0,0 +1,210 @@
+import contextvars
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# "json" (one object per line) or "text"
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+# Records waiting for the writer thread; beyond this they are dropped instead of blocking the event loop
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# Only every Nth occurrence of a sampled (per-file) log line is kept
+LOG_SAMPLE_EVERY = max(1, int(os.getenv('LOG_SAMPLE_EVERY', '100')))
+
+REQUEST_ID_HEADER = 'x-request-id'
+# Libraries that log every HTTP call at INFO
+QUIET_LOGGERS = ('httpx', 'httpcore', 'github')
+UVICORN_LOGGERS = ('uvicorn', 'uvicorn.error', 'uvicorn.access')
+
+# Pass extra={'sampled': True} for high-volume lines (e.g. one per generated file)
+SAMPLED = {'sampled': True}
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional['NonBlockingQueueHandler'] = None
+_lock = threading.Lock()
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records with the current request id (runs on the caller's thread, before queueing)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps one in `every` records marked `sampled`, counted per call site."""
+
+    def __init__(self, every: int = LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.every = every
+        self._counts: Dict[Tuple[str, int], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'sampled', False):
+            return True
+        key = (record.pathname, record.lineno)
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        if count % self.every:
+            return False
+        record.sample_rate = self.every
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread without ever blocking; drops (and counts) them when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the cheap parts happen on the caller's thread: merging args and rendering a traceback
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request id and any `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in ('request_id', 'sampled') and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        if getattr(record, 'request_id', None) is None:
+            record.request_id = '-'
+        return super().format(record)
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> None:
+    """Routes all logging through a queue to a background writer thread. Safe to call more than once.
+
+    The root logger (and uvicorn's loggers, which normally write to the
+    console directly) get a non-blocking queue handler; a QueueListener
+    thread formats records and writes them to stdout.
+    """
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is not None:
+            return
+        log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        writer = logging.StreamHandler(sys.stdout)
+        writer.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+        _queue_handler = NonBlockingQueueHandler(log_queue)
+        _queue_handler.addFilter(RequestContextFilter())
+        _queue_handler.addFilter(SamplingFilter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+        for name in UVICORN_LOGGERS:
+            uvicorn_logger = logging.getLogger(name)
+            uvicorn_logger.handlers.clear()
+            uvicorn_logger.propagate = True
+        for name in QUIET_LOGGERS:
+            logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
+
+        _listener = logging.handlers.QueueListener(log_queue, writer, respect_handler_level=True)
+        _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flushes queued records and stops the writer thread."""
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records() -> int:
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+class RequestIdMiddleware:
+    """ASGI middleware that gives every HTTP request an id for log correlation.
+
+    A valid incoming X-Request-Id is reused (so ids can span services),
+    otherwise one is generated. It is echoed in the response header and
+    attached to every log record written while the request is handled,
+    including in scheduler jobs and background generation jobs it starts.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get('headers', []):
+            if name == REQUEST_ID_HEADER.encode():
+                candidate = value.decode('latin-1').strip()
+                if 0 < len(candidate) <= 64 and candidate.replace('-', '').isalnum():
+                    request_id = candidate
+                break
+        request_id = request_id or new_request_id()
+        token = request_id_var.set(request_id)
+
+        async def send_with_id(message):
+            if message['type'] == 'http.response.start':
+                message = {**message, 'headers': list(message.get('headers', [])) + [(REQUEST_ID_HEADER.encode(), request_id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
@@ -0,0 +1,250 @@
+import bisect
+import contextvars
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds; from a cache lookup up to a full project generation
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels (Prometheus text format)."""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()  # Also updated from executor threads
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels (Prometheus text format)."""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List[float]] = {}  # Per-bucket counts, then count and sum
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(tuple(str(labels.get(name, "")) for name in self.labels))
+        return int(series[-2]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, series):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels + ("le",), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels + ('le',), key + ('+Inf',))} {int(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {int(series[-2])}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(series[-1])}")
+        return lines
+
+
+# A collector returns (name, type, help, [(labels dict, value), ...]) for values read at scrape time
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]
+
+
+class Registry:
+    """Metrics exposed on /metrics.
+
+    Counters and histograms are updated as things happen; collectors turn
+    existing stats() dicts (scheduler, caches, circuit breaker) into metrics
+    when the endpoint is scraped, so those hot paths need no extra bookkeeping.
+    """
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Collector] = []
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "codegen_stage_seconds", "Time spent in each stage of request handling", ("stage",))
+request_seconds = registry.histogram(
+    "codegen_http_request_seconds", "HTTP request duration until the response starts", ("endpoint", "method", "status"))
+gemini_tokens = registry.counter(
+    "codegen_gemini_tokens_total", "Tokens reported in Gemini usage metadata", ("kind", "endpoint"))
+gemini_cost = registry.counter(
+    "codegen_gemini_cost_usd_total", "Estimated Gemini cost in USD", ("endpoint",))
+failures = registry.counter(
+    "codegen_failures_total", "Failed operations by cause", ("cause",))
+
+# Stage durations of the current request: stage -> [total seconds, count]
+_request_stages: contextvars.ContextVar[Optional[Dict[str, List[float]]]] = contextvars.ContextVar(
+    "request_stages", default=None)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Records a stage duration in the histogram and in the current request's Server-Timing."""
+    stage_seconds.observe(seconds, stage=stage)
+    stages = _request_stages.get()
+    if stages is not None:
+        totals = stages.setdefault(stage, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += 1
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Times the enclosed block as `stage` (works around awaits as well)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def timed_iterator(stage: str, iterator: Iterable[Any]) -> Iterator[Any]:
+    """Yields from `iterator`, timing only the work of producing items (not the consumer)."""
+    iterator = iter(iterator)
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        observe_stage(stage, elapsed)
+
+
+def record_failure(cause: str) -> None:
+    failures.inc(cause=cause)
+
+
+def server_timing(stages: Dict[str, List[float]], total: float) -> str:
+    """Server-Timing header value, e.g. 'gemini;dur=812.4, json_parse;dur=3.1, total;dur=830.2'."""
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, (seconds, _) in stages.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware that times each HTTP request and adds a Server-Timing header.
+
+    Stage durations recorded with timed()/observe_stage() while the request
+    is handled (including in scheduler jobs, which run in the request's
+    context) are summed per stage, so parallel calls can add up to more than
+    the total. Stages that run after the response has started (e.g. a
+    streamed archive) are only recorded in the histograms.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stages: Dict[str, List[float]] = {}
+        token = _request_stages.set(stages)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - start
+                endpoint = scope.get("endpoint")
+                request_seconds.observe(total, endpoint=getattr(endpoint, "__name__", "static"),
+                                        method=scope["method"], status=str(message["status"]))
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(stages, total).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stages.reset(token)
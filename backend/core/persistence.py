@@ -0,0 +1,169 @@
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pymongo import InsertOne, UpdateOne
+
+from core.metrics import record_failure, timed
+
+logger = logging.getLogger(__name__)
+
+# Connection pool size; the store's thread pool matches it so no call waits for a socket
+MONGO_POOL_SIZE = int(os.getenv('MONGO_POOL_SIZE', '16'))
+# Upper bound for a single MongoDB operation (server selection, network and execution)
+MONGO_TIMEOUT_SECONDS = float(os.getenv('MONGO_TIMEOUT_SECONDS', '5'))
+# Generation records are written in batches of up to this many documents...
+MONGO_BATCH_SIZE = int(os.getenv('MONGO_BATCH_SIZE', '50'))
+# ...or after this long, whichever comes first
+MONGO_FLUSH_INTERVAL_SECONDS = float(os.getenv('MONGO_FLUSH_INTERVAL_MS', '200')) / 1000
+
+
+def mongo_client_options() -> Dict[str, Any]:
+    """Keyword arguments for MongoClient matching the store's pool and timeouts."""
+    return {
+        'maxPoolSize': MONGO_POOL_SIZE,
+        'serverSelectionTimeoutMS': int(MONGO_TIMEOUT_SECONDS * 1000),
+        'timeoutMS': int(MONGO_TIMEOUT_SECONDS * 1000),
+    }
+
+
+def _retrieve_error(future: asyncio.Future) -> None:
+    """Marks a write's failure as seen; flush() has logged it, so an unawaited future must not warn again."""
+    if not future.cancelled():
+        future.exception()
+
+
+def gather_writes(futures: List[asyncio.Future]) -> asyncio.Future:
+    """One future for several batched writes, failing with the first error."""
+    gathered = asyncio.gather(*futures)
+    gathered.add_done_callback(_retrieve_error)
+    return gathered
+
+
+class MongoStore:
+    """Async access to a pymongo (or mongomock) database.
+
+    Every call runs on the store's own thread pool, sized like the connection
+    pool, so requests no longer queue behind one another on a single thread.
+    Calls are bounded by `timeout` seconds. Writes passed to insert_batched()
+    and update_batched() are buffered per collection and sent in order with
+    one bulk_write(); reads flush the collection's pending writes first, so a
+    request always sees what earlier requests saved. Batched writes return a
+    future that resolves once the batch is written, or fails with its error;
+    callers that do not await it still get the failure logged and counted.
+    """
+
+    def __init__(self, db, pool_size: int = MONGO_POOL_SIZE, timeout: float = MONGO_TIMEOUT_SECONDS,
+                 batch_size: int = MONGO_BATCH_SIZE, flush_interval: float = MONGO_FLUSH_INTERVAL_SECONDS):
+        self.db = db
+        self.timeout = timeout
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._executor = ThreadPoolExecutor(max_workers=max(1, pool_size), thread_name_prefix="mongo")
+        self._pending: Dict[str, List[Tuple[Any, asyncio.Future]]] = {}  # collection -> (pymongo write operation, its future)
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None  # Created on first use, inside the running loop
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+
+    async def _run(self, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        call = loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+        return await asyncio.wait_for(call, timeout=self.timeout)
+
+    async def insert_one(self, collection: str, document: Dict[str, Any]) -> Any:
+        """Writes one document right away and returns its inserted id."""
+        with timed("mongo_write"):
+            result = await self._run(self.db[collection].insert_one, document)
+        return result.inserted_id
+
+    async def update_one(self, collection: str, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> None:
+        with timed("mongo_write"):
+            await self._run(self.db[collection].update_one, filter, update, upsert=upsert)
+
+    async def create_index(self, collection: str, keys, **kwargs) -> str:
+        return await self._run(self.db[collection].create_index, keys, **kwargs)
+
+    def insert_batched(self, collection: str, document: Dict[str, Any]) -> asyncio.Future:
+        """Queues a document for the next batch write to `collection`."""
+        return self._enqueue(collection, InsertOne(document))
+
+    def update_batched(self, collection: str, filter: Dict[str, Any], update: Dict[str, Any],
+                       upsert: bool = False) -> asyncio.Future:
+        """Queues an update_one() for the next batch write to `collection`."""
+        return self._enqueue(collection, UpdateOne(filter, update, upsert=upsert))
+
+    def _enqueue(self, collection: str, operation: Any) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_retrieve_error)
+        self._pending.setdefault(collection, []).append((operation, future))
+        if len(self._pending[collection]) >= self.batch_size:
+            asyncio.ensure_future(self.flush(collection))
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+        return future
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self, collection: Optional[str] = None) -> None:
+        """Writes pending documents (of one collection, or all of them)."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            names = [collection] if collection is not None else list(self._pending)
+            for name in names:
+                pending = self._pending.pop(name, None)
+                if not pending:
+                    continue
+                operations = [operation for operation, _ in pending]
+                try:
+                    # Ordered, so several writes to the same document apply in submission order
+                    with timed("mongo_write"):
+                        await self._run(self.db[name].bulk_write, operations, ordered=True)
+                except asyncio.CancelledError:
+                    for _, future in pending:
+                        future.cancel()
+                    raise
+                except Exception as e:
+                    self.failed += len(operations)
+                    record_failure("mongo")
+                    logger.warning(f"Failed to write {len(operations)} operations to '{name}': {e}")
+                    for _, future in pending:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    self.batches += 1
+                    self.written += len(operations)
+                    for _, future in pending:
+                        if not future.done():
+                            future.set_result(None)
+
+    async def find_one(self, collection: str, filter: Optional[Dict[str, Any]] = None,
+                       sort: Optional[List] = None, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        await self.flush(collection)  # Also waits for a batch of this collection already in flight
+        return await self._run(self.db[collection].find_one, filter, projection, sort=sort)
+
+    async def find(self, collection: str, filter: Dict[str, Any], projection: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        await self.flush(collection)
+        return await self._run(lambda: list(self.db[collection].find(filter, projection)))
+
+    async def close(self) -> None:
+        """Writes what is still pending and stops the thread pool."""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'pending': sum(len(pending) for pending in self._pending.values()),
+            'batches': self.batches,
+            'written': self.written,
+            'failed': self.failed,
+        }
@@ -0,0 +1,152 @@
+import asyncio
+import datetime
+import hashlib
+import logging
+import os
+import uuid
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.persistence import MongoStore, gather_writes
+
+logger = logging.getLogger(__name__)
+
+# Project records expire this many days after their last update
+PROJECT_TTL_DAYS = float(os.getenv('PROJECT_TTL_DAYS', '30'))
+PROJECTS_COLLECTION = 'projects'
+BLOBS_COLLECTION = 'blobs'
+BLOB_COMPRESSION_LEVEL = 6
+
+
+class MissingBlobsError(Exception):
+    """Raised when a project's manifest references file blobs that no longer exist."""
+
+    def __init__(self, project_id: str, paths: List[str]):
+        super().__init__(f"Project {project_id} is missing {len(paths)} file blobs, e.g. {paths[0]}")
+        self.project_id = project_id
+        self.paths = paths
+
+
+def new_project_id() -> str:
+    return uuid.uuid4().hex
+
+
+class ProjectRecords:
+    """One MongoDB document per project (session), looked up by its project id.
+
+    The analysis (requirement, tasks, tech stack) and the latest generation
+    of a project are stored on the same document, so concurrent users never
+    see each other's files. Writes are batched through the MongoStore; a
+    unique index serves the lookups and a TTL index on `updated_at` expires
+    abandoned projects.
+
+    File bodies are not stored inline: the project keeps a manifest of
+    (path, sha256, size) and each distinct content is stored once, zlib
+    compressed, in the blobs collection under its hash. Identical files across
+    generations and projects share one blob. Blobs carry `last_used_at`
+    with the same TTL as projects; every save of a project refreshes it for
+    all blobs in the project's manifest, so a blob never expires before a
+    project that uses it.
+    """
+
+    def __init__(self, store: MongoStore, ttl_days: float = PROJECT_TTL_DAYS, collection: str = PROJECTS_COLLECTION,
+                 blobs_collection: str = BLOBS_COLLECTION):
+        self.store = store
+        self.ttl_days = ttl_days
+        self.collection = collection
+        self.blobs_collection = blobs_collection
+
+    async def ensure_indexes(self) -> None:
+        ttl_seconds = int(self.ttl_days * 86400)
+        await self.store.create_index(self.collection, 'project_id', unique=True)
+        await self.store.create_index(self.collection, 'updated_at', expireAfterSeconds=ttl_seconds)
+        await self.store.create_index(self.blobs_collection, 'last_used_at', expireAfterSeconds=ttl_seconds)
+
+    def _save(self, project_id: str, fields: Dict[str, Any]) -> asyncio.Future:
+        now = datetime.datetime.utcnow()
+        return self.store.update_batched(
+            self.collection,
+            {'project_id': project_id},
+            {'$set': {**fields, 'updated_at': now}, '$setOnInsert': {'created_at': now}},
+            upsert=True
+        )
+
+    async def save_analysis(self, project_id: str, requirement: str, tasks: List[str], tech_stack: Dict[str, Any]) -> None:
+        self._save(project_id, {'requirement': requirement, 'tasks': tasks, 'tech_stack': tech_stack})
+        # The save extends the project's life, so the blobs of its last generation must live as long
+        project = await self.get(project_id, ['manifest.sha'])
+        if project and project.get('manifest'):
+            self._touch_blobs({entry['sha'] for entry in project['manifest']})
+
+    def _touch_blobs(self, shas) -> None:
+        now = datetime.datetime.utcnow()
+        for sha in shas:
+            self.store.update_batched(self.blobs_collection, {'_id': sha}, {'$set': {'last_used_at': now}})
+
+    def _save_blobs(self, files: Dict[str, str]) -> Tuple[List[Dict[str, Any]], List[asyncio.Future]]:
+        """Queues one upsert per distinct content and returns the manifest and the pending writes."""
+        now = datetime.datetime.utcnow()
+        manifest = []
+        writes = []
+        seen = set()
+        for path, content in files.items():
+            data = content.encode('utf-8')
+            sha = hashlib.sha256(data).hexdigest()
+            manifest.append({'path': path, 'sha': sha, 'size': len(data)})
+            if sha in seen:
+                continue
+            seen.add(sha)
+            # Existing blobs only get their last use refreshed; the body is sent but never rewritten
+            writes.append(self.store.update_batched(
+                self.blobs_collection,
+                {'_id': sha},
+                {'$set': {'last_used_at': now},
+                 '$setOnInsert': {'data': zlib.compress(data, BLOB_COMPRESSION_LEVEL), 'size': len(data)}},
+                upsert=True
+            ))
+        return manifest, writes
+
+    def save_generation(self, project_id: str, tasks: List[str], files_created: Dict[str, str],
+                        workspace_id: Optional[str] = None, tree_structure: Any = None) -> asyncio.Future:
+        """Queues the generation's blobs and project document.
+
+        Returns a future that resolves once all of them are written, or fails
+        with the write error; awaiting it is optional.
+        """
+        manifest, writes = self._save_blobs(files_created)
+        writes.append(self._save(project_id, {
+            'tasks': tasks,
+            'generated_at': datetime.datetime.utcnow(),
+            'workspace_id': workspace_id,
+            'tree_structure': tree_structure,
+            'manifest': manifest,
+            'total_size': sum(entry['size'] for entry in manifest),
+        }))
+        return gather_writes(writes)
+
+    async def get(self, project_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Returns the project document (metadata and manifest, no file bodies), or only `fields` of it."""
+        projection = {field: 1 for field in fields} if fields else None
+        return await self.store.find_one(self.collection, {'project_id': project_id}, projection=projection)
+
+    async def get_files(self, project_id: str, paths: Optional[List[str]] = None) -> Optional[Dict[str, str]]:
+        """Returns path -> content of the project's last generation (only `paths`, if given).
+
+        None when the project does not exist or has not been generated yet;
+        raises MissingBlobsError when some of the files are gone, rather than
+        returning a partial project.
+        """
+        project = await self.get(project_id, ['manifest'])
+        if not project or project.get('manifest') is None:
+            return None
+        manifest = project['manifest']
+        if paths is not None:
+            wanted = set(paths)
+            manifest = [entry for entry in manifest if entry['path'] in wanted]
+        shas = list({entry['sha'] for entry in manifest})
+        blobs = await self.store.find(self.blobs_collection, {'_id': {'$in': shas}}, {'data': 1})
+        contents = {blob['_id']: zlib.decompress(blob['data']).decode('utf-8') for blob in blobs}
+        missing = [entry['path'] for entry in manifest if entry['sha'] not in contents]
+        if missing:
+            raise MissingBlobsError(project_id, missing)
+        return {entry['path']: contents[entry['sha']] for entry in manifest}
@@ -0,0 +1,75 @@
+import asyncio
+import time
+from typing import Mapping, Optional
+
+
+class TokenBucket:
+    """Async token bucket that can also be paused by upstream rate-limit signals.
+
+    acquire() waits for a token (refilled at `rate` per second up to
+    `capacity`) and for any pause set through pause() or observe() to end.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None  # Created on first use, inside the running loop
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Blocks all acquirers for `seconds` (e.g. from a Retry-After header)."""
+        if seconds <= 0:
+            return
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    def observe(self, remaining: Optional[int], reset_at: Optional[float], reserve: int = 0) -> None:
+        """Pauses until `reset_at` (epoch seconds) once `remaining` drops to `reserve` or below."""
+        if remaining is None or remaining < 0 or reset_at is None:
+            return
+        if remaining <= reserve:
+            self.pause(reset_at - time.time())
+
+    @property
+    def paused_for(self) -> float:
+        return max(0.0, self._paused_until - time.monotonic())
+
+
+def retry_after_seconds(headers: Optional[Mapping[str, str]], default: Optional[float] = None) -> Optional[float]:
+    """Reads a wait time from Retry-After, or from X-RateLimit-Reset when nothing remains."""
+    if not headers:
+        return default
+    lowered = {str(k).lower(): v for k, v in headers.items()}
+    retry_after = lowered.get('retry-after')
+    if retry_after is not None:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+    if lowered.get('x-ratelimit-remaining') == '0' and lowered.get('x-ratelimit-reset'):
+        try:
+            return max(0.0, float(lowered['x-ratelimit-reset']) - time.time())
+        except ValueError:
+            pass
+    return default
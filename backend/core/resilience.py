@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from core.ratelimit import retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth another attempt: rate limiting and transient server errors
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+DEFAULT_RETRY_ATTEMPTS = int(os.getenv('GEMINI_RETRY_ATTEMPTS', '3'))
+DEFAULT_RETRY_BASE_DELAY = float(os.getenv('GEMINI_RETRY_BASE_DELAY', '0.5'))
+DEFAULT_RETRY_MAX_DELAY = float(os.getenv('GEMINI_RETRY_MAX_DELAY', '8'))
+DEFAULT_BREAKER_THRESHOLD = int(os.getenv('GEMINI_BREAKER_THRESHOLD', '5'))
+DEFAULT_BREAKER_RESET_SECONDS = float(os.getenv('GEMINI_BREAKER_RESET_SECONDS', '30'))
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of calling an upstream that the circuit breaker considers down."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable (circuit open), retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    After `failure_threshold` failures in a row the circuit opens and calls
+    fail fast for `reset_timeout` seconds. Then a single trial call is let
+    through (half-open): success closes the circuit, failure opens it again.
+    A trial that ends without an outcome (cancelled, or failed with an error
+    other than upstream trouble) must be recorded as a failure, or the
+    circuit would stay half-open and reject every call.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = DEFAULT_BREAKER_THRESHOLD,
+                 reset_timeout: float = DEFAULT_BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+
+    def before_call(self) -> bool:
+        """Raises CircuitOpenError while the circuit is open; returns True for the half-open trial call."""
+        if self.state == 'closed':
+            return False
+        remaining = self.opened_at + self.reset_timeout - time.monotonic()
+        if self.state == 'open' and remaining <= 0:
+            self.state = 'half_open'  # This caller is the trial call
+            logger.info(f"Circuit '{self.name}' half-open, sending a trial request")
+            return True
+        self.rejected += 1
+        raise CircuitOpenError(self.name, max(1.0, remaining))
+
+    def record_success(self) -> None:
+        if self.state != 'closed':
+            logger.info(f"Circuit '{self.name}' closed")
+        self.state = 'closed'
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            if self.state != 'open':
+                logger.warning(f"Circuit '{self.name}' opened after {self.failures} consecutive failures")
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'name': self.name, 'state': self.state, 'failures': self.failures, 'rejected': self.rejected}
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter; a server's Retry-After wins when it is longer."""
+
+    def __init__(self, attempts: int = DEFAULT_RETRY_ATTEMPTS, base_delay: float = DEFAULT_RETRY_BASE_DELAY,
+                 max_delay: float = DEFAULT_RETRY_MAX_DELAY):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            return min(self.max_delay, max(backoff, retry_after))
+        return backoff
+
+
+class Resilience:
+    """Retries, optional hedging and a circuit breaker around calls to one upstream.
+
+    Only upstream trouble counts as a failure: connection errors, timeouts and
+    RETRYABLE_STATUS responses. Other responses (e.g. 400) are returned as-is
+    for the caller to handle.
+    """
+
+    def __init__(self, name: str, breaker: Optional[CircuitBreaker] = None, policy: Optional[RetryPolicy] = None):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker(name)
+        self.policy = policy or RetryPolicy()
+        self.retries = 0
+        self.hedges = 0
+
+    async def call(self, send: Callable[[], Awaitable[httpx.Response]],
+                   hedge_after: Optional[float] = None, deadline: Optional[float] = None) -> httpx.Response:
+        """Sends the request built by `send()` until it succeeds or attempts run out.
+
+        With `hedge_after`, a second identical request is started when the
+        first has not answered within that many seconds; the first response
+        wins. With `deadline`, all attempts together take at most that many
+        seconds: no retry starts after it, and a running attempt is cut off
+        with httpx.ReadTimeout. The last retryable response is returned (or
+        the last transport error raised) when all attempts fail.
+        """
+        give_up_at = time.monotonic() + deadline if deadline else None
+        for attempt in range(self.policy.attempts):
+            trial = self.breaker.before_call()
+            try:
+                if hedge_after:
+                    sending = self._hedged(send, hedge_after)
+                else:
+                    sending = send()
+                response = await (self._until(sending, give_up_at) if give_up_at else sending)
+            except httpx.TransportError as e:
+                self.breaker.record_failure()
+                if attempt + 1 >= self.policy.attempts or self._expired(give_up_at):
+                    raise
+                await self._backoff(attempt, None, f"{type(e).__name__}: {e}", give_up_at)
+                continue
+            except BaseException:
+                # Cancelled or broken otherwise: settle the trial so the circuit does not stay half-open
+                if trial and self.breaker.state == 'half_open':
+                    self.breaker.record_failure()
+                raise
+            if response.status_code not in RETRYABLE_STATUS:
+                self.breaker.record_success()
+                return response
+            self.breaker.record_failure()
+            if attempt + 1 >= self.policy.attempts or self._expired(give_up_at):
+                return response
+            await self._backoff(attempt, retry_after_seconds(response.headers), f"status {response.status_code}", give_up_at)
+        raise AssertionError("unreachable")
+
+    async def _until(self, sending: Awaitable[httpx.Response], give_up_at: float) -> httpx.Response:
+        try:
+            return await asyncio.wait_for(sending, timeout=max(0.0, give_up_at - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise httpx.ReadTimeout(f"{self.name} request deadline exceeded") from None
+
+    @staticmethod
+    def _expired(give_up_at: Optional[float]) -> bool:
+        return give_up_at is not None and time.monotonic() >= give_up_at
+
+    async def open_stream(self, client: httpx.AsyncClient, request: httpx.Request,
+                          deadline: Optional[float] = None) -> httpx.Response:
+        """Sends a streaming request with retries until the response headers are good.
+
+        The caller owns the returned response and must aclose() it. Nothing is
+        retried once the body is being read; `deadline` bounds the attempts
+        until then, as in call().
+        """
+        async def send() -> httpx.Response:
+            response = await client.send(request, stream=True)
+            if response.status_code in RETRYABLE_STATUS:
+                await response.aread()  # Small error body; frees the connection
+            return response
+        return await self.call(send, deadline=deadline)
+
+    async def _backoff(self, attempt: int, retry_after: Optional[float], reason: str,
+                       give_up_at: Optional[float] = None) -> None:
+        delay = self.policy.delay(attempt, retry_after)
+        if give_up_at is not None:
+            delay = min(delay, max(0.0, give_up_at - time.monotonic()))
+        self.retries += 1
+        logger.warning(f"{self.name} request failed ({reason}), retrying in {delay:.2f}s "
+                       f"(attempt {attempt + 2}/{self.policy.attempts})")
+        await asyncio.sleep(delay)
+
+    async def _hedged(self, send: Callable[[], Awaitable[httpx.Response]], hedge_after: float) -> httpx.Response:
+        pending = {asyncio.ensure_future(send())}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge_after)
+            if done:
+                return done.pop().result()
+            self.hedges += 1
+            pending.add(asyncio.ensure_future(send()))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # Prefer a usable response; fall back to whatever finishes last
+                    if not pending or (task.exception() is None and task.result().status_code not in RETRYABLE_STATUS):
+                        return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise AssertionError("unreachable")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.breaker.stats(), 'retries': self.retries, 'hedges': self.hedges}
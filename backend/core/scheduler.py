@@ -0,0 +1,268 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.getenv('LLM_WORKERS', '4'))
+DEFAULT_QUEUE_SIZE = int(os.getenv('LLM_QUEUE_SIZE', '32'))
+STATS_WINDOW = 200  # Number of recent jobs used for wait/run time statistics
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the scheduler queue is full."""
+
+    def __init__(self, retry_after: int, queue_depth: int):
+        super().__init__(f"Service is busy ({queue_depth} requests queued). Retry in {retry_after}s.")
+        self.retry_after = retry_after
+        self.queue_depth = queue_depth
+
+
+class JobScheduler:
+    """Bounded async job queue drained by a fixed pool of worker tasks.
+
+    submit() never blocks: it either enqueues the call and returns a future for
+    its result, or raises QueueFullError so the caller can answer 503 right
+    away instead of piling more requests onto the upstream API. An optional
+    `admit` callback runs first and may reject the job by raising (e.g. a
+    client over its quota). submit_shared() coalesces identical concurrent
+    calls into one job (single-flight).
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE, name: str = "llm",
+                 admit: Optional[Callable[[], None]] = None):
+        self.name = name
+        self.admit = admit
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks = []
+        self._running = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._coalesced = 0
+        self._flights: Dict[str, List[Any]] = {}  # key -> [shared future, number of waiters, listeners, events]
+        self._wait_times = deque(maxlen=STATS_WINDOW)
+        self._run_times = deque(maxlen=STATS_WINDOW)
+
+    @property
+    def started(self) -> bool:
+        return bool(self._worker_tasks)
+
+    def start(self) -> None:
+        if self.started:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._worker_tasks = [asyncio.ensure_future(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Scheduler '{self.name}' started with {self.workers} workers and queue size {self.queue_size}")
+
+    async def stop(self) -> None:
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        # Fail whatever is still waiting so no caller hangs
+        while self._queue is not None and not self._queue.empty():
+            future = self._queue.get_nowait()[3]
+            if not future.done():
+                future.set_exception(RuntimeError(f"Scheduler '{self.name}' stopped"))
+
+    def submit(self, fn: Callable, *args, **kwargs) -> asyncio.Future:
+        """Queues fn(*args, **kwargs) and returns a future for its result.
+
+        The call runs in the submitter's context (contextvars), so request-scoped
+        state is visible to it.
+        """
+        if not self.started:
+            raise RuntimeError(f"Scheduler '{self.name}' is not running")
+        if self.admit is not None:
+            self.admit()
+        future = asyncio.get_running_loop().create_future()
+        item = (fn, args, kwargs, future, time.monotonic(), contextvars.copy_context())
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self._rejected += 1
+            raise QueueFullError(self.retry_after(), self._queue.qsize())
+        self._submitted += 1
+        return future
+
+    def submit_shared(self, key: str, fn: Callable, *args, broadcast: Optional[str] = None, **kwargs) -> asyncio.Future:
+        """Like submit(), but calls with the same `key` share one job while it is queued or running.
+
+        The first call is admitted and queued as usual; later calls with the
+        same key join it (without admission, as they cost no upstream call)
+        and get the same result. Every caller gets its own future: cancelling
+        it cancels the shared job only once all of its callers have cancelled.
+
+        `broadcast` names a callback keyword argument (e.g. a progress
+        callback): the job calls every caller's callback, and a caller that
+        joins late first gets the calls it missed replayed.
+        """
+        listener = kwargs.pop(broadcast, None) if broadcast else None
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = [None, 0, [], []]
+            if broadcast:
+                kwargs[broadcast] = functools.partial(self._broadcast, flight)
+            flight[0] = self.submit(fn, *args, **kwargs)
+            self._flights[key] = flight
+            flight[0].add_done_callback(lambda _, key=key, flight=flight: self._end_flight(key, flight))
+        else:
+            self._coalesced += 1
+        if listener is not None:
+            for event_args, event_kwargs in flight[3]:
+                self._notify(listener, event_args, event_kwargs)
+            flight[2].append(listener)
+        waiter = self._waiter(flight)
+        if listener is not None:
+            waiter.add_done_callback(lambda _: flight[2].remove(listener))
+        return waiter
+
+    def _broadcast(self, flight: List[Any], *args, **kwargs) -> None:
+        flight[3].append((args, kwargs))
+        for listener in list(flight[2]):
+            self._notify(listener, args, kwargs)
+
+    @staticmethod
+    def _notify(listener: Callable, args: tuple, kwargs: Dict[str, Any]) -> None:
+        try:
+            listener(*args, **kwargs)
+        except Exception as e:  # One caller's callback never breaks the others or the job
+            logger.warning(f"Shared job listener failed: {e}")
+
+    def _end_flight(self, key: str, flight: List[Any]) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _waiter(self, flight: List[Any]) -> asyncio.Future:
+        shared = flight[0]
+        waiter = asyncio.get_running_loop().create_future()
+        flight[1] += 1
+
+        def deliver(done: asyncio.Future) -> None:
+            if waiter.done():
+                return
+            if done.cancelled():
+                waiter.cancel()
+            elif done.exception() is not None:
+                waiter.set_exception(done.exception())
+            else:
+                waiter.set_result(done.result())
+
+        def release(waited: asyncio.Future) -> None:
+            if waited.cancelled():
+                flight[1] -= 1
+                if flight[1] == 0 and not shared.done():
+                    shared.cancel()  # Nobody is waiting for the result any more
+
+        shared.add_done_callback(deliver)
+        waiter.add_done_callback(release)
+        return waiter
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            fn, args, kwargs, future, enqueued_at, context = await self._queue.get()
+            try:
+                if future.done():  # Caller gave up while queued
+                    continue
+                started_at = time.monotonic()
+                self._wait_times.append(started_at - enqueued_at)
+                self._running += 1
+                # Create the task inside the caller's context so it inherits its contextvars
+                task = context.run(asyncio.ensure_future, fn(*args, **kwargs))
+                future.add_done_callback(lambda f, task=task: task.cancel() if f.cancelled() else None)
+                try:
+                    result = await task
+                except asyncio.CancelledError:
+                    if not future.cancelled():
+                        # The worker itself is being cancelled (stop()); the running call goes with it
+                        task.cancel()
+                        if not future.done():
+                            future.set_exception(RuntimeError(f"Scheduler '{self.name}' stopped"))
+                        raise
+                except Exception as e:
+                    self._failed += 1
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    self._completed += 1
+                    if not future.done():
+                        future.set_result(result)
+                finally:
+                    self._running -= 1
+                    self._run_times.append(time.monotonic() - started_at)
+            finally:
+                self._queue.task_done()
+
+    def retry_after(self) -> int:
+        """Estimates (in whole seconds) how long until a queue slot frees up."""
+        avg_run = sum(self._run_times) / len(self._run_times) if self._run_times else 1.0
+        depth = self._queue.qsize() if self._queue is not None else 0
+        return max(1, math.ceil(avg_run * (depth + 1) / self.workers))
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._wait_times)
+        return {
+            'name': self.name,
+            'workers': self.workers,
+            'running': self._running,
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'queue_size': self.queue_size,
+            'submitted': self._submitted,
+            'completed': self._completed,
+            'failed': self._failed,
+            'rejected': self._rejected,
+            'coalesced': self._coalesced,
+            'in_flight_keys': len(self._flights),
+            'wait_seconds_avg': round(sum(waits) / len(waits), 4) if waits else 0.0,
+            'wait_seconds_p95': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 4) if waits else 0.0,
+            'wait_seconds_max': round(waits[-1], 4) if waits else 0.0,
+        }
+
+
+class ScheduledService:
+    """Wraps an agent so that the listed coroutine methods go through a JobScheduler.
+
+    Calling a scheduled method returns an awaitable future (or raises
+    QueueFullError, or the admission error, immediately); every other
+    attribute is passed through. For methods listed in `keys`, the key
+    function is called with the same arguments; concurrent calls with the
+    same key share one job (a None key opts the call out). `broadcasts` maps
+    a method to its callback argument that every sharing caller receives
+    (see JobScheduler.submit_shared).
+    """
+
+    def __init__(self, service: Any, scheduler: JobScheduler, methods: Iterable[str],
+                 keys: Optional[Dict[str, Callable[..., Optional[str]]]] = None,
+                 broadcasts: Optional[Dict[str, str]] = None):
+        self._service = service
+        self._scheduler = scheduler
+        self._methods = frozenset(methods)
+        self._keys = keys or {}
+        self._broadcasts = broadcasts or {}
+
+    @property
+    def wrapped(self) -> Any:
+        return self._service
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._service, name)
+        if name in self._methods:
+            key_fn = self._keys.get(name)
+
+            def scheduled(*args, **kwargs):
+                key = key_fn(*args, **kwargs) if key_fn is not None else None
+                if key is not None:
+                    return self._scheduler.submit_shared(key, attr, *args, broadcast=self._broadcasts.get(name), **kwargs)
+                return self._scheduler.submit(attr, *args, **kwargs)
+            return scheduled
+        return attr
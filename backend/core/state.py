@@ -0,0 +1,260 @@
+import asyncio
+import datetime
+import functools
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.persistence import MongoStore
+
+logger = logging.getLogger(__name__)
+
+# "memory" (one process), "sqlite" (processes on one host, also for tests) or "mongo" (several hosts)
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory').lower()
+# Relative paths are resolved against the backend directory, not the working directory
+STATE_SQLITE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 os.getenv('STATE_SQLITE_PATH', os.path.join('.state', 'state.db')))
+# Expired SQLite rows are deleted at most this often
+STATE_PURGE_INTERVAL_SECONDS = 60
+
+STATE_COLLECTION = 'state'
+STATE_ITEMS_COLLECTION = 'state_items'
+STATE_BLOBS_COLLECTION = 'state_blobs'
+
+
+class MemoryState:
+    """Process-local state: the single-worker default, with the same interface as the shared backends.
+
+    Values are JSON-serializable objects stored under (namespace, key);
+    `append`/`items` keep ordered lists (e.g. job events, by sequence
+    number); blobs hold bytes (e.g. archives). Everything accepts a TTL in
+    seconds after which it is gone.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._values: Dict[Tuple[str, str], Tuple[Optional[float], Any]] = {}
+        self._items: Dict[Tuple[str, str], Tuple[Optional[float], Dict[int, Any]]] = {}
+        self._blobs: Dict[str, Tuple[Optional[float], bytes]] = {}
+
+    @staticmethod
+    def _live(entry) -> bool:
+        return entry is not None and (entry[0] is None or entry[0] > time.time())
+
+    @staticmethod
+    def _expiry(ttl: Optional[float]) -> Optional[float]:
+        return time.time() + ttl if ttl else None
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        entry = self._values.get((namespace, key))
+        return entry[1] if self._live(entry) else None
+
+    async def put(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._values[(namespace, key)] = (self._expiry(ttl), value)
+
+    async def delete(self, namespace: str, key: str) -> None:
+        self._values.pop((namespace, key), None)
+
+    async def append(self, namespace: str, key: str, seq: int, value: Any, ttl: Optional[float] = None) -> None:
+        entry = self._items.get((namespace, key))
+        items = entry[1] if self._live(entry) else {}
+        items[seq] = value
+        self._items[(namespace, key)] = (self._expiry(ttl), items)
+
+    async def items(self, namespace: str, key: str, after: int = 0) -> List[Any]:
+        entry = self._items.get((namespace, key))
+        if not self._live(entry):
+            return []
+        return [value for seq, value in sorted(entry[1].items()) if seq > after]
+
+    async def put_blob(self, key: str, data: bytes, ttl: Optional[float] = None) -> None:
+        self._blobs[key] = (self._expiry(ttl), data)
+
+    async def get_blob(self, key: str) -> Optional[bytes]:
+        entry = self._blobs.get(key)
+        return entry[1] if self._live(entry) else None
+
+    async def close(self) -> None:
+        pass
+
+
+class SQLiteState:
+    """State in a SQLite file shared by every worker process on the host.
+
+    WAL mode lets workers read while another one writes. Calls run on a
+    single thread that owns the connection, so the event loop never waits
+    on disk. Expired rows are skipped on reads and purged periodically.
+    """
+
+    shared = True
+
+    def __init__(self, path: str = STATE_SQLITE_PATH):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state")
+        self._connection: Optional[sqlite3.Connection] = None
+        self._purged_at = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS kv (namespace TEXT, key TEXT, value TEXT, expires_at REAL,
+                                               PRIMARY KEY (namespace, key));
+                CREATE TABLE IF NOT EXISTS items (namespace TEXT, key TEXT, seq INTEGER, value TEXT, expires_at REAL,
+                                                  PRIMARY KEY (namespace, key, seq));
+                CREATE TABLE IF NOT EXISTS blobs (key TEXT PRIMARY KEY, data BLOB, expires_at REAL);
+            ''')
+            self._connection = connection
+        return self._connection
+
+    async def _run(self, fn: Callable, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._call, fn, *args))
+
+    def _call(self, fn: Callable, *args) -> Any:
+        connection = self._connect()
+        now = time.time()
+        if now - self._purged_at > STATE_PURGE_INTERVAL_SECONDS:
+            self._purged_at = now
+            for table in ('kv', 'items', 'blobs'):
+                connection.execute(f'DELETE FROM {table} WHERE expires_at IS NOT NULL AND expires_at < ?', (now,))
+        return fn(connection, now, *args)
+
+    @staticmethod
+    def _expiry(now: float, ttl: Optional[float]) -> Optional[float]:
+        return now + ttl if ttl else None
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        def get(connection, now):
+            row = connection.execute(
+                'SELECT value FROM kv WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at >= ?)',
+                (namespace, key, now)).fetchone()
+            return json.loads(row[0]) if row else None
+        return await self._run(get)
+
+    async def put(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        def put(connection, now):
+            connection.execute('INSERT OR REPLACE INTO kv VALUES (?, ?, ?, ?)',
+                               (namespace, key, json.dumps(value), self._expiry(now, ttl)))
+        await self._run(put)
+
+    async def delete(self, namespace: str, key: str) -> None:
+        await self._run(lambda connection, now: connection.execute(
+            'DELETE FROM kv WHERE namespace = ? AND key = ?', (namespace, key)))
+
+    async def append(self, namespace: str, key: str, seq: int, value: Any, ttl: Optional[float] = None) -> None:
+        def append(connection, now):
+            connection.execute('INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?)',
+                               (namespace, key, seq, json.dumps(value), self._expiry(now, ttl)))
+        await self._run(append)
+
+    async def items(self, namespace: str, key: str, after: int = 0) -> List[Any]:
+        def items(connection, now):
+            rows = connection.execute(
+                'SELECT value FROM items WHERE namespace = ? AND key = ? AND seq > ? '
+                'AND (expires_at IS NULL OR expires_at >= ?) ORDER BY seq', (namespace, key, after, now)).fetchall()
+            return [json.loads(row[0]) for row in rows]
+        return await self._run(items)
+
+    async def put_blob(self, key: str, data: bytes, ttl: Optional[float] = None) -> None:
+        await self._run(lambda connection, now: connection.execute(
+            'INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)', (key, sqlite3.Binary(data), self._expiry(now, ttl))))
+
+    async def get_blob(self, key: str) -> Optional[bytes]:
+        def get_blob(connection, now):
+            row = connection.execute(
+                'SELECT data FROM blobs WHERE key = ? AND (expires_at IS NULL OR expires_at >= ?)', (key, now)).fetchone()
+            return bytes(row[0]) if row else None
+        return await self._run(get_blob)
+
+    async def close(self) -> None:
+        def close(connection, now):
+            connection.close()
+            self._connection = None
+        if self._connection is not None:
+            await self._run(close)
+        self._executor.shutdown(wait=False)
+
+
+class MongoState:
+    """State in MongoDB, shared by every worker on every host.
+
+    Goes through the app's MongoStore (its thread pool and timeouts); TTL
+    indexes on `expires_at` remove expired documents, and reads also skip
+    them since the TTL monitor only runs once a minute. Blobs are limited to
+    MongoDB's 16 MB document size.
+    """
+
+    shared = True
+
+    def __init__(self, store: MongoStore):
+        self.store = store
+
+    async def ensure_indexes(self) -> None:
+        for collection in (STATE_COLLECTION, STATE_ITEMS_COLLECTION, STATE_BLOBS_COLLECTION):
+            await self.store.create_index(collection, 'expires_at', expireAfterSeconds=0)
+        await self.store.create_index(STATE_ITEMS_COLLECTION, [('namespace', 1), ('key', 1), ('seq', 1)], unique=True)
+
+    @staticmethod
+    def _expiry(ttl: Optional[float]) -> Optional[datetime.datetime]:
+        return datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl) if ttl else None
+
+    @staticmethod
+    def _live(document: Optional[Dict[str, Any]]) -> bool:
+        return document is not None and (document.get('expires_at') is None
+                                         or document['expires_at'] > datetime.datetime.utcnow())
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        document = await self.store.find_one(STATE_COLLECTION, {'_id': f"{namespace}:{key}"})
+        return document['value'] if self._live(document) else None
+
+    async def put(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        # Items appended before are written first, so a record is never visible before its events
+        await self.store.flush(STATE_ITEMS_COLLECTION)
+        await self.store.update_one(STATE_COLLECTION, {'_id': f"{namespace}:{key}"},
+                                    {'$set': {'value': value, 'expires_at': self._expiry(ttl)}}, upsert=True)
+
+    async def delete(self, namespace: str, key: str) -> None:
+        await self.store.update_one(STATE_COLLECTION, {'_id': f"{namespace}:{key}"},
+                                    {'$set': {'expires_at': datetime.datetime.utcnow()}})
+
+    async def append(self, namespace: str, key: str, seq: int, value: Any, ttl: Optional[float] = None) -> None:
+        # Batched: events of a job are written in order with the store's next bulk write, or before the next put()
+        self.store.update_batched(STATE_ITEMS_COLLECTION, {'namespace': namespace, 'key': key, 'seq': seq},
+                                  {'$set': {'value': value, 'expires_at': self._expiry(ttl)}}, upsert=True)
+
+    async def items(self, namespace: str, key: str, after: int = 0) -> List[Any]:
+        documents = await self.store.find(STATE_ITEMS_COLLECTION,
+                                          {'namespace': namespace, 'key': key, 'seq': {'$gt': after}})
+        return [document['value'] for document in sorted(documents, key=lambda d: d['seq']) if self._live(document)]
+
+    async def put_blob(self, key: str, data: bytes, ttl: Optional[float] = None) -> None:
+        await self.store.update_one(STATE_BLOBS_COLLECTION, {'_id': key},
+                                    {'$set': {'data': data, 'expires_at': self._expiry(ttl)}}, upsert=True)
+
+    async def get_blob(self, key: str) -> Optional[bytes]:
+        document = await self.store.find_one(STATE_BLOBS_COLLECTION, {'_id': key})
+        return bytes(document['data']) if self._live(document) else None
+
+    async def close(self) -> None:
+        await self.store.flush(STATE_ITEMS_COLLECTION)
+
+
+def open_state(backend: str = STATE_BACKEND):
+    """The state backend selected by STATE_BACKEND ("mongo" starts in memory until MongoDB is connected)."""
+    if backend == 'sqlite':
+        logger.info(f"Shared state in SQLite at {STATE_SQLITE_PATH}")
+        return SQLiteState()
+    if backend not in ('memory', 'mongo'):
+        logger.warning(f"Unknown STATE_BACKEND '{backend}'; keeping state in memory")
+    return MemoryState()
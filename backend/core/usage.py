@@ -0,0 +1,242 @@
+import contextvars
+import datetime
+import hashlib
+import logging
+import os
+import threading
+from typing import Any, Container, Dict, List, Optional
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+# Gemini tokens (prompt + output) each client may use per UTC day; 0 = unlimited
+USAGE_DAILY_TOKEN_QUOTA = int(os.getenv('USAGE_DAILY_TOKEN_QUOTA', '0'))
+# The clients accounted on their own, with their quotas, e.g. "key:3f2a9c01d4e5=5000000,team-a=0";
+# every other caller counts against the shared "anonymous" client
+USAGE_CLIENT_QUOTAS = os.getenv('USAGE_CLIENT_QUOTAS', '')
+# USD per million tokens (gemini-1.5-flash list prices), for cost estimates only
+GEMINI_PRICE_PROMPT_PER_MTOK = float(os.getenv('GEMINI_PRICE_PROMPT_PER_MTOK', '0.075'))
+GEMINI_PRICE_OUTPUT_PER_MTOK = float(os.getenv('GEMINI_PRICE_OUTPUT_PER_MTOK', '0.30'))
+
+USAGE_COLLECTION = 'gemini_usage'
+API_KEY_HEADER = b'x-api-key'
+CLIENT_ID_HEADER = b'x-client-id'
+
+client_var: contextvars.ContextVar[str] = contextvars.ContextVar('usage_client', default='anonymous')
+endpoint_var: contextvars.ContextVar[str] = contextvars.ContextVar('usage_endpoint', default='')
+
+
+class QuotaExceededError(Exception):
+    """Raised at admission when a client has used up its daily token quota."""
+
+    def __init__(self, client: str, used: int, quota: int, retry_after: int):
+        super().__init__(f"Daily Gemini token quota of {quota} exhausted for client '{client}'. Retry in {retry_after}s.")
+        self.client = client
+        self.used = used
+        self.quota = quota
+        self.retry_after = retry_after
+
+
+def parse_client_quotas(spec: str) -> Dict[str, int]:
+    quotas = {}
+    for item in spec.split(','):
+        client, sep, tokens = item.strip().rpartition('=')
+        if not sep or not client:
+            continue
+        try:
+            quotas[client.strip()] = int(tokens)
+        except ValueError:
+            logger.warning(f"Ignoring invalid quota '{item.strip()}' in USAGE_CLIENT_QUOTAS")
+    return quotas
+
+
+def client_id(headers: Dict[bytes, bytes], known: Container[str]) -> str:
+    """Identifies the caller: a hash of its API key or its X-Client-Id, if that is a `known` client.
+
+    Everyone else is 'anonymous'. Rotating keys or ids therefore never buys
+    a fresh quota, and the number of clients (and of their metric labels)
+    is bounded by the configuration. API keys are never stored or logged,
+    only the first 12 hex digits of their SHA-256.
+    """
+    api_key = headers.get(API_KEY_HEADER)
+    if api_key:
+        key_id = 'key:' + hashlib.sha256(api_key).hexdigest()[:12]
+        if key_id in known:
+            return key_id
+    name = headers.get(CLIENT_ID_HEADER, b'').decode('latin-1').strip()
+    if name in known:
+        return name
+    return 'anonymous'
+
+
+def _today() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d')
+
+
+def seconds_until_reset() -> int:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    midnight = (now + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(1, int((midnight - now).total_seconds()))
+
+
+class UsageLedger:
+    """Gemini token and cost accounting per client and endpoint, with daily quotas.
+
+    record() is fed the usageMetadata of every Gemini response and
+    attributes it to the client and endpoint of the current request (set by
+    UsageMiddleware; scheduler jobs run in the request's context). check()
+    is the LLM scheduler's admission hook, so a client over its quota is
+    rejected before any upstream call and cache hits are never counted. A
+    request admitted under quota runs to completion, so a client can
+    overshoot by at most its in-flight requests. Only the clients listed in
+    `client_quotas` are accounted on their own; all other callers share the
+    'anonymous' client and its quota.
+
+    With a MongoDB store attached, totals per client, endpoint and day are
+    upserted in batches, and today's usage is loaded on startup so quotas
+    survive restarts.
+    """
+
+    def __init__(self, daily_quota: int = USAGE_DAILY_TOKEN_QUOTA, client_quotas: Optional[Dict[str, int]] = None,
+                 prompt_price: float = GEMINI_PRICE_PROMPT_PER_MTOK, output_price: float = GEMINI_PRICE_OUTPUT_PER_MTOK):
+        self.daily_quota = daily_quota
+        self.client_quotas = client_quotas if client_quotas is not None else parse_client_quotas(USAGE_CLIENT_QUOTAS)
+        self.prompt_price = prompt_price
+        self.output_price = output_price
+        self.store = None
+        self._day = _today()
+        self._used_today: Dict[str, int] = {}          # client -> tokens since UTC midnight
+        self._totals: Dict[str, List[float]] = {}      # client -> [prompt, output, calls, cost] since startup
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def quota_for(self, client: str) -> int:
+        return self.client_quotas.get(client, self.daily_quota)
+
+    def _roll_day(self) -> None:
+        today = _today()
+        if today != self._day:
+            self._day = today
+            self._used_today = {}
+
+    def used_today(self, client: str) -> int:
+        with self._lock:
+            self._roll_day()
+            return self._used_today.get(client, 0)
+
+    def check(self, client: Optional[str] = None) -> None:
+        """Raises QuotaExceededError when `client` (default: the current request's) is over quota."""
+        client = client or client_var.get()
+        quota = self.quota_for(client)
+        if quota <= 0:
+            return
+        used = self.used_today(client)
+        if used >= quota:
+            self.rejected += 1
+            raise QuotaExceededError(client, used, quota, seconds_until_reset())
+
+    def record(self, usage: Optional[Dict[str, Any]]) -> None:
+        """Accounts the tokens of a Gemini usageMetadata object to the current client and endpoint."""
+        if not usage:
+            return
+        prompt = int(usage.get('promptTokenCount', 0))
+        output = int(usage.get('candidatesTokenCount', 0))
+        cost = (prompt * self.prompt_price + output * self.output_price) / 1_000_000
+        client, endpoint = client_var.get(), endpoint_var.get()
+        metrics.gemini_tokens.inc(prompt, kind="prompt", endpoint=endpoint)
+        metrics.gemini_tokens.inc(output, kind="output", endpoint=endpoint)
+        metrics.gemini_cost.inc(cost, endpoint=endpoint)
+        with self._lock:
+            self._roll_day()
+            self._used_today[client] = self._used_today.get(client, 0) + prompt + output
+            totals = self._totals.setdefault(client, [0, 0, 0, 0.0])
+            totals[0] += prompt
+            totals[1] += output
+            totals[2] += 1
+            totals[3] += cost
+            day = self._day
+        if self.store is not None:
+            self.store.update_batched(
+                USAGE_COLLECTION,
+                {'client': client, 'endpoint': endpoint, 'day': day},
+                {
+                    '$inc': {'prompt_tokens': prompt, 'output_tokens': output, 'calls': 1, 'cost_usd': cost},
+                    '$set': {'updated_at': datetime.datetime.now(datetime.timezone.utc)},
+                },
+                upsert=True
+            )
+
+    async def attach(self, store) -> None:
+        """Persists usage to `store` (a MongoStore) from now on and loads today's totals from it."""
+        await store.create_index(USAGE_COLLECTION, [('day', 1), ('client', 1), ('endpoint', 1)], unique=True)
+        day = _today()
+        documents = await store.find(USAGE_COLLECTION, {'day': day}, {'client': 1, 'prompt_tokens': 1, 'output_tokens': 1})
+        loaded: Dict[str, int] = {}
+        for document in documents:
+            client = document.get('client', 'anonymous')
+            if client not in self.client_quotas:
+                client = 'anonymous'  # Recorded before the client was folded, e.g. an address
+            loaded[client] = loaded.get(client, 0) + document.get('prompt_tokens', 0) + document.get('output_tokens', 0)
+        with self._lock:
+            self._roll_day()
+            if day == self._day:
+                # Tokens recorded before the store was attached are not in MongoDB yet
+                for client, tokens in loaded.items():
+                    self._used_today[client] = self._used_today.get(client, 0) + tokens
+        self.store = store
+        logger.info(f"Loaded today's Gemini usage for {len(loaded)} clients")
+
+    def client_stats(self, client: str) -> Dict[str, Any]:
+        quota = self.quota_for(client)
+        used = self.used_today(client)
+        prompt, output, calls, cost = self._totals.get(client, [0, 0, 0, 0.0])
+        return {
+            'client': client,
+            'day': self._day,
+            'tokensToday': used,
+            'dailyQuota': quota or None,
+            'remainingToday': max(0, quota - used) if quota > 0 else None,
+            'resetsInSeconds': seconds_until_reset(),
+            'sinceStartup': {'promptTokens': prompt, 'outputTokens': output, 'calls': calls, 'costUsd': round(cost, 6)},
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._roll_day()
+            return {
+                'day': self._day,
+                'rejected': self.rejected,
+                'clients': {
+                    client: {'prompt_tokens': totals[0], 'output_tokens': totals[1], 'calls': totals[2],
+                             'cost_usd': totals[3], 'tokens_today': self._used_today.get(client, 0)}
+                    for client, totals in self._totals.items()
+                },
+            }
+
+
+# Shared by the agents (record) and the LLM scheduler (check)
+ledger = UsageLedger()
+
+
+def record_usage(usage: Optional[Dict[str, Any]]) -> None:
+    ledger.record(usage)
+
+
+class UsageMiddleware:
+    """ASGI middleware that sets the client and endpoint Gemini usage is attributed to."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        client_token = client_var.set(client_id(dict(scope.get('headers', [])), ledger.client_quotas))
+        endpoint_token = endpoint_var.set(scope.get('path', ''))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            endpoint_var.reset(endpoint_token)
+            client_var.reset(client_token)
@@ -0,0 +1,55 @@
+import posixpath
+import uuid
+from typing import Dict, Iterator, Optional
+
+from core.archive import build_zip, stream_zip
+
+
+class ProjectWorkspace:
+    """In-memory workspace for a single project generation.
+
+    Each call to DevBot.generate_project gets its own workspace, so concurrent
+    generations never share files on disk. Files are kept as a path -> content
+    map and the ZIP archive is built (or streamed) in memory on demand.
+    """
+
+    def __init__(self, workspace_id: Optional[str] = None):
+        self.id = workspace_id or uuid.uuid4().hex
+        self.files: Dict[str, str] = {}  # Relative path -> file content
+
+    @staticmethod
+    def sanitize_path(file_name: str) -> Optional[str]:
+        """Normalizes a generated file name into a safe relative path.
+
+        Returns None if the path would escape the workspace root.
+        """
+        if not isinstance(file_name, str):
+            return None
+        # Normalize path separators and remove leading slashes
+        normalized = posixpath.normpath(file_name.replace('\\', '/').lstrip('/'))
+        if normalized in ('', '.') or normalized == '..' or normalized.startswith('../'):
+            return None
+        return normalized
+
+    def add_file(self, file_name: str, content: str) -> Optional[str]:
+        """Adds a file to the workspace. Returns the stored path, or None if it was rejected."""
+        path = self.sanitize_path(file_name)
+        if path is None:
+            return None
+        self.files[path] = content
+        return path
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    @property
+    def zip_filename(self) -> str:
+        return "generated_project.zip"
+
+    def iter_zip(self, compresslevel: Optional[int] = None) -> Iterator[bytes]:
+        """Streams the project ZIP archive chunk by chunk as it is compressed."""
+        return stream_zip(self.files, compresslevel)
+
+    def build_zip(self, compresslevel: Optional[int] = None) -> bytes:
+        """Builds the project ZIP archive in memory and returns its bytes."""
+        return build_zip(self.files, compresslevel)
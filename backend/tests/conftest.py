@@ -0,0 +1,51 @@
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def serve():
+    """Runs ASGI apps on local ports in background threads; returns their base URLs."""
+    import uvicorn
+
+    servers = []
+
+    def start(app) -> str:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        deadline = time.monotonic() + 10
+        while not server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Test server did not start")
+            time.sleep(0.01)
+        servers.append((server, thread))
+        return f"http://127.0.0.1:{port}"
+
+    yield start
+    for server, thread in servers:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    """The FastAPI app module, imported without external services (lifespan not run).
+
+    Settings from backend/.env are not applied over these, so tests never
+    reach the real MongoDB, Gemini or GitHub.
+    """
+    for name in ("MONGODB_URI", "GEMINI_API_KEY", "GITHUB_TOKEN"):
+        os.environ[name] = ""
+    os.environ["STATE_BACKEND"] = "memory"
+    import app
+    return app
@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+import httpx
+import mongomock
+
+from core.credentials import SESSION_COOKIE, CredentialStore, new_session_id
+from core.persistence import MongoStore
+from core.state import MemoryState, MongoState, SQLiteState
+
+
+def test_credentials_are_encrypted_under_a_hashed_session_id(tmp_path):
+    state = SQLiteState(str(tmp_path / "state.db"))
+    store = CredentialStore(state, "github_tokens", ttl=60, secret="test-secret")
+    session_id = new_session_id()
+
+    async def scenario():
+        await store.put(session_id, "ghp_secret_token")
+        rows = await state._run(lambda connection, now: connection.execute("SELECT key, value FROM kv").fetchall())
+        found = await store.get(session_id)
+        other = await CredentialStore(state, "github_tokens", ttl=60, secret="other-secret").get(session_id)
+        await state.close()
+        return rows, found, other
+
+    rows, found, other = asyncio.run(scenario())
+    assert found == "ghp_secret_token"
+    assert other is None  # Another secret cannot read it
+    [(key, value)] = rows
+    assert session_id not in key and "ghp_secret_token" not in value
+    assert "credential" in json.loads(value)
+
+
+def test_without_secret_credentials_stay_in_the_worker(tmp_path):
+    state = SQLiteState(str(tmp_path / "state.db"))
+    store = CredentialStore(state, "github_tokens", ttl=60, secret="")
+    session_id = new_session_id()
+
+    async def scenario():
+        await store.put(session_id, "ghp_secret_token")
+        rows = await state._run(lambda connection, now: connection.execute("SELECT * FROM kv").fetchall())
+        found = await store.get(session_id)
+        await state.close()
+        return rows, found
+
+    rows, found = asyncio.run(scenario())
+    assert found == "ghp_secret_token"
+    assert rows == []
+    assert isinstance(store.state, MemoryState)
+
+
+def test_token_set_on_one_worker_is_read_by_another():
+    db = mongomock.MongoClient().db
+    session_id = new_session_id()
+
+    async def scenario():
+        # Each worker starts in memory and switches to MongoDB once it is connected
+        workers = [CredentialStore(MemoryState(), "github_tokens", ttl=60, secret="test-secret") for _ in range(2)]
+        for worker in workers:
+            worker.use_state(MongoState(MongoStore(db)))
+        await workers[0].put(session_id, "ghp_secret_token")
+        return await workers[1].get(session_id)
+
+    assert asyncio.run(scenario()) == "ghp_secret_token"
+
+
+def test_init_mongodb_moves_tokens_to_the_shared_state(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "connect_mongodb", mongomock.MongoClient)
+    monkeypatch.setattr(app_module, "STATE_BACKEND", "mongo")
+    monkeypatch.setattr(app_module, "github_tokens", CredentialStore(MemoryState(), "github_tokens", ttl=60,
+                                                                     secret="test-secret"))
+    # init_mongodb() replaces these; restore them afterwards
+    for name in ("state", "mongo_client", "mongo_store", "project_records"):
+        monkeypatch.setattr(app_module, name, getattr(app_module, name))
+    monkeypatch.setattr(app_module.jobs, "state", app_module.jobs.state)
+    monkeypatch.setattr(app_module.usage_ledger, "store", app_module.usage_ledger.store)
+    monkeypatch.setitem(app_module.services, "mongodb", app_module.services.get("mongodb"))
+    monkeypatch.setitem(app_module.startup_state["services"], "mongodb", None)
+
+    asyncio.run(app_module.init_mongodb())
+
+    assert isinstance(app_module.state, MongoState)
+    assert app_module.github_tokens.state is app_module.state
+
+
+class ServerGitHub:
+    """Stands in for the server's GitHub agent; a push must never reach it for a session."""
+
+    async def create_repository(self, repo_name: str) -> str:
+        raise AssertionError("pushed with the server's token")
+
+
+class Records:
+    async def get_files(self, project_id: str):
+        return {"app.py": "print('hi')\n"}
+
+
+def test_session_with_expired_token_does_not_fall_back_to_the_server_token(app_module, monkeypatch):
+    async def get_project_records():
+        return Records()
+
+    monkeypatch.setattr(app_module, "get_project_records", get_project_records)
+    monkeypatch.setitem(app_module.services, "github", ServerGitHub())
+
+    async def push(cookies):
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", cookies=cookies) as client:
+            return await client.post("/api/push-to-github", json={"repoName": "demo", "projectId": "p1"})
+
+    expired = asyncio.run(push({SESSION_COOKIE: new_session_id()}))
+    assert expired.status_code == 401
+    assert "expired" in expired.json()["error"]
@@ -0,0 +1,55 @@
+import asyncio
+
+from agents import dev_bot
+from agents.dev_bot import DevBot
+
+
+def prompt_of(payload) -> str:
+    return payload["contents"][0]["parts"][0]["text"]
+
+
+def make_bot(monkeypatch, manifest, delay: float = 0.0):
+    """DevBot whose Gemini calls answer the manifest, then each batch with the files it asks for."""
+    bot = DevBot(api_key="test", client=object())
+    bot.chunk_files = 1
+    in_flight = {"now": 0, "max": 0}
+
+    async def request(payload):
+        prompt = prompt_of(payload)
+        if prompt.lstrip().startswith("Plan the files"):
+            return {"success": True, "files": [{"name": name} for name in manifest]}
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(delay)
+        in_flight["now"] -= 1
+        # Like Gemini, answers "src/app.py" where "./src/app.py" was asked for
+        listed = prompt.split("Generate ONLY these files:")[-1].split("- ")[1:]
+        return {"success": True, "files": [{"name": name.strip().removeprefix("./"), "content": "x"} for name in listed]}
+
+    monkeypatch.setattr(bot, "_request_files_payload", request)
+    return bot, in_flight
+
+
+def test_chunked_matches_returned_files_on_sanitized_paths(monkeypatch):
+    monkeypatch.setattr(dev_bot, "_batch_slots", None)
+    bot, _ = make_bot(monkeypatch, ["./src/app.py", "README.md"])
+
+    result = asyncio.run(bot.generate_project(["task"], "python", use_cache=False, chunked=True))
+
+    assert result["success"]
+    assert sorted(result["files_created"]) == ["README.md", "src/app.py"]
+    assert "missing_files" not in result
+
+
+def test_chunked_batches_share_a_process_wide_bound(monkeypatch):
+    monkeypatch.setattr(dev_bot, "DEVBOT_CHUNK_CALLS", 2)
+    monkeypatch.setattr(dev_bot, "_batch_slots", None)
+    bot, in_flight = make_bot(monkeypatch, [f"file{i}.py" for i in range(6)], delay=0.02)
+
+    async def two_projects():
+        return await asyncio.gather(*(bot.generate_project(["task"], "python", use_cache=False, chunked=True)
+                                      for _ in range(2)))
+
+    results = asyncio.run(two_projects())
+    assert all(result["success"] and len(result["files_created"]) == 6 for result in results)
+    assert in_flight["max"] == 2
@@ -0,0 +1,131 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+
+from agents import github_agent
+from agents.github_agent import GitHubAgent
+from benchmarks.fake_github import LOGIN, create_app
+
+
+def make_agent(monkeypatch, url: str) -> GitHubAgent:
+    monkeypatch.setattr(github_agent, "GITHUB_API_URL", url)
+    return GitHubAgent(f"token-{uuid.uuid4().hex}")  # Fresh session per test
+
+
+@pytest.mark.parametrize("status", [403, 429])
+def test_create_issues_backs_off_on_rate_limit(monkeypatch, serve, status):
+    fake = create_app(rate_limited_posts=2, rate_limit_status=status, retry_after=1,
+                      seed_issues={f"{LOGIN}/demo": []})
+    agent = make_agent(monkeypatch, serve(fake))
+
+    started = asyncio.run(_timed(agent.create_issues("demo", ["Task A", "Task B", "Task C"])))
+
+    stats = fake.state.stats
+    assert stats["rate_limited"] == 2
+    assert sorted(title for _, title in stats["created"]) == ["Task A", "Task B", "Task C"]
+    # Creations after a rate limit waited for its Retry-After instead of retrying right away
+    assert max(at for at, _ in stats["created"]) - started >= 1
+
+
+def test_create_issues_skips_existing_titles(monkeypatch, serve):
+    existing = [{"title": "Task A", "labels": ["synapse-generated"]}]
+    unrelated = [{"title": f"Bug {i}", "labels": []} for i in range(100)]
+    fake = create_app(seed_issues={f"{LOGIN}/demo": unrelated + existing})
+    agent = make_agent(monkeypatch, serve(fake))
+
+    asyncio.run(agent.create_issues("demo", ["Task A", "Task B", "Task B"]))
+
+    stats = fake.state.stats
+    assert [title for _, title in stats["created"]] == ["Task B"]
+    # Only agent-labelled issues are listed: one page, not the whole history
+    assert stats["issue_pages"] == 1
+
+
+async def _timed(coro) -> float:
+    started = time.monotonic()
+    await coro
+    return started
+
+
+def test_sessions_cached_only_after_verify_and_bounded(monkeypatch, serve):
+    tokens = [f"token-{uuid.uuid4().hex}" for _ in range(3)]
+    monkeypatch.setattr(github_agent, "GITHUB_API_URL", serve(create_app(valid_tokens=tokens)))
+    monkeypatch.setattr(github_agent, "GITHUB_MAX_SESSIONS", 2)
+    monkeypatch.setattr(github_agent, "_sessions", type(github_agent._sessions)())
+    closed = []
+    monkeypatch.setattr(github_agent.GitHubSession, "close", lambda session: closed.append(session))
+
+    rejected = GitHubAgent("garbage")
+    with pytest.raises(Exception):
+        asyncio.run(rejected.verify())
+    assert not github_agent._sessions and closed == [rejected.session]
+
+    agents = [GitHubAgent(token) for token in tokens]
+    for agent in agents:
+        assert asyncio.run(agent.verify()) == LOGIN
+    # The least recently used session was evicted and closed; later agents reuse the others
+    assert len(github_agent._sessions) == 2 and closed[-1] is agents[0].session
+    assert GitHubAgent(tokens[2]).session is agents[2].session
+    assert GitHubAgent(tokens[0]).session is not agents[0].session
+
+
+def head_files(fake, full_name: str) -> dict:
+    git = fake.state.gits[full_name]
+    tree = git["trees"][git["commits"][git["head"]]["tree"]]
+    return {path: git["blobs"][sha] for path, sha in tree.items()}
+
+
+def test_bulk_push_makes_one_tree_and_commit(monkeypatch, serve):
+    fake = create_app(seed_issues={f"{LOGIN}/demo": []})
+    agent = make_agent(monkeypatch, serve(fake))
+    files = {"app.py": "print('hi')\n", "src/util.py": "X = 1\n", "README.md": "# Demo\n"}
+
+    asyncio.run(agent.push_files("demo", files, bulk=True))
+
+    stats = fake.state.stats
+    assert (stats["blob_posts"], stats["tree_posts"], stats["commit_posts"], stats["ref_updates"]) == (3, 1, 1, 1)
+    assert head_files(fake, f"{LOGIN}/demo") == files
+
+
+def test_bulk_push_skips_unchanged_files(monkeypatch, serve):
+    fake = create_app(seed_issues={f"{LOGIN}/demo": []})
+    agent = make_agent(monkeypatch, serve(fake))
+    files = {"app.py": "print('hi')\n", "src/util.py": "X = 1\n"}
+    asyncio.run(agent.push_files("demo", files, bulk=True))
+    stats = fake.state.stats
+
+    asyncio.run(agent.push_files("demo", files, bulk=True))
+    # Nothing changed: no blobs, no tree, no commit
+    assert (stats["blob_posts"], stats["commit_posts"]) == (2, 1)
+
+    asyncio.run(agent.push_files("demo", dict(files, **{"src/util.py": "X = 2\n"}), bulk=True))
+    assert (stats["blob_posts"], stats["tree_posts"], stats["commit_posts"]) == (3, 2, 2)
+    assert head_files(fake, f"{LOGIN}/demo")["src/util.py"] == "X = 2\n"
+    assert head_files(fake, f"{LOGIN}/demo")["app.py"] == "print('hi')\n"
+
+
+def test_session_agents_use_pooled_sessions(monkeypatch, app_module):
+    from starlette.requests import Request
+
+    from core.credentials import SESSION_COOKIE
+
+    monkeypatch.setattr(github_agent, "GITHUB_MAX_SESSIONS", 1)
+    monkeypatch.setattr(github_agent, "_sessions", type(github_agent._sessions)())
+    monkeypatch.setattr(app_module, "github_agents", type(app_module.github_agents)(maxsize=1))
+    closed = []
+    monkeypatch.setattr(github_agent.GitHubSession, "close", lambda session: closed.append(session))
+
+    async def agent_for(session_id: str) -> GitHubAgent:
+        await app_module.github_tokens.put(session_id, f"token-{session_id}")
+        cookie = f"{SESSION_COOKIE}={session_id}".encode()
+        return await app_module.get_github_agent(Request({"type": "http", "headers": [(b"cookie", cookie)]}))
+
+    async def scenario():
+        return await agent_for(uuid.uuid4().hex), await agent_for(uuid.uuid4().hex)
+
+    first, second = asyncio.run(scenario())
+    # The first agent fell out of the agent cache; its session was closed by the pool, not leaked
+    assert closed == [first.session]
+    assert list(session for _, session in github_agent._sessions.values()) == [second.session]
@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import httpx
+
+from core import jobs as jobs_module
+from core.jobs import JobStore, format_sse
+
+
+def stages(events):
+    return [event["stage"] for event in events]
+
+
+async def collect(job, after: int = 0):
+    return [event async for event in job.follow(after) if event is not None]
+
+
+def test_job_lifecycle_and_replay():
+    async def scenario():
+        store = JobStore()
+        job = store.create()
+        assert store.get(job.id) is job and job.status == "queued"
+
+        job.progress("prompt_sent")
+        job.progress("file_parsed", path="a.py", parsed=1, total=2)
+        assert job.status == "running"
+        follower = asyncio.ensure_future(collect(job))
+        await asyncio.sleep(0)
+        job.progress("file_parsed", path="b.py", parsed=2, total=2)
+        job.succeed({"zip_bytes": b"zip", "zip_filename": "p.zip"}, files=2)
+
+        followed = await asyncio.wait_for(follower, timeout=1)
+        replayed = await collect(job, after=2)  # Reconnect with Last-Event-ID: 2
+        return job, followed, replayed
+
+    job, followed, replayed = asyncio.run(scenario())
+    assert stages(followed) == ["started", "prompt_sent", "file_parsed", "file_parsed", "complete"]
+    assert [event["id"] for event in followed] == [1, 2, 3, 4, 5]
+    assert stages(replayed) == ["file_parsed", "file_parsed", "complete"]
+    assert job.finished and job.snapshot()["zipFilename"] == "p.zip"
+
+
+def test_failed_job_ends_its_stream():
+    async def scenario():
+        job = JobStore().create()
+        follower = asyncio.ensure_future(collect(job))
+        await asyncio.sleep(0)
+        job.fail("Gemini is down")
+        return job, await asyncio.wait_for(follower, timeout=1)
+
+    job, followed = asyncio.run(scenario())
+    assert job.status == "failed"
+    assert (followed[-1]["stage"], followed[-1]["error"]) == ("failed", "Gemini is down")
+
+
+def test_finished_jobs_expire_after_ttl():
+    async def scenario():
+        store = JobStore(ttl_seconds=60)
+        done, running = store.create(), store.create()
+        done.succeed({})
+        running.progress("prompt_sent")
+        done.finished_at = time.time() - 61
+        return store, done, running
+
+    store, done, running = asyncio.run(scenario())
+    assert store.get(done.id) is None
+    assert store.get(running.id) is running  # Unfinished jobs never expire
+
+
+def test_keep_alive_while_idle(monkeypatch):
+    monkeypatch.setattr(jobs_module, "SSE_KEEPALIVE_SECONDS", 0.01)
+
+    async def scenario():
+        job = JobStore().create()
+        stream = job.follow()
+        first = await asyncio.wait_for(stream.__anext__(), timeout=1)
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(scenario()) is None
+    assert format_sse(None) == ": keep-alive\n\n"
+
+
+def test_sse_endpoint_replays_and_closes_when_the_job_finishes(app_module):
+    async def scenario():
+        job = app_module.jobs.create()
+        job.progress("prompt_sent")
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            asyncio.get_running_loop().call_later(0.05, job.succeed, {})
+            # Returns only once the stream has closed
+            response = await asyncio.wait_for(
+                client.get(f"/api/jobs/{job.id}/events", headers={"Last-Event-ID": "1"}), timeout=5)
+            missing = await client.get("/api/jobs/unknown/events")
+        return response, missing
+
+    response, missing = asyncio.run(scenario())
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/event-stream")
+    assert [line for line in response.text.splitlines() if line.startswith("event:")] == [
+        "event: prompt_sent", "event: complete"]
+    assert "id: 2" in response.text and "id: 1\n" not in response.text
+    assert missing.status_code == 404
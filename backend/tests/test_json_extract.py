@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from core.json_extract import extract_json, recover_json, repair_json
+
+
+def repaired(text: str):
+    fixed, truncated = repair_json(text)
+    return json.loads(fixed), truncated
+
+
+def test_trailing_commas_are_removed():
+    assert repaired('{"a": [1, 2, ], "b": {"c": 3,},}') == ({"a": [1, 2], "b": {"c": 3}}, False)
+
+
+def test_raw_newlines_and_tabs_in_strings_are_escaped():
+    assert repaired('{"content": "line 1\nline 2\r\n\tindented"}') == ({"content": "line 1\nline 2\r\n\tindented"}, False)
+
+
+def test_truncated_output_keeps_complete_values():
+    text = '{"files": [{"name": "a.py", "content": "x"}, {"name": "b.py", "content": "unfinish'
+    assert repaired(text) == ({"files": [{"name": "a.py", "content": "x"}, {"name": "b.py"}]}, True)
+
+
+def test_truncated_after_a_key_drops_the_key():
+    assert repaired('{"a": 1, "b": ') == ({"a": 1}, True)
+    assert repaired('{"a": 1, "b"') == ({"a": 1}, True)
+
+
+def test_text_after_the_object_is_ignored():
+    assert repaired('{"a": 1} and some prose {"b": 2}') == ({"a": 1}, False)
+
+
+@pytest.mark.parametrize("text", [
+    '{"a": 1, "b": [true, null, 2.5e3], "c": {"d": "x"}}',
+    '{"code": "if (x) { return [1, 2,]; }", "q": "say \\"hi\\", ok"}',
+    '{\n  "list": [\n    "a",\n    "b"\n  ]\n}',
+    '{"unicode": "caf\\u00e9 \\ud83d\\ude00", "empty": {}, "none": []}',
+])
+def test_valid_json_is_not_changed(text):
+    assert repair_json(text) == (text, False)
+
+
+def test_recover_json_reports_truncation():
+    assert recover_json('```json\n{"a": 1}\n```') == ({"a": 1}, False)
+    # A number at the cut may be incomplete ("3" of "30"), so it is dropped
+    assert recover_json('Sure:\n```json\n{"a": 1, "b": [2, 3') == ({"a": 1, "b": [2]}, True)
+
+
+def test_no_object_is_an_error():
+    with pytest.raises(ValueError):
+        extract_json("no json here")
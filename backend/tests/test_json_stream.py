@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from agents.dev_bot import DevBot
+from benchmarks.fake_gemini import create_app
+from core.cache import ProjectCache
+from core.json_stream import FilesArrayParser, extract_files
+
+FILES = [
+    {"name": "src/app.py", "content": 'print("hello {world}")\n'},
+    {"name": "src/data.json", "content": '{"key": "a \\"quoted\\" value", "list": [1, 2]}'},
+    {"name": "README.md", "content": "# Title\n\nSome text"},
+]
+
+
+def feed_all(parser: FilesArrayParser, chunks):
+    return [entry for chunk in chunks for entry in parser.feed(chunk)]
+
+
+def test_chunk_boundary_inside_a_string():
+    text = json.dumps({"files": FILES})
+    boundary = text.index("hello") + 2  # Splits "hello" across chunks
+    parser = FilesArrayParser()
+
+    first = parser.feed(text[:boundary])
+    rest = parser.feed(text[boundary:])
+
+    assert first == []
+    assert first + rest == FILES
+    assert parser.done
+
+
+def test_escaped_quotes_and_braces_in_contents():
+    text = json.dumps({"files": FILES})
+    parser = FilesArrayParser()
+
+    # One character at a time: every escape and brace lands on a chunk boundary
+    assert feed_all(parser, text) == FILES
+    assert parser.done and parser.entries_skipped == 0
+
+
+def test_truncated_stream_keeps_complete_entries():
+    text = json.dumps({"files": FILES})
+    cut = text.index("README.md")
+    parser = FilesArrayParser()
+
+    assert feed_all(parser, [text[:cut // 2], text[cut // 2:cut]]) == FILES[:2]
+    assert not parser.done
+
+
+def test_fenced_response_with_prose():
+    text = "Here is your project:\n```json\n" + json.dumps({"files": FILES}, indent=2) + "\n```\nEnjoy!"
+    parser = FilesArrayParser()
+
+    assert feed_all(parser, [text[i:i + 7] for i in range(0, len(text), 7)]) == FILES
+    assert parser.done
+
+
+def test_extract_files_reports_truncation():
+    text = json.dumps({"files": FILES})
+    cut = text[:text.index("README.md")]
+
+    assert extract_files(text) == (FILES, False)
+    assert extract_files("```json\n" + cut) == (FILES[:2], True)
+    # Not recoverable as a whole document: entries are salvaged one by one
+    broken = cut.replace('{"files": [', '{"files": [{"name": "bad.py", "content": oops}, ')
+    assert extract_files(broken) == (FILES[:2], True)
+
+
+def make_bot(tmp_path, **fake_options) -> DevBot:
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(latency_ms=0, **fake_options)))
+    return DevBot(api_key="test", client=client, project_cache=ProjectCache(str(tmp_path / "cache")))
+
+
+def test_streamed_generation_from_the_fake(tmp_path):
+    bot = make_bot(tmp_path, project_files=3)
+
+    async def scenario():
+        result = await bot.generate_project(["task"], "python", stream=True, use_cache=False)
+        return result, await bot.get_cached_project(["task"], "python")
+
+    result, cached = asyncio.run(scenario())
+    assert result["success"] and "truncated" not in result
+    assert sorted(result["files_created"]) == ["src/module_1.py", "src/module_2.py", "src/module_3.py"]
+    assert cached is not None
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_truncated_output_is_reported_and_not_cached(tmp_path, stream):
+    bot = make_bot(tmp_path, project_files=4, max_output_files=2)
+
+    async def scenario():
+        result = await bot.generate_project(["task"], "python", stream=stream, use_cache=False)
+        return result, await bot.get_cached_project(["task"], "python")
+
+    result, cached = asyncio.run(scenario())
+    assert result["success"] and result["truncated"]
+    assert 0 < len(result["files_created"]) < 4
+    assert cached is None
@@ -0,0 +1,72 @@
+import asyncio
+
+import mongomock
+import pytest
+from pymongo.errors import BulkWriteError
+
+from core.persistence import MongoStore
+
+
+def make_store(**kwargs) -> MongoStore:
+    return MongoStore(mongomock.MongoClient().db, **kwargs)
+
+
+def test_batch_is_written_once_full():
+    store = make_store(batch_size=3, flush_interval=60)
+
+    async def scenario():
+        writes = [store.insert_batched("docs", {"n": n}) for n in range(3)]
+        await asyncio.wait_for(asyncio.gather(*writes), timeout=5)
+        stats = store.stats()
+        await store.close()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert store.db["docs"].count_documents({}) == 3
+    assert (stats["batches"], stats["written"], stats["pending"]) == (1, 3, 0)
+
+
+def test_partial_batch_is_written_after_the_interval():
+    store = make_store(batch_size=100, flush_interval=0.05)
+
+    async def scenario():
+        store.insert_batched("docs", {"n": 1})
+        store.update_batched("docs", {"n": 1}, {"$set": {"seen": True}})
+        await asyncio.sleep(0)
+        before = store.db["docs"].count_documents({})
+        await asyncio.sleep(0.2)
+        await store.close()
+        return before
+
+    assert asyncio.run(scenario()) == 0
+    assert store.db["docs"].find_one({"n": 1})["seen"] is True
+    assert store.stats()["batches"] == 1
+
+
+def test_close_writes_what_is_pending():
+    store = make_store(batch_size=100, flush_interval=60)
+
+    async def scenario():
+        write = store.insert_batched("docs", {"n": 1})
+        await store.close()
+        return write.done()
+
+    assert asyncio.run(scenario())
+    assert store.db["docs"].count_documents({}) == 1
+
+
+def test_failed_batch_reaches_its_callers():
+    store = make_store(batch_size=2, flush_interval=60)
+    store.db["docs"].insert_one({"_id": "taken"})
+
+    async def scenario():
+        failed = store.insert_batched("docs", {"_id": "taken"})
+        unawaited = store.insert_batched("docs", {"_id": "other"})
+        with pytest.raises(BulkWriteError):
+            await asyncio.wait_for(failed, timeout=5)
+        await store.close()
+        return unawaited
+
+    unawaited = asyncio.run(scenario())
+    assert isinstance(unawaited.exception(), BulkWriteError)
+    assert store.stats()["failed"] == 2
@@ -0,0 +1,43 @@
+import asyncio
+import datetime
+
+import mongomock
+import pytest
+
+from core.persistence import MongoStore
+from core.projects import MissingBlobsError, ProjectRecords
+
+
+def make_records() -> ProjectRecords:
+    return ProjectRecords(MongoStore(mongomock.MongoClient().db, flush_interval=0))
+
+
+def test_save_analysis_refreshes_blobs_of_last_generation():
+    records = make_records()
+
+    async def scenario():
+        records.save_generation("p1", ["task"], {"a.py": "print(1)", "b.py": "print(2)"})
+        await records.store.flush()
+        stale = datetime.datetime.utcnow() - datetime.timedelta(days=20)
+        records.store.db["blobs"].update_many({}, {"$set": {"last_used_at": stale}})
+
+        await records.save_analysis("p1", "requirement", ["task"], {})
+        return await records.store.find("blobs", {}, {"last_used_at": 1})
+
+    blobs = asyncio.run(scenario())
+    assert len(blobs) == 2
+    assert all(blob["last_used_at"] > datetime.datetime.utcnow() - datetime.timedelta(minutes=1) for blob in blobs)
+
+
+def test_get_files_raises_when_blobs_are_missing():
+    records = make_records()
+
+    async def scenario():
+        records.save_generation("p1", ["task"], {"a.py": "print(1)", "b.py": "print(2)"})
+        assert await records.get_files("p1") == {"a.py": "print(1)", "b.py": "print(2)"}
+        records.store.db["blobs"].delete_one({})
+        await records.get_files("p1")
+
+    with pytest.raises(MissingBlobsError) as error:
+        asyncio.run(scenario())
+    assert len(error.value.paths) == 1
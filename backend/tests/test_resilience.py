@@ -0,0 +1,85 @@
+import asyncio
+
+import httpx
+import pytest
+
+from core.resilience import CircuitBreaker, CircuitOpenError, Resilience, RetryPolicy
+
+
+def make_resilience() -> Resilience:
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    return Resilience("test", breaker=breaker, policy=RetryPolicy(attempts=1))
+
+
+async def refuse() -> httpx.Response:
+    raise httpx.ConnectError("refused")
+
+
+async def hang() -> httpx.Response:
+    await asyncio.sleep(60)
+
+
+async def answer() -> httpx.Response:
+    return httpx.Response(200)
+
+
+def test_cancelled_trial_reopens_the_circuit():
+    resilience = make_resilience()
+
+    async def scenario():
+        with pytest.raises(httpx.ConnectError):
+            await resilience.call(refuse)
+        assert resilience.breaker.state == "open"
+        await asyncio.sleep(0.06)
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(resilience.call(hang), timeout=0.05)
+        # Not stuck half-open: calls fail fast until the next trial is due...
+        assert resilience.breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            await resilience.call(answer)
+        await asyncio.sleep(0.06)
+        # ...and that trial can close the circuit again
+        assert (await resilience.call(answer)).status_code == 200
+        assert resilience.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_trial_failing_with_other_error_reopens_the_circuit():
+    resilience = make_resilience()
+
+    async def broken() -> httpx.Response:
+        raise ValueError("bad request body")
+
+    async def scenario():
+        with pytest.raises(httpx.ConnectError):
+            await resilience.call(refuse)
+        await asyncio.sleep(0.06)
+        with pytest.raises(ValueError):
+            await resilience.call(broken)
+        assert resilience.breaker.state == "open"
+
+    asyncio.run(scenario())
+
+
+def test_deadline_bounds_all_attempts():
+    resilience = Resilience("test", breaker=CircuitBreaker("test", failure_threshold=10),
+                            policy=RetryPolicy(attempts=3, base_delay=0.01))
+    sent = []
+
+    async def slow() -> httpx.Response:
+        sent.append(1)
+        await asyncio.sleep(0.2)
+        raise httpx.ReadTimeout("read timed out")
+
+    async def scenario() -> float:
+        started = asyncio.get_running_loop().time()
+        with pytest.raises(httpx.ReadTimeout):
+            await resilience.call(slow, deadline=0.3)
+        return asyncio.get_running_loop().time() - started
+
+    elapsed = asyncio.run(scenario())
+    # The first read timeout is retried once, and that attempt is cut off at the deadline
+    assert len(sent) == 2
+    assert elapsed < 0.45
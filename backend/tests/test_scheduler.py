@@ -0,0 +1,131 @@
+import asyncio
+
+import httpx
+
+from core.scheduler import JobScheduler, QueueFullError, ScheduledService
+
+
+class Generator:
+    def __init__(self):
+        self.calls = 0
+
+    async def generate(self, name: str, progress=None):
+        self.calls += 1
+        for step in ("prompt_sent", "file_parsed", "file_parsed"):
+            if progress is not None:
+                progress(step, name=name)
+            await asyncio.sleep(0.01)
+        return f"project {name}"
+
+
+def test_every_caller_of_a_shared_job_gets_its_progress():
+    generator = Generator()
+
+    async def scenario():
+        scheduler = JobScheduler(workers=2, queue_size=4, name="test")
+        scheduler.start()
+        service = ScheduledService(generator, scheduler, ("generate",), keys={"generate": lambda name, **_: name},
+                                   broadcasts={"generate": "progress"})
+        leader_events, joiner_events = [], []
+        leader = service.generate("demo", progress=lambda stage, **data: leader_events.append(stage))
+        await asyncio.sleep(0.015)  # The joiner arrives mid-generation
+        joiner = service.generate("demo", progress=lambda stage, **data: joiner_events.append(stage))
+        results = await asyncio.gather(leader, joiner)
+        await scheduler.stop()
+        return results, leader_events, joiner_events
+
+    results, leader_events, joiner_events = asyncio.run(scenario())
+    assert results == ["project demo", "project demo"]
+    assert generator.calls == 1
+    # The joiner got the events it missed replayed, then the rest as they happened
+    assert leader_events == joiner_events == ["prompt_sent", "file_parsed", "file_parsed"]
+
+
+def test_full_queue_rejects_with_retry_after():
+    async def scenario():
+        scheduler = JobScheduler(workers=1, queue_size=1, name="test")
+        scheduler.start()
+        release = asyncio.Event()
+        running = scheduler.submit(release.wait)
+        await asyncio.sleep(0)  # The worker takes it; the queue is empty again
+        queued = scheduler.submit(release.wait)
+        try:
+            scheduler.submit(release.wait)
+        except QueueFullError as e:
+            error = e
+        release.set()
+        await asyncio.gather(running, queued)
+        stats = scheduler.stats()
+        await scheduler.stop()
+        return error, stats
+
+    error, stats = asyncio.run(scenario())
+    assert error.queue_depth == 1 and error.retry_after >= 1
+    assert stats["rejected"] == 1 and stats["completed"] == 2
+
+
+def test_admission_hook_rejects_before_queueing():
+    def over_quota():
+        raise RuntimeError("over quota")
+
+    async def scenario():
+        scheduler = JobScheduler(workers=1, queue_size=1, name="test", admit=over_quota)
+        scheduler.start()
+        try:
+            scheduler.submit(asyncio.sleep, 0)
+        except RuntimeError as e:
+            error = e
+        stats = scheduler.stats()
+        await scheduler.stop()
+        return error, stats
+
+    error, stats = asyncio.run(scenario())
+    assert str(error) == "over quota" and stats["queue_depth"] == 0
+
+
+def test_stop_fails_the_running_call_instead_of_hanging():
+    async def scenario():
+        scheduler = JobScheduler(workers=1, queue_size=1, name="test")
+        scheduler.start()
+        running = scheduler.submit(asyncio.Event().wait)
+        await asyncio.sleep(0)  # The worker takes it
+        await asyncio.wait_for(scheduler.stop(), timeout=5)
+        return await asyncio.gather(running, return_exceptions=True)
+
+    [error] = asyncio.run(scenario())
+    assert isinstance(error, RuntimeError)
+
+
+class BlockingDevBot:
+    def __init__(self):
+        self.release = asyncio.Event()
+
+    async def get_cached_project(self, tasks, project_type, progress=None):
+        return None
+
+    async def generate_project(self, tasks, project_type, **options):
+        await self.release.wait()
+        return {"success": False, "error": "stopped"}
+
+
+def test_generate_job_gets_503_with_retry_after_when_queue_is_full(app_module, monkeypatch):
+    async def scenario():
+        scheduler = JobScheduler(workers=1, queue_size=1, name="test")
+        scheduler.start()
+        dev_bot = BlockingDevBot()
+        monkeypatch.setitem(app_module.services, "dev_bot", ScheduledService(dev_bot, scheduler, ("generate_project",)))
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = []
+            for i in range(3):
+                responses.append(await client.post("/api/jobs/generate-code", json={"tasks": [f"task {i}"]}))
+                await asyncio.sleep(0.01)  # Let the worker pick up the running job
+        dev_bot.release.set()
+        await scheduler.stop()
+        return responses
+
+    accepted, queued, rejected = asyncio.run(scenario())
+    assert accepted.status_code == 202 and queued.status_code == 202
+    assert rejected.status_code == 503
+    assert int(rejected.headers["Retry-After"]) >= 1
+    assert rejected.json()["retryAfter"] == int(rejected.headers["Retry-After"])
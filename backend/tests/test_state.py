@@ -0,0 +1,26 @@
+import asyncio
+
+import mongomock
+
+from core.persistence import MongoStore
+from core.state import MongoState
+
+
+def test_mongo_record_is_written_after_its_events():
+    db = mongomock.MongoClient().db
+    # Two workers with their own stores; batches would only be flushed by the timer much later
+    writer = MongoState(MongoStore(db, flush_interval=60))
+    reader = MongoState(MongoStore(db, flush_interval=60))
+
+    async def scenario():
+        for seq in range(1, 4):
+            await writer.append("job_events", "job1", seq, {"seq": seq})
+        await writer.put("jobs", "job1", {"status": "succeeded", "events": 3})
+        record = await reader.get("jobs", "job1")
+        events = await reader.items("job_events", "job1")
+        await writer.close()
+        return record, events
+
+    record, events = asyncio.run(scenario())
+    assert record["events"] == 3
+    assert [event["seq"] for event in events] == [1, 2, 3]
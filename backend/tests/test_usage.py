@@ -0,0 +1,35 @@
+import hashlib
+
+import pytest
+
+from core import usage
+from core.usage import QuotaExceededError, UsageLedger, client_id
+
+
+def test_only_configured_clients_are_accounted_on_their_own():
+    key_id = "key:" + hashlib.sha256(b"team-key").hexdigest()[:12]
+    known = {key_id: 100, "team-a": 0}
+
+    assert client_id({b"x-api-key": b"team-key"}, known) == key_id
+    assert client_id({b"x-client-id": b"team-a"}, known) == "team-a"
+    # Unknown keys and ids, rotated or not, all land in the one shared client
+    assert client_id({b"x-api-key": b"other-key"}, known) == "anonymous"
+    assert client_id({b"x-client-id": b"fresh-id-1"}, known) == "anonymous"
+    assert client_id({}, known) == "anonymous"
+
+
+def test_anonymous_callers_share_one_quota():
+    ledger = UsageLedger(daily_quota=100, client_quotas={"team-a": 1000})
+    headers = [{b"x-client-id": f"rotated-{i}".encode()} for i in range(3)]
+
+    for header in headers[:2]:
+        token = usage.client_var.set(client_id(header, ledger.client_quotas))
+        try:
+            ledger.record({"promptTokenCount": 40, "candidatesTokenCount": 10})
+        finally:
+            usage.client_var.reset(token)
+
+    with pytest.raises(QuotaExceededError):
+        ledger.check(client_id(headers[2], ledger.client_quotas))
+    ledger.check("team-a")
+    assert set(ledger.stats()["clients"]) == {"anonymous"}
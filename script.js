@@ -3,6 +3,7 @@ const API_URL = ''; // Use relative paths for API calls
 const ENDPOINTS = {
     PROCESS_REQUIREMENT: `${API_URL}/api/process-requirement`,
     GENERATE_CODE: `${API_URL}/api/generate-code`,
+    GENERATE_CODE_JOB: `${API_URL}/api/jobs/generate-code`,
     PUSH_GITHUB: `${API_URL}/api/push-to-github`,
     UPDATE_GITHUB_TOKEN: `${API_URL}/api/update-github-token`
 };
@@ -33,6 +34,7 @@ const githubTokenInput = document.getElementById('githubTokenInput');
 
 // State management
 let currentTasks = [];
+let currentProjectId = null; // Server-side project the tasks and generated files belong to
 let currentLanguage = 'generic'; // Add variable to store detected language
 let sidebarCollapsed = false;
 let githubToken = localStorage.getItem('githubToken') || '';
@@ -197,6 +199,7 @@ submitBtn.addEventListener('click', async () => {
         }
 
         currentTasks = data.tasks;
+        currentProjectId = data.projectId || null;
         currentLanguage = data.techStack?.language || 'generic'; // Store the language
 
         // Hide loading indicator and display analysis
@@ -231,47 +234,34 @@ generateCodeBtn.addEventListener('click', async () => {
         generateCodeBtn.disabled = true;
         generateCodeBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Generating...'; // Use innerHTML for icon
 
-        const response = await fetch(ENDPOINTS.GENERATE_CODE, {
+        // Start a background generation job; progress arrives over Server-Sent Events
+        const response = await fetch(ENDPOINTS.GENERATE_CODE_JOB, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
             // Send tasks and the stored language as project_type
-            body: JSON.stringify({ tasks: currentTasks, project_type: currentLanguage })
+            body: JSON.stringify({ tasks: currentTasks, project_type: currentLanguage, projectId: currentProjectId })
         });
 
-        if (response.ok && response.headers.get('Content-Type')?.includes('application/zip')) {
-            // Success: Handle the ZIP file download
-            const blob = await response.blob();
-            const url = window.URL.createObjectURL(blob);
-            const a = document.createElement('a');
-            a.style.display = 'none';
-            a.href = url;
-            a.download = 'generated_project.zip'; // Fixed filename
-            document.body.appendChild(a);
-            a.click();
-            window.URL.revokeObjectURL(url);
-            a.remove();
-            pushGithubBtn.classList.remove('hidden'); // Show GitHub button on success
-        } else {
-            // Error: Try to parse JSON error message from backend
-            let errorMsg = 'Failed to generate project files. Unknown error.';
-            try {
-                const errorData = await response.json();
-                if (errorData && errorData.error) {
-                    errorMsg = errorData.error;
-                } else {
-                     errorMsg = `Server responded with status ${response.status}: ${response.statusText}`;
-                }
-            } catch (jsonError) {
-                 errorMsg = `Server responded with status ${response.status}. Failed to parse error message.`;
-                 console.error("Failed to parse error JSON:", jsonError);
-                 console.error("Response status:", response.status);
-                 console.error("Response status text:", response.statusText);
-            }
-            throw new Error(errorMsg); // Throw the extracted or generated error message
+        const job = await response.json();
+        if (!response.ok || !job.success) {
+            throw new Error(job.error || `Server responded with status ${response.status}: ${response.statusText}`);
         }
 
+        currentProjectId = job.projectId || currentProjectId;
+        const downloadUrl = await followGenerationJob(job.eventsUrl);
+
+        // Success: Handle the ZIP file download
+        const a = document.createElement('a');
+        a.style.display = 'none';
+        a.href = downloadUrl;
+        a.download = 'generated_project.zip'; // Fixed filename
+        document.body.appendChild(a);
+        a.click();
+        a.remove();
+        pushGithubBtn.classList.remove('hidden'); // Show GitHub button on success
+
     } catch (error) {
         // Use the specific alert message format
         alert('Error generating code: ' + error.message);
@@ -297,6 +287,7 @@ pushGithubBtn.addEventListener('click', async () => {
             },
             body: JSON.stringify({
                 repoName,
+                projectId: currentProjectId,
                 tasks: currentTasks
             })
         });
@@ -338,6 +329,38 @@ pushGithubBtn.addEventListener('click', async () => {
 });
 
 // Helper Functions
+function followGenerationJob(eventsUrl) {
+    // Resolves with the archive download URL once the job completes
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(eventsUrl);
+        const setStatus = (text) => {
+            generateCodeBtn.innerHTML = `<i class="fas fa-spinner fa-spin"></i> ${text}`;
+        };
+
+        source.addEventListener('prompt_sent', () => setStatus('Generating...'));
+        source.addEventListener('manifest_ready', (e) => setStatus(`Files 0/${JSON.parse(e.data).total}`));
+        source.addEventListener('file_parsed', (e) => {
+            const data = JSON.parse(e.data);
+            setStatus(data.total ? `Files ${data.parsed}/${data.total}` : `Files ${data.parsed}`);
+        });
+        source.addEventListener('archive_ready', () => setStatus('Preparing download...'));
+        source.addEventListener('complete', (e) => {
+            source.close();
+            resolve(JSON.parse(e.data).downloadUrl);
+        });
+        source.addEventListener('failed', (e) => {
+            source.close();
+            reject(new Error(JSON.parse(e.data).error || 'Failed to generate project files'));
+        });
+        source.onerror = () => {
+            // EventSource reconnects on its own while the stream is open; give up once it is closed
+            if (source.readyState === EventSource.CLOSED) {
+                reject(new Error('Lost connection to the generation job'));
+            }
+        };
+    });
+}
+
 function displayTasks(tasks) {
     developmentGoals.innerHTML = '';
     
@@ -357,9 +380,11 @@ function saveToHistory(requirement, tasks) {
     const historyItem = document.createElement('div');
     historyItem.className = 'history-item';
     historyItem.textContent = requirement.substring(0, 50) + '...';
+    const projectId = currentProjectId;
     historyItem.addEventListener('click', () => {
         requirementInput.value = requirement;
         currentTasks = tasks;
+        currentProjectId = projectId;
         displayTasks(tasks);
     });
     historyList.insertBefore(historyItem, historyList.firstChild);